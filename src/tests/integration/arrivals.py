@@ -0,0 +1,87 @@
+"""Arrival schedules of open-loop load tests"""
+from collections import namedtuple
+import random
+import sys
+
+
+# Arrival processes of open-loop load tests
+ARRIVALS = ('fixed', 'poisson')
+
+# Phase of an open-loop load test, whose rate ramps linearly from rate to
+# end_rate requests per second over duration seconds
+Phase = namedtuple('Phase', ['name', 'duration', 'rate', 'end_rate'])
+
+
+def build_phases(load_config, duration=None, rate=None):
+    """Build the phases of an open-loop load test from the load_test
+    section of the configuration file. A duration or rate argument replaces
+    the configured phases with a single steady phase.
+
+    :raises ValueError: if a phase has no positive duration or no rate which
+                        is at least 0
+    """
+
+    phases = load_config.get('phases')
+    if duration or rate or not phases:
+        rate = rate or load_config.get('rate')
+        if not rate:
+            sys.exit('Error: open-loop load tests need load_test.phases or a '
+                     'rate')
+        duration = duration or load_config.get('duration_seconds', 60)
+        phases = [Phase('steady', duration, rate, rate)]
+    else:
+        phases = [
+            Phase(phase.get('name', f'phase {index + 1}'),
+                  phase.get('duration_seconds'),
+                  phase.get('rate'),
+                  phase.get('end_rate', phase.get('rate')))
+            for index, phase in enumerate(phases)
+        ]
+    for phase in phases:
+        if not isinstance(phase.duration, (int, float)) or phase.duration <= 0:
+            raise ValueError(f'Phase {phase.name!r} needs a duration_seconds '
+                             f'greater than 0, got {phase.duration!r}')
+        for name, value in (('rate', phase.rate),
+                            ('end_rate', phase.end_rate)):
+            if not isinstance(value, (int, float)) or value < 0:
+                raise ValueError(f'Phase {phase.name!r} needs a {name} of at '
+                                 f'least 0, got {value!r}')
+    return phases
+
+
+def arrival_times(phases, arrival='fixed', rng=None):
+    """Generate the intended send times of an open-loop load test
+
+    :param phases: list of Phase
+    :param arrival: 'fixed' spaces requests evenly, 'poisson' draws
+                    exponential intervals, as independent clients do
+    :param rng: random.Random instance of poisson arrivals
+    :returns: A generator of tuples of seconds since the start and phase name
+    """
+
+    rng = rng or random.Random()
+    offset = 0
+    for phase in phases:
+        elapsed = 0
+        while True:
+            rate = phase.rate + (
+                (phase.end_rate - phase.rate) * elapsed / phase.duration
+            )
+            if rate <= 0:
+                # Nothing is sent until a ramp leaves zero
+                elapsed += 0.01
+            elif arrival == 'poisson':
+                elapsed += rng.expovariate(rate)
+            else:
+                elapsed += 1 / rate
+            if elapsed >= phase.duration:
+                break
+            if rate > 0:
+                yield offset + elapsed, phase.name
+        offset += phase.duration
+
+
+def describe_phase(phase):
+    rates = (f'{phase.rate}' if phase.end_rate == phase.rate
+             else f'{phase.rate}-{phase.end_rate}')
+    return f'{phase.name} {phase.duration}s at {rates} req/s'
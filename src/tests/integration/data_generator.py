@@ -0,0 +1,162 @@
+"""Generate data which conforms to OpenAPI schemas"""
+import datetime
+import random
+import re
+import string
+
+import schema_compiler
+
+
+# Characters matched by the character classes used in the specification
+CHARACTER_CLASSES = {
+    r'\d': string.digits,
+    r'\w': string.ascii_letters + string.digits + '_',
+    '.': string.ascii_letters + string.digits
+}
+
+PATTERN_TOKEN = re.compile(
+    r'(?P<atom>\\[dw]|\[[^\]]+\]|\\.|[^\\\[{+*?])'
+    r'(?P<quantifier>\{\d+(?:,\d*)?\}|[+*?])?'
+)
+
+
+def _character_class(atom):
+    """Expand a pattern atom into the characters it matches"""
+
+    if atom in CHARACTER_CLASSES:
+        return CHARACTER_CLASSES[atom]
+    if atom.startswith('['):
+        characters = []
+        body = atom[1:-1]
+        for start, end in re.findall(r'(.)(?:-(.))?', body):
+            if end:
+                characters.extend(
+                    chr(code) for code in range(ord(start), ord(end) + 1)
+                )
+            else:
+                characters.append(start)
+        return ''.join(characters)
+    return atom[-1]
+
+
+def generate_from_pattern(pattern, rng):
+    """Generate a string matching a simple regular expression made of
+    literals, character classes and quantifiers"""
+
+    pattern = pattern.lstrip('^').rstrip('$')
+    result = []
+    for match in PATTERN_TOKEN.finditer(pattern):
+        characters = _character_class(match.group('atom'))
+        quantifier = match.group('quantifier')
+        if quantifier is None:
+            low, high = 1, 1
+        elif quantifier == '+':
+            low, high = 1, 5
+        elif quantifier == '*':
+            low, high = 0, 5
+        elif quantifier == '?':
+            low, high = 0, 1
+        else:
+            bounds = quantifier[1:-1].split(',')
+            low = int(bounds[0])
+            high = int(bounds[1]) if len(bounds) > 1 and bounds[1] else (
+                low if len(bounds) == 1 else low + 5
+            )
+        result.extend(
+            rng.choice(characters) for _ in range(rng.randint(low, high))
+        )
+    return ''.join(result)
+
+
+class DataGenerator:
+    """Generate values for OpenAPI schemas
+
+    :param openapi: parsed OpenAPI specification
+    :param rng: random.Random instance (default: unseeded)
+    :param null_rate: probability of generating null for nullable fields
+    :param max_items: maximum number of items of generated arrays
+    """
+
+    def __init__(self, openapi, rng=None, null_rate=0, max_items=3):
+        self.compiler = schema_compiler.SchemaCompiler(openapi)
+        self.rng = random.Random() if rng is None else rng
+        self.null_rate = null_rate
+        self.max_items = max_items
+
+    def component(self, name):
+        """Generate a value of a component schema"""
+
+        return self.generate({'$ref': f'#/components/schemas/{name}'})
+
+    def date(self):
+        start = datetime.date(1970, 1, 1)
+        return start + datetime.timedelta(days=self.rng.randint(0, 20000))
+
+    def string(self, schema):
+        """Generate a string matching the enum, pattern or format of a
+        schema"""
+
+        formatting = schema.get('format')
+        if 'enum' in schema:
+            # YAML 1.1 loads enum members such as ON as booleans
+            return self.rng.choice([
+                value for value in schema['enum'] if isinstance(value, str)
+            ])
+        if 'pattern' in schema:
+            return generate_from_pattern(schema['pattern'], self.rng)
+        if formatting == 'date':
+            return self.date().isoformat()
+        if formatting == 'date-time':
+            time = datetime.time(self.rng.randint(0, 23),
+                                 self.rng.randint(0, 59),
+                                 self.rng.randint(0, 59))
+            return f'{self.date().isoformat()}T{time.isoformat()}Z'
+        if formatting == 'email':
+            return f'{self.word(8)}@example.com'
+        if formatting in ['uri', 'url']:
+            return f'https://example.com/{self.word(8)}'
+        if 'example' in schema:
+            return str(schema['example'])
+        return self.word(schema.get('maxLength', 10))
+
+    def word(self, length):
+        return ''.join(
+            self.rng.choice(string.ascii_lowercase)
+            for _ in range(max(length, 1))
+        )
+
+    def number(self, schema):
+        low = schema.get('minimum', 0)
+        high = schema.get('maximum', 1000)
+        if schema['type'] == 'integer' or schema.get('format') in [
+            'integer', 'int32', 'int64'
+        ]:
+            return self.rng.randint(low, high)
+        return round(self.rng.uniform(low, high), 2)
+
+    def generate(self, schema):
+        """Generate a value of a schema, resolving references as needed"""
+
+        schema = self.compiler.resolve(schema)
+        if schema.get('nullable') and self.rng.random() < self.null_rate:
+            return None
+
+        schema_type = schema.get('type')
+        if 'properties' in schema or schema_type == 'object':
+            return {
+                name: self.generate(property_schema)
+                for name, property_schema in schema.get('properties',
+                                                        {}).items()
+                if property_schema.get('type')
+                or set(property_schema) & {'$ref', 'allOf', 'properties'}
+            }
+        if schema_type == 'array':
+            return [
+                self.generate(schema['items'])
+                for _ in range(self.rng.randint(0, self.max_items))
+            ]
+        if schema_type in ['integer', 'number']:
+            return self.number(schema)
+        if schema_type == 'boolean':
+            return self.rng.choice([True, False])
+        return self.string(schema)
@@ -0,0 +1,125 @@
+"""Append-only JSON Lines log of every request, written by a background
+thread"""
+import json
+import os
+import queue
+import threading
+import time
+
+
+# Maximum length of logged validation errors
+MAX_ERROR_LENGTH = 500
+
+
+def body_size(response, streamed):
+    """Size of a response body in bytes, None if it is unknown"""
+
+    if not streamed:
+        return len(response.content)
+    raw = getattr(response.raw, 'tell', None)
+    if raw is not None:
+        return raw()
+    length = response.headers.get('Content-Length')
+    return int(length) if length else None
+
+
+def request_event(method, template, endpoint, params, response, phases,
+                  size):
+    """Build the record of a request, without its validation outcome"""
+
+    return {
+        'time': round(time.time(), 6),
+        'method': method,
+        'template': template,
+        'endpoint': endpoint,
+        'params': params or None,
+        'status': response.status_code,
+        'cached': getattr(response, 'from_cache', False),
+        'phases': {
+            phase: round(seconds, 6) for phase, seconds in phases.items()
+        } if phases else None,
+        'bytes': size,
+        'validation': None
+    }
+
+
+class EventLog:
+    """Append request records to a JSON Lines file from a background
+    thread, so requests only pay for putting a dict in a queue. Every
+    batch is appended with a single write, so the processes of sharded
+    runs can share a file. The writer waits in queue.Queue rather than
+    SimpleQueue, so the profiler counts the wait as idle.
+
+    :param path: path of the file, appended to if it exists
+    :param batch_size: records written at most per write
+    :param shard: index of the shard of the process, added to its records
+                  (default: None, not sharded)
+    """
+
+    def __init__(self, path, batch_size=1000, shard=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.shard = shard
+        self.queue = queue.Queue()
+        self.closed = object()
+        self.count = 0
+        self.descriptor = os.open(path,
+                                  os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                                  0o644)
+        self.thread = threading.Thread(target=self.__run, daemon=True,
+                                       name='EventLog')
+        self.thread.start()
+
+    def emit(self, event, validated=False, error=None):
+        """Queue the record of a request
+
+        :param event: dict built by request_event
+        :param validated: whether the response was validated
+        :param error: validation error of the response, if it failed
+        """
+
+        if validated:
+            event['validation'] = 'passed' if error is None else 'failed'
+        if error is not None:
+            event['error'] = str(error)[:MAX_ERROR_LENGTH]
+        if self.shard is not None:
+            event['shard'] = self.shard
+        self.queue.put(event)
+
+    def __run(self):
+        done = False
+        while not done:
+            batch = []
+            event = self.queue.get()
+            while True:
+                if event is self.closed:
+                    done = True
+                    break
+                batch.append(event)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    event = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self.__write(batch)
+
+    def __write(self, batch):
+        data = ''.join(
+            json.dumps(event, separators=(',', ':')) + '\n' for event in batch
+        ).encode()
+        while data:
+            written = os.write(self.descriptor, data)
+            data = data[written:]
+        self.count += len(batch)
+
+    def close(self):
+        """Write the queued records and close the file"""
+
+        self.queue.put(self.closed)
+        self.thread.join()
+        os.close(self.descriptor)
+
+    def summary(self):
+        return f'Event log: {self.count} request(s) appended to {self.path}'
@@ -0,0 +1,313 @@
+"""Fuzz the filter parameters of the OpenAPI specification with values
+derived from their schemas"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import heapq
+import logging
+import random
+import time
+
+import requests
+
+import data_generator
+import format_validators
+import query_matrix
+import sweep
+
+
+# Values which are not date-times, e.g. the DD-MON-YYYY dates of Banner
+INVALID_DATE_TIMES = ('1995-MAY-05', '2020-01-01', '2020-13-01T00:00:00Z',
+                      '2020-01-01T25:00:00Z')
+# Values which are not booleans, as Python and other clients may send them
+INVALID_BOOLEANS = ('True', 'yes', '1')
+INVALID_NUMBERS = ('five', '1.2.3', '0x10')
+# Slowest checks listed in the report
+SLOWEST = 10
+
+
+def _unique(values):
+    """String values without duplicates, in their original order"""
+
+    return list(dict.fromkeys(str(value) for value in values))
+
+
+class FilterValues:
+    """Derive valid and invalid values of query parameters from the type,
+    enum, pattern, format and bounds of their schemas
+
+    :param openapi: parsed OpenAPI specification
+    :param rng: random.Random instance the values are drawn with
+    :param max_values: valid and invalid values derived at most for a
+                       parameter
+    """
+
+    def __init__(self, openapi, rng, max_values=4):
+        self.rng = rng
+        self.generator = data_generator.DataGenerator(openapi, rng=rng)
+        self.max_values = max_values
+
+    def valid(self, schema):
+        """Values of a schema the API must accept"""
+
+        schema_type = schema.get('type')
+        if schema_type == 'array':
+            values = self.valid(schema['items'])
+            # Form style arrays are sent comma separated
+            if len(values) > 1:
+                values.append(','.join(values[:2]))
+            return values
+        if schema_type == 'boolean':
+            return ['true', 'false']
+        if schema_type in ['integer', 'number']:
+            values = [schema[bound] for bound in ['minimum', 'maximum']
+                      if bound in schema]
+            if 'minimum' not in schema:
+                values.append(-self.generator.number(schema))
+            values.extend(self.generator.number(schema)
+                          for _ in range(self.max_values))
+        elif 'enum' in schema:
+            # YAML 1.1 loads enum members such as ON as booleans
+            members = [value for value in schema['enum']
+                       if isinstance(value, str)]
+            values = self.rng.sample(members,
+                                     min(self.max_values, len(members)))
+        else:
+            values = [self.generator.string(schema)
+                      for _ in range(self.max_values)]
+        return _unique(values)[:self.max_values]
+
+    def invalid(self, schema):
+        """Values of a schema the API must reject, none for strings which
+        are not constrained"""
+
+        schema_type = schema.get('type')
+        if schema_type == 'array':
+            valid = self.valid(schema['items'])[0]
+            return [f'{valid},{value}'
+                    for value in self.invalid(schema['items'])]
+        if schema_type == 'boolean':
+            values = list(INVALID_BOOLEANS)
+        elif schema_type in ['integer', 'number']:
+            values = []
+            if 'minimum' in schema:
+                values.append(schema['minimum'] - 1)
+            if 'maximum' in schema:
+                values.append(schema['maximum'] + 1)
+            if schema_type == 'integer':
+                values.append('1.5')
+            values.extend(INVALID_NUMBERS)
+        elif 'enum' in schema:
+            members = {str(value) for value in schema['enum']}
+            values = [member.lower() for member in sorted(members)
+                      if member.lower() not in members][:1]
+            values.append(self.__word_not_in(members))
+        elif 'pattern' in schema:
+            pattern = format_validators.registry.compile(schema['pattern'])
+            values = [
+                value for value in ['!', self.generator.word(12).upper(),
+                                    f'{self.generator.string(schema)}!']
+                if not pattern.search(value)
+            ]
+        elif schema.get('format') == 'date-time':
+            values = list(INVALID_DATE_TIMES)
+        elif 'maxLength' in schema:
+            values = ['x' * (schema['maxLength'] + 1)]
+        else:
+            values = []
+        return _unique(values)[:self.max_values]
+
+    def __word_not_in(self, members):
+        length = max(len(member) for member in members)
+        while True:
+            word = self.generator.word(length).upper()
+            if word not in members:
+                return word
+
+
+class FilterFuzzer:
+    """Check the filter parameters of person endpoints with values derived
+    from their schemas, expecting 200 OK for valid values and 400 Bad
+    Request for invalid ones. Values are drawn in rounds, each from
+    generators seeded by the seed, round and parameter, so a seed always
+    requests the same values. Valid values are combined as set by the query
+    matrix of the checker.
+
+    :param checker: UtilsTestCase instance used to check endpoints
+    :param osu_id: person whose endpoints are requested
+    :param endpoints: names of sweep.ENDPOINTS to fuzz, those without
+                      filter parameters are left out
+    :param seed: seed of the values
+    :param max_values: valid and invalid values per parameter and round
+    :param workers: number of checks sent concurrently
+    """
+
+    def __init__(self, checker, osu_id, endpoints=tuple(sweep.ENDPOINTS),
+                 seed=0, max_values=4, workers=1):
+        self.checker = checker
+        self.osu_id = osu_id
+        self.seed = seed
+        self.max_values = max_values
+        self.workers = workers
+        self.endpoints = {}
+        for name in endpoints:
+            suffix, resource, max_elapsed_seconds = sweep.ENDPOINTS[name]
+            template = f'/persons/{{osuId}}{suffix}'
+            operation = checker.openapi['paths'][template]['get']
+            parameters = [
+                (parameter['name'], parameter['schema'])
+                for parameter in operation.get('parameters', [])
+                if parameter['in'] == 'query'
+                and parameter['name'].startswith('filter[')
+            ]
+            if resource and parameters:
+                self.endpoints[name] = (suffix, resource, max_elapsed_seconds,
+                                        parameters)
+        self.checked = 0
+        self.failures = []
+        self.slowest = []
+        self.seen = set()
+
+    def query_params(self, name, round_index):
+        """Valid and invalid values of the filters of an endpoint in a round,
+        like a query_params section of the configuration file"""
+
+        query_params = {}
+        for parameter, schema in self.endpoints[name][3]:
+            rng = random.Random(f'{self.seed}:{round_index}:{name}:'
+                                f'{parameter}')
+            values = FilterValues(self.checker.openapi, rng, self.max_values)
+            query_params[parameter] = {'valid': values.valid(schema),
+                                       'invalid': values.invalid(schema)}
+        return query_params
+
+    def cases(self, round_index):
+        """Checks of a round not requested in an earlier round
+
+        :returns: A generator of dicts of keyword arguments of
+                  check_endpoint
+        """
+
+        for name, (suffix, resource, max_elapsed_seconds,
+                   _) in self.endpoints.items():
+            endpoint = f'/persons/{self.osu_id}{suffix}'
+            query_params = self.query_params(name, round_index)
+            for params, response_code in self.checker.matrix.expand(
+                query_params
+            ):
+                key = (endpoint, query_matrix.canonical(params))
+                if key in self.seen:
+                    continue
+                self.seen.add(key)
+                yield {
+                    'endpoint': endpoint,
+                    'resource': (resource if response_code == 200
+                                 else 'ErrorObject'),
+                    'response_code': response_code,
+                    'query_params': params,
+                    'max_elapsed_seconds': max_elapsed_seconds
+                }
+
+    def check(self, case):
+        """Check a case
+
+        :returns: A tuple of the case, the seconds the API took to respond
+                  or None and the error or None
+        """
+
+        try:
+            response = self.checker.check_endpoint(**case)
+            return case, response.elapsed.total_seconds(), None
+        except (
+            self.checker.failureException,
+            requests.exceptions.RequestException
+        ) as error:
+            return case, None, error
+
+    def __collect(self, pending, return_when=FIRST_COMPLETED):
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            pending.remove(future)
+            case, elapsed, error = future.result()
+            self.checked += 1
+            if error is not None:
+                self.failures.append({
+                    'endpoint': case['endpoint'],
+                    'params': case['query_params'],
+                    'expected': case['response_code'],
+                    'error': str(error).splitlines()[0]
+                })
+            elif case['response_code'] == 200:
+                # Only successful responses, rejections are returned early.
+                # The count breaks ties, parameters are not comparable
+                heapq.heappush(self.slowest, (elapsed, self.checked,
+                                              case['endpoint'],
+                                              case['query_params']))
+                if len(self.slowest) > SLOWEST:
+                    heapq.heappop(self.slowest)
+
+    def run(self, rounds=3, duration=None):
+        """Check the cases of the rounds until they are exhausted or the
+        duration has passed, when later cases are left out
+
+        :returns: Whether every round was checked
+        """
+
+        deadline = None if duration is None else time.monotonic() + duration
+        pending = set()
+        completed = True
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for round_index in range(rounds):
+                for case in self.cases(round_index):
+                    if deadline is not None and time.monotonic() >= deadline:
+                        completed = False
+                        break
+                    while len(pending) >= self.workers * 2:
+                        self.__collect(pending)
+                    pending.add(executor.submit(self.check, case))
+                if not completed:
+                    logging.warning(f'Fuzzing stopped after {duration} '
+                                    f'second(s) in round {round_index + 1} '
+                                    f'of {rounds}')
+                    break
+            while pending:
+                self.__collect(pending)
+        return completed
+
+    def format_report(self):
+        """Human readable report of the failures and slowest checks"""
+
+        lines = [f'Filter fuzzing: {self.checked} check(s) of '
+                 f'{", ".join(self.endpoints)}, {len(self.failures)} '
+                 'failure(s)']
+        for failure in self.failures:
+            lines.append(f'  {failure["endpoint"]} {failure["params"]} '
+                         f'expected {failure["expected"]}: '
+                         f'{failure["error"]}')
+        if self.slowest:
+            lines.append('Slowest checks:')
+            for elapsed, _, endpoint, params in sorted(self.slowest,
+                                                       reverse=True):
+                lines.append(f'  {elapsed:.3f}s {endpoint} {params}')
+        return '\n'.join(lines)
+
+
+def run_filter_fuzz(checker, seed=None, duration=None):
+    """Fuzz the filters from the filter_fuzz section of the configuration
+    file of a checker. Arguments override the configured values.
+
+    :returns: Whether every check passed
+    """
+
+    fuzz_config = checker.config.get('filter_fuzz', {})
+    fuzzer = FilterFuzzer(
+        checker,
+        fuzz_config.get('osu_id', checker.config['query_params']['osu_id']),
+        endpoints=fuzz_config.get('endpoints', sweep.ENDPOINTS),
+        seed=fuzz_config.get('seed', 0) if seed is None else seed,
+        max_values=fuzz_config.get('max_values', 4),
+        workers=checker.workers
+    )
+    if duration is None:
+        duration = fuzz_config.get('duration_seconds', 60)
+    fuzzer.run(rounds=fuzz_config.get('rounds', 3), duration=duration)
+    print(fuzzer.format_report())
+    return not fuzzer.failures
@@ -0,0 +1,61 @@
+"""Compiled patterns and memoised format checks of OpenAPI attributes"""
+from collections.abc import Mapping
+import functools
+import re
+
+import validators
+
+
+# Formats which are checked and their validators
+FORMAT_CHECKERS = {
+    'uri': validators.url,
+    'url': validators.url,
+    'email': validators.email
+}
+
+
+class FormatRegistry:
+    """Compile each pattern of a specification once and cache the results
+    of format checks, which are often repeated for the same values
+
+    :param cache_size: number of format check results to keep
+    """
+
+    def __init__(self, cache_size=65536):
+        self.patterns = {}
+        self.check = functools.lru_cache(maxsize=cache_size)(self.__check)
+
+    def compile(self, pattern):
+        """Get the compiled regular expression of a pattern"""
+
+        compiled = self.patterns.get(pattern)
+        if compiled is None:
+            compiled = self.patterns[pattern] = re.compile(pattern)
+        return compiled
+
+    def compile_all(self, openapi):
+        """Compile every pattern of a specification"""
+
+        if isinstance(openapi, Mapping):
+            for key, value in openapi.items():
+                if key == 'pattern' and isinstance(value, str):
+                    self.compile(value)
+                else:
+                    self.compile_all(value)
+        elif isinstance(openapi, (list, tuple)):
+            for value in openapi:
+                self.compile_all(value)
+
+    @staticmethod
+    def is_checked(formatting):
+        return formatting in FORMAT_CHECKERS
+
+    @staticmethod
+    def __check(formatting, value):
+        """Whether a value is valid for a format"""
+
+        return bool(FORMAT_CHECKERS[formatting](value))
+
+
+# Registry shared by the tests, the schema compiler and the mock API
+registry = FormatRegistry()
@@ -0,0 +1,117 @@
+"""Transport adapter sending requests over HTTP/2 with httpx"""
+import datetime
+import time
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+import timing
+
+
+class StreamedBody:
+    """Raw body of a response streamed from httpx, which requests reads
+    through stream() in iter_content()
+
+    :param httpx: the httpx module
+    :param httpx_response: httpx response sent with stream=True
+    """
+
+    def __init__(self, httpx, httpx_response):
+        self.httpx = httpx
+        self.httpx_response = httpx_response
+
+    def stream(self, chunk_size, decode_content=True):
+        """Generate the decoded chunks of the body, closing the response once
+        it is read"""
+
+        try:
+            yield from self.httpx_response.iter_bytes(chunk_size)
+        except self.httpx.TimeoutException as error:
+            raise requests.exceptions.ConnectionError(error)
+        except self.httpx.TransportError as error:
+            raise requests.exceptions.ChunkedEncodingError(error)
+        finally:
+            self.httpx_response.close()
+
+    def tell(self):
+        """Bytes of the body received so far, before decoding"""
+
+        return self.httpx_response.num_bytes_downloaded
+
+    def close(self):
+        self.httpx_response.close()
+
+
+class HTTP2Adapter(BaseAdapter):
+    """Send requests through an httpx client with HTTP/2 enabled. Requests
+    to the same host are multiplexed over one connection, so no connect or
+    TLS phases are recorded and only requests are counted in
+    timing.connection_stats. Bodies of streamed requests are read from
+    httpx as they are consumed, others are read up front.
+
+    :param verify: whether to verify TLS certificates, or a CA bundle path
+    :param max_connections: maximum number of connections of the client
+    :param keep_alive: whether to keep connections open between requests
+    """
+
+    def __init__(self, verify=True, max_connections=10, keep_alive=True):
+        super().__init__()
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError('HTTP/2 requires httpx, install it with '
+                              "pip install 'httpx[http2]'")
+        self.httpx = httpx
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections if keep_alive else 0
+        )
+        self.client = httpx.Client(http2=True, verify=verify, limits=limits)
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        timing.connection_stats.add('requests')
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+            timeout = self.httpx.Timeout(None, connect=connect_timeout,
+                                         read=read_timeout)
+        start = time.perf_counter()
+        try:
+            httpx_request = self.client.build_request(
+                request.method,
+                request.url,
+                headers=dict(request.headers),
+                content=request.body,
+                timeout=timeout
+            )
+            httpx_response = self.client.send(httpx_request, stream=True)
+        except self.httpx.TimeoutException as error:
+            raise requests.exceptions.Timeout(error, request=request)
+        except self.httpx.TransportError as error:
+            raise requests.exceptions.ConnectionError(error, request=request)
+        elapsed = time.perf_counter() - start
+
+        response = requests.Response()
+        response.status_code = httpx_response.status_code
+        response.headers = CaseInsensitiveDict(httpx_response.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.reason = httpx_response.reason_phrase
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.elapsed = datetime.timedelta(seconds=elapsed)
+        if stream:
+            response.raw = StreamedBody(self.httpx, httpx_response)
+            return response
+        # The body is read up front, iter_content() then slices it
+        try:
+            response._content = httpx_response.read()
+        finally:
+            httpx_response.close()
+        response._content_consumed = True
+        return response
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,171 @@
+"""Streaming checks of JPEG images which only parse their headers"""
+from collections import defaultdict
+import threading
+
+import timing
+
+
+# Start of frame markers, which hold the dimensions of the image. 0xC4
+# (Huffman tables), 0xC8 (reserved) and 0xCC (arithmetic coding) are not.
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Markers without a length field
+STANDALONE_MARKERS = frozenset(range(0xD0, 0xD8)) | {0x01}
+
+
+class ImageError(ValueError):
+    """The image is not a well-formed JPEG"""
+
+
+def frame_header_offset(data):
+    """Find the start of frame marker of a JPEG, which holds its dimensions
+
+    :param data: bytes from the start of the image
+    :returns: The offset of the marker, or None if data ends before it
+    :raises ImageError: if data is not a JPEG
+    """
+
+    if len(data) < 2:
+        return None
+    if data[:2] != b'\xff\xd8':
+        raise ImageError('Missing JPEG start of image marker')
+
+    offset = 2
+    while True:
+        # Markers may be preceded by any number of fill bytes
+        while data[offset:offset + 2] == b'\xff\xff':
+            offset += 1
+        if offset + 4 > len(data):
+            return None
+        if data[offset] != 0xFF:
+            raise ImageError(f'Invalid JPEG marker at byte {offset}')
+
+        marker = data[offset + 1]
+        if marker in STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            raise ImageError('No JPEG frame header before the image data')
+        if marker in SOF_MARKERS:
+            return offset
+        offset += 2 + int.from_bytes(data[offset + 2:offset + 4], 'big')
+
+
+def jpeg_dimensions(data):
+    """Read the dimensions of a JPEG from its first bytes
+
+    :param data: bytes from the start of the image
+    :returns: A tuple of width and height, or None if data ends before the
+              frame header
+    :raises ImageError: if data is not a JPEG
+    """
+
+    offset = frame_header_offset(data)
+    if offset is None or offset + 9 > len(data):
+        return None
+    height = int.from_bytes(data[offset + 5:offset + 7], 'big')
+    width = int.from_bytes(data[offset + 7:offset + 9], 'big')
+    return width, height
+
+
+class ImageProbe:
+    """Check a JPEG fed chunk by chunk, keeping only its header in memory
+
+    :param max_header_bytes: bytes to read at most before the frame header
+    """
+
+    def __init__(self, max_header_bytes=262144):
+        self.max_header_bytes = max_header_bytes
+        self.header = b''
+        self.dimensions = None
+        self.size = 0
+        self.tail = b''
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+        self.tail = (self.tail + chunk)[-2:]
+        if self.dimensions is None:
+            self.header += chunk
+            self.dimensions = jpeg_dimensions(self.header)
+            if self.dimensions is not None:
+                self.header = b''
+            elif len(self.header) > self.max_header_bytes:
+                raise ImageError(f'No JPEG frame header in the first '
+                                 f'{self.max_header_bytes} bytes')
+
+    def finish(self):
+        """Check that the image was complete
+
+        :returns: A tuple of width and height
+        """
+
+        if self.dimensions is None:
+            raise ImageError(f'Image ended after {self.size} bytes, before '
+                             'its frame header')
+        if self.tail != b'\xff\xd9':
+            raise ImageError('Missing JPEG end of image marker, the image '
+                             'is truncated')
+        return self.dimensions
+
+
+class ImageStats:
+    """Thread-safe time to first byte, transfer rate and size of images by
+    requested width"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ttfb = defaultdict(timing.LatencyHistogram)
+        self.rate = defaultdict(timing.LatencyHistogram)
+        self.bytes = defaultdict(int)
+
+    def record(self, width, ttfb, rate, size):
+        key = str(width or '-')
+        with self.lock:
+            self.ttfb[key].add(ttfb)
+            self.rate[key].add(rate)
+            self.bytes[key] += size
+
+    def merge(self, other):
+        with self.lock:
+            for key, histogram in other.ttfb.items():
+                self.ttfb[key].merge(histogram)
+                self.rate[key].merge(other.rate[key])
+                self.bytes[key] += other.bytes[key]
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                key: {
+                    'ttfb': self.ttfb[key].to_dict(),
+                    'rate': self.rate[key].to_dict(),
+                    'bytes': self.bytes[key]
+                }
+                for key in sorted(self.ttfb)
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for key, values in data.items():
+            stats.ttfb[key] = timing.LatencyHistogram.from_dict(values['ttfb'])
+            stats.rate[key] = timing.LatencyHistogram.from_dict(values['rate'])
+            stats.bytes[key] = values['bytes']
+        return stats
+
+    def format_summary(self):
+        """Human readable summary table, None if no image was checked"""
+
+        with self.lock:
+            if not self.ttfb:
+                return None
+            header = (f'{"image width":<12} {"images":>7} {"ttfb p50":>9} '
+                      f'{"ttfb p95":>9} {"KB/s p50":>10} {"avg KB":>8}')
+            lines = [header, '-' * len(header)]
+            for key in sorted(self.ttfb, key=lambda key: (len(key), key)):
+                ttfb = self.ttfb[key]
+                lines.append(
+                    f'{key:<12} {ttfb.count:>7} '
+                    f'{ttfb.percentile(50):>9.3f} {ttfb.percentile(95):>9.3f} '
+                    f'{self.rate[key].percentile(50) / 1024:>10.1f} '
+                    f'{self.bytes[key] / ttfb.count / 1024:>8.1f}'
+                )
+        return '\n'.join(lines)
@@ -1,31 +1,74 @@
 """Integration tests"""
 import json
 import logging
+import sys
 import unittest
-import yaml
 
+import event_log
+import filter_fuzz
+import format_validators
+import image_check
+import load_test
+import openapi_model
+import parallel_runner
+import person_profile
+import profiler
+import query_matrix
+import replay
+import response_cache
+import schema_compiler
+import sweep
+import timing
 import utils
+import validation_policy
+import write_benchmark
 
 
 class IntegrationTests(utils.UtilsTestCase):
     """Integration tests class"""
 
     @classmethod
-    def setup(cls, config_path, openapi_path):
+    def setup(cls, config_path, openapi_path, workers=None, policy=None,
+              matrix_mode=None, cache_mode=None, event_log_path=None):
         """Performs basic setup"""
 
         with open(config_path) as config_file:
             config = json.load(config_file)
+            cls.config = config
             cls.base_url = utils.setup_base_url(config)
-            cls.session = utils.setup_session(config)
+            cls.workers = utils.setup_workers(config, workers)
+            cls.session = utils.setup_session(config,
+                                              pool_maxsize=cls.workers)
             cls.test_cases = config['test_cases']
             cls.local_test = config['local_test']
+            cls.stream_responses = config.get('stream_responses', False)
+            cls.validation = validation_policy.ValidationPolicy.from_config(
+                config, policy
+            )
             cls.query_params = config['query_params']
-
-        with open(openapi_path) as openapi_file:
-            openapi = yaml.load(openapi_file, Loader=yaml.SafeLoader)
-
+            cls.matrix = query_matrix.QueryMatrix.from_config(config,
+                                                              matrix_mode)
+            cls.check_cache = query_matrix.CheckCache()
+            cls.response_cache = response_cache.ResponseCache.from_config(
+                config, cache_mode
+            )
+            event_log_config = dict(config.get('event_log', {}))
+            configured_path = event_log_config.pop('path', None)
+            event_log_path = event_log_path or configured_path
+            if event_log_path:
+                cls.event_log = event_log.EventLog(event_log_path,
+                                                   **event_log_config)
+
+        openapi = openapi_model.load_model(
+            openapi_path,
+            cache_dir=config.get('openapi_cache_dir', '.openapi-cache')
+        )
         cls.openapi = openapi
+        format_validators.registry.compile_all(openapi)
+        cls.schemas = schema_compiler.compile_schemas(openapi)
+        cls.routes = timing.RouteMatcher(openapi['paths'])
+        cls.timings = timing.TimingRecorder()
+        cls.image_stats = image_check.ImageStats()
 
     @classmethod
     def tearDownClass(cls):
@@ -39,24 +82,27 @@ class IntegrationTests(utils.UtilsTestCase):
         valid_person_ids = self.test_cases['valid_person_ids']
         invalid_osu_ids = self.test_cases['invalid_osu_ids']
 
+        cases = []
         for person in valid_person_ids:
             resource = 'PersonResource'
             osu_id = person['osu_id']
-            self.check_endpoint(
-                f'{endpoint}/{osu_id}',
-                resource,
-                200,
-                nullable_fields=nullable_fields
-            )
+            cases.append({
+                'endpoint': f'{endpoint}/{osu_id}',
+                'resource': resource,
+                'response_code': 200,
+                'nullable_fields': nullable_fields
+            })
 
         for osu_id in invalid_osu_ids:
             resource = 'ErrorObject'
-            self.check_endpoint(
-                f'{endpoint}/{osu_id}',
-                resource,
-                404,
-                nullable_fields=nullable_fields
-            )
+            cases.append({
+                'endpoint': f'{endpoint}/{osu_id}',
+                'resource': resource,
+                'response_code': 404,
+                'nullable_fields': nullable_fields
+            })
+
+        self.check_endpoints(cases)
 
     def test_get_job_by_id(self):
         """Test case: GET /persons/{osuId}/jobs/{jobId}"""
@@ -66,27 +112,30 @@ class IntegrationTests(utils.UtilsTestCase):
         valid_person_ids = self.test_cases['valid_person_ids']
         invalid_job_ids = self.test_cases['invalid_job_ids']
 
+        cases = []
         for person in valid_person_ids:
             resource = 'JobResource'
             osu_id = person['osu_id']
             job_id = person['job_id']
-            self.check_endpoint(
-                f'/persons/{osu_id}{endpoint}/{job_id}',
-                resource,
-                200,
-                nullable_fields=nullable_fields,
-                max_elapsed_seconds=11
-            )
+            cases.append({
+                'endpoint': f'/persons/{osu_id}{endpoint}/{job_id}',
+                'resource': resource,
+                'response_code': 200,
+                'nullable_fields': nullable_fields,
+                'max_elapsed_seconds': 11
+            })
 
         osu_id = invalid_job_ids['osu_id']
         for job_id in invalid_job_ids['job_ids']:
-            self.check_endpoint(
-                f'/persons/{osu_id}{endpoint}/{job_id}',
-                'ErrorObject',
-                404,
-                nullable_fields=nullable_fields,
-                max_elapsed_seconds=11
-            )
+            cases.append({
+                'endpoint': f'/persons/{osu_id}{endpoint}/{job_id}',
+                'resource': 'ErrorObject',
+                'response_code': 404,
+                'nullable_fields': nullable_fields,
+                'max_elapsed_seconds': 11
+            })
+
+        self.check_endpoints(cases)
 
     def test_get_jobs(self):
         """Test case: GET /persons/{osuId}/jobs"""
@@ -96,15 +145,18 @@ class IntegrationTests(utils.UtilsTestCase):
         valid_person_ids = self.test_cases['valid_person_ids']
 
         resource = 'JobResource'
+        cases = []
         for person in valid_person_ids:
             osu_id = person['osu_id']
-            self.check_endpoint(
-                f'/persons/{osu_id}{endpoint}',
-                resource,
-                200,
-                nullable_fields=nullable_fields,
-                max_elapsed_seconds=11
-            )
+            cases.append({
+                'endpoint': f'/persons/{osu_id}{endpoint}',
+                'resource': resource,
+                'response_code': 200,
+                'nullable_fields': nullable_fields,
+                'max_elapsed_seconds': 11
+            })
+
+        self.check_endpoints(cases)
 
         query_params = self.query_params['jobs']
         osu_id = self.query_params['osu_id']
@@ -122,21 +174,35 @@ class IntegrationTests(utils.UtilsTestCase):
         endpoint = '/images'
         valid_person_ids = self.test_cases['valid_person_ids']
 
-        for person in valid_person_ids:
-            osu_id = person['osu_id']
+        cases = [
+            {'endpoint': f'/persons/{person["osu_id"]}{endpoint}'}
+            for person in valid_person_ids
+        ]
+        self.check_endpoints(cases, check=self.check_image)
 
-            """
-            check_endpoint assumes response will be in JSON format
-            images returns image data so we can't use that method
-            """
-            requested_url = f'{self.base_url}/persons/{osu_id}{endpoint}'
-            response = self.session.get(requested_url)
-            status_code = response.status_code
-            self.assertEqual(
-                status_code,
-                200,
-                f'requested_url: {requested_url},\nresponse_body: {response}'
-            )
+        query_params = self.query_params.get('images', {})
+        osu_id = self.query_params['osu_id']
+        cases = []
+        for param in query_params:
+            for value in query_params[param]['valid']:
+                cases.append({
+                    'endpoint': f'/persons/{osu_id}{endpoint}',
+                    'query_params': {param: value}
+                })
+        self.check_endpoints(cases, check=self.check_image)
+
+        # Errors are JSON, check_query_params only needs the invalid values
+        invalid_params = {
+            param: {'valid': [], 'invalid': values.get('invalid', [])}
+            for param, values in query_params.items()
+        }
+        self.check_query_params(
+            f'/persons/{osu_id}{endpoint}',
+            'ErrorObject',
+            None,
+            invalid_params,
+            osu_id
+        )
 
     def test_get_meal_plans(self):
         """Test case: GET /persons/{osuId}/meal-plans"""
@@ -146,14 +212,17 @@ class IntegrationTests(utils.UtilsTestCase):
         nullable_fields = self.get_nullable_fields(resource)
         valid_meal_plan_ids = self.test_cases['valid_meal_plan_ids']
 
+        cases = []
         for meal_plan in valid_meal_plan_ids:
             osu_id = meal_plan['osu_id']
-            self.check_endpoint(
-                f'/persons/{osu_id}{endpoint}',
-                resource,
-                200,
-                nullable_fields=nullable_fields
-            )
+            cases.append({
+                'endpoint': f'/persons/{osu_id}{endpoint}',
+                'resource': resource,
+                'response_code': 200,
+                'nullable_fields': nullable_fields
+            })
+
+        self.check_endpoints(cases)
 
         query_params = self.query_params['meal_plans']
         osu_id = self.query_params['osu_id']
@@ -173,25 +242,28 @@ class IntegrationTests(utils.UtilsTestCase):
         nullable_fields = self.get_nullable_fields(resource)
         valid_meal_plan_ids = self.test_cases['valid_meal_plan_ids']
 
+        cases = []
         for meal_plan in valid_meal_plan_ids:
             osu_id = meal_plan['osu_id']
             meal_plan_id = meal_plan['meal_plan_id']
-            self.check_endpoint(
-                f'/persons/{osu_id}{endpoint}/{meal_plan_id}',
-                resource,
-                200,
-                nullable_fields=nullable_fields
-            )
+            cases.append({
+                'endpoint': f'/persons/{osu_id}{endpoint}/{meal_plan_id}',
+                'resource': resource,
+                'response_code': 200,
+                'nullable_fields': nullable_fields
+            })
 
         invalid_meal_plan_ids = self.test_cases['invalid_meal_plan_ids']
         osu_id = invalid_meal_plan_ids['osu_id']
         for meal_plan_id in invalid_meal_plan_ids['meal_plan_ids']:
-            self.check_endpoint(
-                f'/persons/{osu_id}{endpoint}/{meal_plan_id}',
-                'ErrorObject',
-                404,
-                nullable_fields=nullable_fields
-            )
+            cases.append({
+                'endpoint': f'/persons/{osu_id}{endpoint}/{meal_plan_id}',
+                'resource': 'ErrorObject',
+                'response_code': 404,
+                'nullable_fields': nullable_fields
+            })
+
+        self.check_endpoints(cases)
 
     def test_get_addresses(self):
         """Test case: GET /persons/{osuId}/addresses"""
@@ -201,14 +273,17 @@ class IntegrationTests(utils.UtilsTestCase):
         nullable_fields = self.get_nullable_fields(resource)
         valid_person_ids = self.test_cases['valid_person_ids']
 
+        cases = []
         for person in valid_person_ids:
             osu_id = person['osu_id']
-            self.check_endpoint(
-                f'/persons/{osu_id}{endpoint}',
-                resource,
-                200,
-                nullable_fields=nullable_fields
-            )
+            cases.append({
+                'endpoint': f'/persons/{osu_id}{endpoint}',
+                'resource': resource,
+                'response_code': 200,
+                'nullable_fields': nullable_fields
+            })
+
+        self.check_endpoints(cases)
 
         query_params = self.query_params['addresses']
         osu_id = self.query_params['osu_id']
@@ -228,14 +303,17 @@ class IntegrationTests(utils.UtilsTestCase):
         nullable_fields = self.get_nullable_fields(resource)
         valid_person_ids = self.test_cases['valid_person_ids']
 
+        cases = []
         for person in valid_person_ids:
             osu_id = person['osu_id']
-            self.check_endpoint(
-                f'/persons/{osu_id}{endpoint}',
-                resource,
-                200,
-                nullable_fields=nullable_fields
-            )
+            cases.append({
+                'endpoint': f'/persons/{osu_id}{endpoint}',
+                'resource': resource,
+                'response_code': 200,
+                'nullable_fields': nullable_fields
+            })
+
+        self.check_endpoints(cases)
 
         query_params = self.query_params['phones']
         osu_id = self.query_params['osu_id']
@@ -255,14 +333,17 @@ class IntegrationTests(utils.UtilsTestCase):
         nullable_fields = self.get_nullable_fields(resource)
         valid_person_ids = self.test_cases['valid_person_ids']
 
+        cases = []
         for person in valid_person_ids:
             osu_id = person['osu_id']
-            self.check_endpoint(
-                f'/persons/{osu_id}{endpoint}',
-                resource,
-                200,
-                nullable_fields=nullable_fields,
-            )
+            cases.append({
+                'endpoint': f'/persons/{osu_id}{endpoint}',
+                'resource': resource,
+                'response_code': 200,
+                'nullable_fields': nullable_fields
+            })
+
+        self.check_endpoints(cases)
 
         query_params = self.query_params['emails']
         osu_id = self.query_params['osu_id']
@@ -282,14 +363,17 @@ class IntegrationTests(utils.UtilsTestCase):
         nullable_fields = self.get_nullable_fields(resource)
         valid_person_ids = self.test_cases['valid_person_ids']
 
+        cases = []
         for person in valid_person_ids:
             osu_id = person['osu_id']
-            self.check_endpoint(
-                f'/persons/{osu_id}{endpoint}',
-                resource,
-                200,
-                nullable_fields=nullable_fields,
-            )
+            cases.append({
+                'endpoint': f'/persons/{osu_id}{endpoint}',
+                'resource': resource,
+                'response_code': 200,
+                'nullable_fields': nullable_fields
+            })
+
+        self.check_endpoints(cases)
 
         query_params = self.query_params['medical']
         osu_id = self.query_params['osu_id']
@@ -311,5 +395,113 @@ if __name__ == '__main__':
     else:
         logging.basicConfig(level=logging.INFO)
 
-    IntegrationTests.setup(arguments.config_path, arguments.openapi_path)
-    unittest.main(argv=argv)
+    if arguments.load:
+        with open(arguments.config_path) as config_file:
+            load_test.run_load_test(json.load(config_file),
+                                    duration=arguments.duration,
+                                    concurrency=arguments.concurrency,
+                                    rate=arguments.rate,
+                                    open_loop=arguments.open_loop,
+                                    arrival=arguments.arrival)
+        sys.exit()
+
+    if arguments.profile_path:
+        sampling_profiler = profiler.SamplingProfiler(
+            arguments.profile_interval
+        )
+        sampling_profiler.start()
+
+    setup_arguments = {
+        'config_path': arguments.config_path,
+        'openapi_path': arguments.openapi_path,
+        'workers': arguments.workers,
+        'policy': arguments.validation_policy,
+        'matrix_mode': arguments.matrix_mode,
+        'cache_mode': arguments.cache_mode,
+        'event_log_path': arguments.event_log_path
+    }
+    IntegrationTests.setup(**setup_arguments)
+    processes = parallel_runner.setup_processes(IntegrationTests.config,
+                                                arguments.processes)
+    if arguments.ids_path:
+        successful = sweep.run_sweep(IntegrationTests(),
+                                     arguments.ids_path,
+                                     checkpoint_path=arguments.checkpoint_path,
+                                     failures_path=arguments.failures_path)
+    elif arguments.write_benchmark:
+        successful = write_benchmark.run_write_benchmark(
+            IntegrationTests(),
+            duration=arguments.duration,
+            concurrency=arguments.concurrency,
+            rate=arguments.rate
+        )
+    elif arguments.person_profile:
+        successful = person_profile.run_profile_benchmark(
+            IntegrationTests(), rounds=arguments.person_profile_rounds
+        )
+    elif arguments.replay_path:
+        successful = replay.run_replay(IntegrationTests(),
+                                       arguments.replay_path,
+                                       speed=arguments.speed,
+                                       duration=arguments.duration)
+    elif arguments.fuzz_filters:
+        successful = filter_fuzz.run_filter_fuzz(IntegrationTests(),
+                                                 seed=arguments.fuzz_seed,
+                                                 duration=arguments.duration)
+    elif processes > 1:
+        successful = parallel_runner.run_parallel(IntegrationTests,
+                                                  setup_arguments,
+                                                  processes,
+                                                  argv)
+    else:
+        program = unittest.main(argv=argv, exit=False)
+        successful = program.result.wasSuccessful()
+
+    if arguments.profile_path:
+        sampling_profiler.stop()
+        sampling_profiler.write_collapsed(arguments.profile_path)
+        print(sampling_profiler.summary())
+
+    print(IntegrationTests.timings.format_summary())
+    image_summary = IntegrationTests.image_stats.format_summary()
+    if image_summary:
+        print(image_summary)
+    print(IntegrationTests.validation.summary())
+    print(IntegrationTests.check_cache.summary())
+    if IntegrationTests.response_cache is not None:
+        print(IntegrationTests.response_cache.summary())
+    if IntegrationTests.event_log is not None:
+        IntegrationTests.event_log.close()
+        print(IntegrationTests.event_log.summary())
+    print(timing.connection_stats.summary())
+    if timing.connection_stats.to_dict()['discarded']:
+        logging.warning('Connections were discarded, latencies include '
+                        'extra connection setup. Increase session.'
+                        'pool_maxsize to at least the number of workers')
+    if arguments.timing_report_path:
+        with open(arguments.timing_report_path, 'w') as report_file:
+            json.dump(IntegrationTests.timings.to_dict(), report_file,
+                      indent=2)
+
+    if arguments.baseline_path:
+        with open(arguments.baseline_path) as baseline_file:
+            baseline = timing.TimingRecorder.from_dict(
+                json.load(baseline_file)
+            )
+        comparison = timing.BaselineComparison(
+            **IntegrationTests.config.get('performance_gate', {})
+        )
+        compared, skipped = comparison.compare(IntegrationTests.timings,
+                                               baseline)
+        print(comparison.format_results(compared, skipped))
+        if not compared:
+            logging.error('No endpoint had enough samples in both runs to '
+                          'be compared against the baseline, lower '
+                          'performance_gate.min_samples or send more '
+                          'requests')
+            successful = False
+        elif any(result['regressions'] for result in compared):
+            logging.error('Latency regressed against the baseline')
+            successful = False
+
+    sys.exit(not successful)
@@ -0,0 +1,114 @@
+"""Incremental parsing of JSON:API documents"""
+import codecs
+import json
+
+
+class JsonStream:
+    """Parse a JSON object from chunks of bytes, yielding the items of one
+    top-level array as soon as each of them has arrived. Other top-level
+    members are collected into envelope.
+
+    :param chunks: iterable of bytes, e.g. response.iter_content()
+    :param array_key: top-level member to stream (default: 'data')
+    :param max_buffer: characters to keep before compacting the buffer
+    """
+
+    WHITESPACE = ' \t\n\r'
+
+    def __init__(self, chunks, array_key='data', max_buffer=65536):
+        self.chunks = iter(chunks)
+        self.array_key = array_key
+        self.max_buffer = max_buffer
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.position = 0
+        self.finished = False
+        self.envelope = {}
+        # Whether the streamed member was an array or a single value
+        self.is_array = None
+
+    def __fill(self):
+        """Read the next chunk into the buffer. Returns False at the end of
+        the input."""
+
+        if self.finished:
+            return False
+        if self.position > self.max_buffer:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+        try:
+            self.buffer += self.text_decoder.decode(next(self.chunks))
+        except StopIteration:
+            self.buffer += self.text_decoder.decode(b'', final=True)
+            self.finished = True
+        return True
+
+    def __peek(self):
+        """Skip whitespace and return the next character, or None at the end
+        of the input"""
+
+        while True:
+            while (
+                self.position < len(self.buffer)
+                and self.buffer[self.position] in self.WHITESPACE
+            ):
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.__fill():
+                return None
+
+    def __expect(self, characters):
+        character = self.__peek()
+        if character is None or character not in characters:
+            raise json.JSONDecodeError(f'Expecting one of {characters!r}',
+                                       self.buffer, self.position)
+        self.position += 1
+        return character
+
+    def __value(self):
+        """Decode the next complete JSON value"""
+
+        self.__peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer,
+                                                     self.position)
+            except json.JSONDecodeError:
+                if not self.__fill():
+                    raise
+                continue
+            # A number or literal ending at the end of the buffer may
+            # continue in the next chunk
+            if end == len(self.buffer) and self.__fill():
+                continue
+            self.position = end
+            return value
+
+    def __iter__(self):
+        self.__expect('{')
+        if self.__peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.__value()
+            self.__expect(':')
+            if key == self.array_key and self.__peek() == '[':
+                self.is_array = True
+                self.position += 1
+                if self.__peek() == ']':
+                    self.position += 1
+                else:
+                    while True:
+                        yield self.__value()
+                        if self.__expect(',]') == ']':
+                            break
+            else:
+                value = self.__value()
+                self.envelope[key] = value
+                if key == self.array_key:
+                    self.is_array = False
+                    yield value
+            if self.__expect(',}') == '}':
+                return
@@ -0,0 +1,389 @@
+"""Load testing driven by the integration test configuration"""
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import logging
+import math
+import random
+import threading
+import time
+
+import requests
+
+import arrivals
+import timing
+import utils
+
+
+# Mapping of query_params sections and sub-resource path segments
+SUB_RESOURCES = {
+    'jobs': 'jobs',
+    'meal_plans': 'meal-plans',
+    'addresses': 'addresses',
+    'phones': 'phones',
+    'emails': 'emails',
+    'medical': 'medical'
+}
+
+WorkloadRequest = namedtuple('WorkloadRequest',
+                             ['template', 'endpoint', 'params'])
+
+
+def build_workload(config):
+    """Build the list of requests the integration tests send
+
+    :param config: integration test configuration
+    :returns: A list of WorkloadRequest
+    """
+
+    test_cases = config['test_cases']
+    query_params = config['query_params']
+    workload = []
+
+    for person in test_cases['valid_person_ids']:
+        osu_id = person['osu_id']
+        workload.append(WorkloadRequest(
+            '/persons/{osuId}', f'/persons/{osu_id}', None
+        ))
+        workload.append(WorkloadRequest(
+            '/persons/{osuId}/jobs/{jobId}',
+            f'/persons/{osu_id}/jobs/{person["job_id"]}',
+            None
+        ))
+        workload.append(WorkloadRequest(
+            '/persons/{osuId}/images', f'/persons/{osu_id}/images', None
+        ))
+        for segment in SUB_RESOURCES.values():
+            workload.append(WorkloadRequest(
+                f'/persons/{{osuId}}/{segment}',
+                f'/persons/{osu_id}/{segment}',
+                None
+            ))
+
+    for osu_id in test_cases['invalid_osu_ids']:
+        workload.append(WorkloadRequest(
+            '/persons/{osuId}', f'/persons/{osu_id}', None
+        ))
+
+    invalid_job_ids = test_cases['invalid_job_ids']
+    for job_id in invalid_job_ids['job_ids']:
+        workload.append(WorkloadRequest(
+            '/persons/{osuId}/jobs/{jobId}',
+            f'/persons/{invalid_job_ids["osu_id"]}/jobs/{job_id}',
+            None
+        ))
+
+    for meal_plan in test_cases['valid_meal_plan_ids']:
+        workload.append(WorkloadRequest(
+            '/persons/{osuId}/meal-plans/{mealPlanId}',
+            f'/persons/{meal_plan["osu_id"]}/meal-plans/'
+            f'{meal_plan["meal_plan_id"]}',
+            None
+        ))
+
+    osu_id = query_params['osu_id']
+    for section, segment in SUB_RESOURCES.items():
+        for param, values in query_params.get(section, {}).items():
+            for value in values['valid'] + values.get('invalid', []):
+                workload.append(WorkloadRequest(
+                    f'/persons/{{osuId}}/{segment}',
+                    f'/persons/{osu_id}/{segment}',
+                    {param: value}
+                ))
+
+    return workload
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of a sorted list"""
+
+    if not sorted_values:
+        return None
+    rank = math.ceil(percent / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+class LoadStats:
+    """Thread-safe collector of load test results"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.status_codes = defaultdict(Counter)
+        self.started = None
+        self.finished = None
+
+    def record(self, template, status, latency):
+        with self.lock:
+            self.latencies[template].append(latency)
+            self.status_codes[template][status] += 1
+
+    def report(self):
+        """Summarize throughput, latency percentiles and error rates per
+        route template"""
+
+        duration = self.finished - self.started
+        report = {}
+        for template in sorted(self.latencies):
+            latencies = sorted(self.latencies[template])
+            statuses = self.status_codes[template]
+            count = len(latencies)
+            report[template] = {
+                'requests': count,
+                'throughput': count / duration,
+                'p50': percentile(latencies, 50),
+                'p90': percentile(latencies, 90),
+                'p99': percentile(latencies, 99),
+                'max': latencies[-1],
+                'error_rates': {
+                    str(status): statuses[status] / count
+                    for status in sorted(statuses, key=str)
+                    if not isinstance(status, int) or status >= 400
+                }
+            }
+        return report
+
+
+def format_report(report):
+    """Format a load test report as a human readable table"""
+
+    header = (f'{"route":<45} {"reqs":>7} {"req/s":>8} {"p50":>7} '
+              f'{"p90":>7} {"p99":>7} {"max":>7}  errors')
+    lines = [header, '-' * len(header)]
+    for template, stats in report.items():
+        errors = ', '.join(
+            f'{status}: {rate:.1%}'
+            for status, rate in stats['error_rates'].items()
+        )
+        lines.append(
+            f'{template:<45} {stats["requests"]:>7} '
+            f'{stats["throughput"]:>8.2f} {stats["p50"]:>7.3f} '
+            f'{stats["p90"]:>7.3f} {stats["p99"]:>7.3f} '
+            f'{stats["max"]:>7.3f}  {errors or "-"}'
+        )
+    return '\n'.join(lines)
+
+
+class LoadRunner:
+    """Send the workload repeatedly for a fixed duration from a number of
+    concurrent workers, optionally capped at a target request rate
+
+    :param session: requests session shared by the workers
+    :param base_url: base URL of the API
+    :param workload: list of WorkloadRequest to cycle through
+    :param concurrency: number of concurrent workers
+    :param duration: seconds to run for
+    :param rate: target requests per second across all workers (default:
+                 None, as fast as the workers can go)
+    """
+
+    def __init__(self, session, base_url, workload, concurrency, duration,
+                 rate=None):
+        self.session = session
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.duration = duration
+        self.interval = 1 / rate if rate else None
+        self.stats = LoadStats()
+        self.lock = threading.Lock()
+        self.requests = itertools.cycle(workload)
+        self.next_send = None
+        self.deadline = None
+
+    def __next_request(self):
+        """Get the next request and the time it is due to be sent"""
+
+        with self.lock:
+            request = next(self.requests)
+            if self.interval is None:
+                return request, time.monotonic()
+            send_at = self.next_send
+            self.next_send += self.interval
+            return request, send_at
+
+    def __worker(self):
+        while True:
+            request, send_at = self.__next_request()
+            if send_at >= self.deadline:
+                return
+            delay = send_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            start = time.monotonic()
+            try:
+                response = self.session.get(f'{self.base_url}'
+                                            f'{request.endpoint}',
+                                            params=request.params)
+                status = response.status_code
+            except requests.exceptions.RequestException as error:
+                status = type(error).__name__
+            self.stats.record(request.template, status,
+                              time.monotonic() - start)
+
+    def run(self):
+        """Run the load test and return its statistics"""
+
+        logging.info(f'Running load test for {self.duration} second(s) with '
+                     f'{self.concurrency} worker(s)')
+        self.stats.started = time.monotonic()
+        self.next_send = self.stats.started
+        self.deadline = self.stats.started + self.duration
+
+        workers = [
+            threading.Thread(target=self.__worker)
+            for _ in range(self.concurrency)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.stats.finished = time.monotonic()
+        return self.stats
+
+
+class OpenLoopRunner:
+    """Send the workload on an arrival schedule which does not wait for
+    responses. Latency is measured from the intended send time, so requests
+    delayed behind a stalled API count the time they waited instead of
+    being silently sent later, known as coordinated omission.
+
+    :param session: requests session shared by the senders
+    :param base_url: base URL of the API
+    :param workload: list of WorkloadRequest to cycle through
+    :param phases: list of arrivals.Phase
+    :param arrival: one of arrivals.ARRIVALS
+    :param max_in_flight: requests sent concurrently at most, later ones
+                          wait and their wait counts in their latency
+    :param seed: seed of poisson arrivals (default: None, unseeded)
+    """
+
+    def __init__(self, session, base_url, workload, phases, arrival='fixed',
+                 max_in_flight=256, seed=None):
+        if arrival not in arrivals.ARRIVALS:
+            raise ValueError(f'Unknown arrival process {arrival!r}, '
+                             f'expected one of {arrivals.ARRIVALS}')
+        self.session = session
+        self.base_url = base_url
+        self.workload = workload
+        self.phases = phases
+        self.arrival = arrival
+        self.max_in_flight = max_in_flight
+        self.rng = random.Random(seed)
+        self.stats = OrderedDict((phase.name, LoadStats()) for phase in phases)
+        self.send_lag = defaultdict(timing.LatencyHistogram)
+        self.lock = threading.Lock()
+
+    def __send(self, request, intended, phase):
+        sent = time.monotonic()
+        try:
+            response = self.session.get(f'{self.base_url}{request.endpoint}',
+                                        params=request.params)
+            status = response.status_code
+        except requests.exceptions.RequestException as error:
+            status = type(error).__name__
+        self.stats[phase].record(request.template, status,
+                                 time.monotonic() - intended)
+        with self.lock:
+            self.send_lag[phase].add(sent - intended)
+
+    def run(self):
+        """Run the load test and return the statistics of each phase"""
+
+        phases = ', '.join(map(arrivals.describe_phase, self.phases))
+        logging.info(f'Running open-loop load test with {self.arrival} '
+                     f'arrivals, phases: {phases}')
+        start = time.monotonic()
+        phase_start = start
+        for phase in self.phases:
+            self.stats[phase.name].started = phase_start
+            phase_start += phase.duration
+            self.stats[phase.name].finished = phase_start
+
+        requests_cycle = itertools.cycle(self.workload)
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            for offset, phase in arrivals.arrival_times(
+                self.phases, self.arrival, self.rng
+            ):
+                intended = start + offset
+                delay = intended - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.__send, next(requests_cycle), intended,
+                                phase)
+        return self.stats
+
+
+def format_phases(phases, stats, send_lag):
+    """Format the reports of the phases of an open-loop load test"""
+
+    sections = []
+    for phase in phases:
+        lag = send_lag[phase.name]
+        sections.append(
+            f'Phase {arrivals.describe_phase(phase)}, send lag p99 '
+            f'{lag.percentile(99) or 0:.3f}s max {lag.max or 0:.3f}s\n'
+            + format_report(stats[phase.name].report())
+        )
+    return '\n\n'.join(sections)
+
+
+def run_load_test(config, duration=None, concurrency=None, rate=None,
+                  open_loop=False, arrival=None):
+    """Run a load test from the load_test section of the configuration file.
+    Arguments override the configured values.
+
+    :param open_loop: send on the arrival schedule of the configured phases
+                      rather than from concurrent workers
+    :param arrival: arrival process of open-loop load tests
+    :returns: A load test report, by phase for open-loop load tests
+    """
+
+    load_config = config.get('load_test', {})
+    if open_loop or load_config.get('mode', 'closed') == 'open':
+        return run_open_loop(config, load_config, duration, rate, arrival)
+    duration = duration or load_config.get('duration_seconds', 60)
+    concurrency = concurrency or load_config.get('concurrency', 10)
+    rate = rate or load_config.get('rate')
+
+    session = utils.setup_session(config, pool_maxsize=concurrency)
+    runner = LoadRunner(session,
+                        utils.setup_base_url(config),
+                        build_workload(config),
+                        concurrency,
+                        duration,
+                        rate=rate)
+    try:
+        report = runner.run().report()
+    finally:
+        session.close()
+
+    print(format_report(report))
+    print(timing.connection_stats.summary())
+    return report
+
+
+def run_open_loop(config, load_config, duration=None, rate=None,
+                  arrival=None):
+    """Run an open-loop load test, see run_load_test"""
+
+    phases = arrivals.build_phases(load_config, duration, rate)
+    max_in_flight = load_config.get('max_in_flight', 256)
+    session = utils.setup_session(config, pool_maxsize=max_in_flight)
+    runner = OpenLoopRunner(session,
+                            utils.setup_base_url(config),
+                            build_workload(config),
+                            phases,
+                            arrival=arrival or load_config.get('arrival',
+                                                               'fixed'),
+                            max_in_flight=max_in_flight,
+                            seed=load_config.get('seed'))
+    try:
+        stats = runner.run()
+    finally:
+        session.close()
+
+    print(format_phases(phases, stats, runner.send_lag))
+    print(timing.connection_stats.summary())
+    return {name: phase_stats.report() for name, phase_stats in stats.items()}
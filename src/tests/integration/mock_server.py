@@ -0,0 +1,580 @@
+"""Stand-in Persons API serving generated fixtures for offline testing"""
+import argparse
+import datetime
+import functools
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import threading
+import time
+import urllib
+
+import data_generator
+import format_validators
+import image_check
+import openapi_model
+import schema_compiler
+
+
+DEFAULT_IMAGE_PATH = os.path.join(os.path.dirname(__file__), '..', '..',
+                                  'resources', 'defaultImage.jpg')
+
+DATE_TIME_PATTERN = re.compile(
+    r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:\d{2})$'
+)
+
+# Generated sub-resource IDs which the by-ID endpoints accept
+ID_PATTERNS = {
+    'jobId': re.compile(r'^\w+-\w+$')
+}
+
+
+def parse_arguments():
+    """Handler for parsing command-line arguments"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--openapi',
+        dest='openapi_path',
+        help='Path to yaml formatted OpenAPI specification',
+        required=True)
+    parser.add_argument(
+        '--openapi-cache',
+        dest='openapi_cache_dir',
+        default='.openapi-cache',
+        help='Directory of cached OpenAPI models (default: .openapi-cache)')
+    parser.add_argument('--host', dest='host', default='localhost')
+    parser.add_argument('--port', dest='port', type=int, default=8080)
+    parser.add_argument(
+        '--base-path',
+        dest='base_path',
+        default='/api/v2',
+        help='Path prefix of the API (default: /api/v2)')
+    parser.add_argument(
+        '--seed',
+        dest='seed',
+        type=int,
+        default=0,
+        help='Seed of the generated fixtures')
+    parser.add_argument(
+        '--max-items',
+        dest='max_items',
+        type=int,
+        default=3,
+        help='Maximum number of resources returned by collection endpoints')
+    parser.add_argument(
+        '--latency',
+        dest='latency',
+        type=float,
+        default=0,
+        help='Seconds of latency injected into every response')
+    parser.add_argument(
+        '--jitter',
+        dest='jitter',
+        type=float,
+        default=0,
+        help='Maximum seconds of random latency added to --latency')
+    parser.add_argument(
+        '--route-latency',
+        dest='route_latency',
+        action='append',
+        default=[],
+        metavar='TEMPLATE=SECONDS',
+        help='Latency of a route template, e.g. /persons/{osuId}/jobs=0.5. '
+             'Overrides --latency and may be repeated')
+    parser.add_argument(
+        '--error-rate',
+        dest='error_rate',
+        type=float,
+        default=0,
+        help='Fraction of requests answered with 500 Internal Server Error')
+    parser.add_argument(
+        '--image',
+        dest='image_path',
+        default=DEFAULT_IMAGE_PATH,
+        help='Path to the JPEG image served by the images endpoint')
+    parser.add_argument(
+        '--client-id',
+        dest='client_id',
+        help='Require OAuth2 bearer tokens issued to this client ID by the '
+             'token endpoint')
+    parser.add_argument(
+        '--client-secret',
+        dest='client_secret',
+        default='client_secret',
+        help='Client secret accepted by the token endpoint')
+    parser.add_argument(
+        '--token-path',
+        dest='token_path',
+        default='/oauth2/token',
+        help='Path of the OAuth2 token endpoint (default: /oauth2/token)')
+    parser.add_argument(
+        '--token-lifetime',
+        dest='token_lifetime',
+        type=float,
+        default=3600,
+        help='Seconds until issued tokens expire')
+    parser.add_argument(
+        '--debug',
+        dest='debug',
+        help='Enable debug logging mode',
+        action='store_true')
+    return parser.parse_args()
+
+
+def error_body(status, title, detail):
+    return {
+        'errors': [{
+            'status': str(status),
+            'title': title,
+            'code': f'1{status}',
+            'detail': detail,
+            'links': {
+                'about': 'https://developer.oregonstate.edu/documentation/'
+                         f'error-reference#1{status}'
+            }
+        }]
+    }
+
+
+class MockPersonsApi:
+    """Answer requests to the paths of an OpenAPI specification with
+    fixtures generated from its schemas
+
+    :param openapi: parsed OpenAPI specification
+    :param seed: seed of the generated fixtures
+    :param max_items: maximum number of resources of collection endpoints
+    :param latency: seconds of latency injected into every response
+    :param jitter: maximum seconds of random latency added to latency
+    :param route_latency: dict of route templates and their latency
+    :param error_rate: fraction of requests answered with an error
+    :param image: bytes of the image served by the images endpoint
+    """
+
+    def __init__(self, openapi, seed=0, max_items=3, latency=0, jitter=0,
+                 route_latency=None, error_rate=0, image=b''):
+        self.openapi = openapi
+        self.seed = seed
+        self.max_items = max_items
+        self.latency = latency
+        self.jitter = jitter
+        self.route_latency = route_latency or {}
+        self.error_rate = error_rate
+        self.image = image
+        self.resized_images = {}
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+        compiler = schema_compiler.SchemaCompiler(openapi)
+        self.routes = []
+        self.parameters = {}
+        for template, operations in openapi['paths'].items():
+            pattern = re.sub(r'\\{([^/]+?)\\}', r'(?P<\1>[^/]*)',
+                             re.escape(template))
+            self.routes.append((re.compile(f'^{pattern}$'), template,
+                                operations))
+            for method, operation in operations.items():
+                self.parameters[(template, method)] = [
+                    compiler.resolve(parameter)
+                    for parameter in operation.get('parameters', [])
+                ]
+
+    def __random(self):
+        with self.rng_lock:
+            return self.rng.random()
+
+    @staticmethod
+    def __valid_value(value, schema):
+        """Check a path or query parameter value against its schema"""
+
+        schema_type = schema.get('type')
+        if schema_type == 'array':
+            return all(
+                MockPersonsApi.__valid_value(item, schema['items'])
+                for item in value.split(',')
+            )
+        if schema_type == 'boolean':
+            return value in ['true', 'false']
+        if schema_type in ['number', 'integer']:
+            try:
+                number = int(value) if schema_type == 'integer' else float(
+                    value
+                )
+            except ValueError:
+                return False
+            return (
+                schema.get('minimum', number) <= number
+                <= schema.get('maximum', number)
+            )
+        if 'enum' in schema and value not in schema['enum']:
+            return False
+        if (
+            'pattern' in schema
+            and not format_validators.registry.compile(
+                schema['pattern']
+            ).search(value)
+        ):
+            return False
+        if schema.get('format') == 'date-time':
+            if not DATE_TIME_PATTERN.match(value):
+                return False
+            # Out of range fields, e.g. month 13, are rejected too
+            try:
+                datetime.datetime.fromisoformat(
+                    re.sub(r'\.\d+', '', value).replace('Z', '+00:00')
+                )
+            except ValueError:
+                return False
+        return True
+
+    @functools.lru_cache(maxsize=4096)
+    def __fixture(self, template, path):
+        """Generate the response body of a path, the same for every request"""
+
+        operation = self.openapi['paths'][template]['get']
+        schema = operation['responses']['200']['content']['application/json'][
+            'schema'
+        ]
+        generator = data_generator.DataGenerator(
+            self.openapi,
+            rng=random.Random(f'{self.seed}:{path}'),
+            max_items=self.max_items
+        )
+        body = generator.generate(schema)
+        if isinstance(body['data'], list):
+            for index, resource in enumerate(body['data']):
+                resource['id'] = (
+                    f'C{index:05}-00' if resource['type'] == 'jobs'
+                    else str(index + 1)
+                )
+                resource['links'] = {'self': f'{path}/{resource["id"]}'}
+        else:
+            body['data']['id'] = path.rsplit('/', 1)[-1]
+            body['data']['links'] = {'self': path}
+        return body
+
+    def __link(self, host, path, query=None):
+        """Build a self link the way the API does, without port and path
+        prefix"""
+
+        version = self.openapi['info']['version']
+        link = f'http://{host.split(":")[0]}/{version}{path}'
+        if query:
+            link = f'{link}?{urllib.parse.urlencode(query)}'
+        return link
+
+    def __delay(self, template):
+        latency = self.route_latency.get(template, self.latency)
+        if self.jitter:
+            latency += self.__random() * self.jitter
+        if latency > 0:
+            time.sleep(latency)
+
+    def handle(self, method, path, query, host, body=None):
+        """Handle a request
+
+        :param method: HTTP method
+        :param path: requested path without the API path prefix
+        :param query: dict of query parameters
+        :param host: Host header of the request
+        :param body: request body bytes of writes (default: None)
+        :returns: A tuple of status code, content type and body bytes
+        """
+
+        for pattern, template, operations in self.routes:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            return self.__json(404, error_body(404, 'Not Found',
+                                               f'{path} not found'))
+
+        self.__delay(template)
+        operation = operations.get(method.lower())
+        if operation is None:
+            return self.__json(405, error_body(405, 'Method Not Allowed',
+                                               f'{method} {template}'))
+        if self.error_rate and self.__random() < self.error_rate:
+            return self.__json(500, error_body(500, 'Internal Server Error',
+                                               'Injected error'))
+
+        for parameter in self.parameters[(template, method.lower())]:
+            name = parameter['name']
+            if parameter['in'] == 'path':
+                value = match.group(name)
+                valid_id = ID_PATTERNS.get(name)
+                if (
+                    not self.__valid_value(value, parameter['schema'])
+                    or (valid_id and not valid_id.match(value))
+                ):
+                    return self.__json(404, error_body(
+                        404, 'Not Found', f'{name} {value} not found'
+                    ))
+            elif (
+                parameter['in'] == 'query' and name in query
+                and not self.__valid_value(query[name], parameter['schema'])
+            ):
+                return self.__json(400, error_body(
+                    400, 'Bad Request', f'Invalid value of {name}'
+                ))
+
+        if method != 'GET':
+            return self.__write(operation, path, match, host, body)
+        if 'image/jpeg' in operation['responses']['200']['content']:
+            return 200, 'image/jpeg', self.__image(query.get('width'))
+
+        body = json.loads(json.dumps(self.__fixture(template, path)))
+        body['links'] = {'self': self.__link(host, path, query)}
+        resources = body['data'] if isinstance(body['data'], list) else [
+            body['data']
+        ]
+        for resource in resources:
+            resource['links']['self'] = self.__link(
+                host, resource['links']['self']
+            )
+        return self.__json(200, body)
+
+    def __write(self, operation, path, match, host, body):
+        """Accept a write with a generated resource, which is not stored"""
+
+        try:
+            data = json.loads(body or b'null')['data']
+            attributes = data.get('attributes', {})
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return self.__json(400, error_body(400, 'Bad Request',
+                                               'Invalid request body'))
+
+        responses = operation['responses']
+        if '204' in responses:
+            return 204, 'application/json', b''
+        schema = responses['202']['content']['application/json']['schema']
+        with self.rng_lock:
+            seed = self.rng.random()
+        generator = data_generator.DataGenerator(
+            self.openapi, rng=random.Random(seed), max_items=self.max_items
+        )
+        result = generator.generate(schema)
+        if 'id' in data:
+            resource_id = data['id']
+        elif 'positionNumber' in attributes:
+            resource_id = (f'{attributes["positionNumber"]}-'
+                           f'{attributes.get("suffix")}')
+        else:
+            resource_id = f'{generator.rng.randrange(10 ** 9):09}'
+        resource_path = path
+        if 'jobId' not in match.groupdict():
+            resource_path = f'{path}/{resource_id}'
+        result['data']['id'] = resource_id
+        result['data']['links'] = {'self': self.__link(host, resource_path)}
+        result['links'] = {'self': self.__link(host, resource_path)}
+        return self.__json(202, result)
+
+    def __image(self, width):
+        """The image, with the dimensions in its frame header scaled to a
+        requested width. The image data itself is not resized."""
+
+        if not width or not self.image:
+            return self.image
+        width = int(width)
+        if width not in self.resized_images:
+            image = bytearray(self.image)
+            offset = image_check.frame_header_offset(self.image)
+            original_width, original_height = image_check.jpeg_dimensions(
+                self.image
+            )
+            height = max(round(original_height * width / original_width), 1)
+            image[offset + 5:offset + 7] = height.to_bytes(2, 'big')
+            image[offset + 7:offset + 9] = width.to_bytes(2, 'big')
+            self.resized_images[width] = bytes(image)
+        return self.resized_images[width]
+
+    @staticmethod
+    def __json(status, body):
+        return status, 'application/json', json.dumps(body).encode()
+
+
+class MockTokenEndpoint:
+    """Issue OAuth2 client credentials tokens which expire after lifetime
+    seconds and check the bearer tokens of requests
+
+    :param client_id: accepted client ID
+    :param client_secret: accepted client secret
+    :param lifetime: seconds until issued tokens expire
+    """
+
+    def __init__(self, client_id, client_secret, lifetime=3600):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.lifetime = lifetime
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+    def issue(self, form):
+        """Handle a token request
+
+        :param form: dict of form parameters of the request
+        :returns: A tuple of status code, content type and body bytes
+        """
+
+        if (
+            form.get('grant_type') != 'client_credentials'
+            or form.get('client_id') != self.client_id
+            or form.get('client_secret') != self.client_secret
+        ):
+            body = {'error': 'invalid_client'}
+            return 401, 'application/json', json.dumps(body).encode()
+
+        token = secrets.token_urlsafe(24)
+        with self.lock:
+            self.tokens[token] = time.monotonic() + self.lifetime
+        body = {
+            'access_token': token,
+            'token_type': 'Bearer',
+            # The OSU token endpoint returns expires_in as a string
+            'expires_in': str(int(self.lifetime))
+        }
+        return 200, 'application/json', json.dumps(body).encode()
+
+    def is_authorized(self, authorization):
+        """Whether an Authorization header holds an unexpired token"""
+
+        scheme, _, token = (authorization or '').partition(' ')
+        with self.lock:
+            expires_at = self.tokens.get(token)
+        return (
+            scheme == 'Bearer' and expires_at is not None
+            and time.monotonic() < expires_at
+        )
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Dispatch requests to the MockPersonsApi of the server"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, avoid delayed ACK stalls
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+    def do_GET(self):
+        api = self.server.api
+        tokens = self.server.tokens
+        url = urllib.parse.urlsplit(self.path)
+        request_body = self.__read_body()
+        base_path = self.server.base_path
+        if not url.path.startswith(base_path):
+            status, content_type, body = 404, 'application/json', b'{}'
+        elif tokens and not tokens.is_authorized(
+            self.headers.get('Authorization')
+        ):
+            status, content_type, body = 401, 'application/json', json.dumps(
+                error_body(401, 'Unauthorized', 'Invalid or expired token')
+            ).encode()
+        else:
+            query = dict(urllib.parse.parse_qsl(url.query,
+                                                keep_blank_values=True))
+            status, content_type, body = api.handle(
+                self.command,
+                url.path[len(base_path):],
+                query,
+                self.headers.get('Host', 'localhost'),
+                body=request_body
+            )
+
+        headers = {}
+        if status == 200:
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            headers['ETag'] = etag
+            if self.headers.get('If-None-Match') == etag:
+                status, body = 304, b''
+        self.__respond(status, content_type, body, headers)
+
+    def do_POST(self):
+        tokens = self.server.tokens
+        url = urllib.parse.urlsplit(self.path)
+        if tokens and url.path == self.server.token_path:
+            form = dict(urllib.parse.parse_qsl(self.__read_body().decode()))
+            status, content_type, body = tokens.issue(form)
+            self.__respond(status, content_type, body)
+        else:
+            self.do_GET()
+
+    do_PATCH = do_GET
+
+    def __read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else None
+
+    def __respond(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(api, host='localhost', port=8080, base_path='/api/v2',
+                tokens=None, token_path='/oauth2/token'):
+    """Create a threaded HTTP server for a MockPersonsApi
+
+    :param tokens: MockTokenEndpoint served at token_path, requests to the
+                   API need its tokens (default: None, no authentication)
+    """
+
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    server.api = api
+    server.base_path = base_path.rstrip('/')
+    server.tokens = tokens
+    server.token_path = token_path
+    return server
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    logging.basicConfig(
+        level=logging.DEBUG if arguments.debug else logging.INFO
+    )
+
+    openapi = openapi_model.load_model(arguments.openapi_path,
+                                       cache_dir=arguments.openapi_cache_dir)
+
+    image = b''
+    if os.path.exists(arguments.image_path):
+        with open(arguments.image_path, 'rb') as image_file:
+            image = image_file.read()
+
+    route_latency = {}
+    for route in arguments.route_latency:
+        template, seconds = route.rsplit('=', 1)
+        route_latency[template] = float(seconds)
+
+    api = MockPersonsApi(openapi,
+                         seed=arguments.seed,
+                         max_items=arguments.max_items,
+                         latency=arguments.latency,
+                         jitter=arguments.jitter,
+                         route_latency=route_latency,
+                         error_rate=arguments.error_rate,
+                         image=image)
+    tokens = None
+    if arguments.client_id:
+        tokens = MockTokenEndpoint(arguments.client_id,
+                                   arguments.client_secret,
+                                   arguments.token_lifetime)
+    server = make_server(api, arguments.host, arguments.port,
+                         arguments.base_path, tokens, arguments.token_path)
+    logging.info(f'Serving mock Persons API on http://{arguments.host}:'
+                 f'{arguments.port}{arguments.base_path}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
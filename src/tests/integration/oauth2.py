@@ -0,0 +1,152 @@
+"""OAuth2 client credentials tokens shared by concurrent requests"""
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+
+# Lifetime assumed for tokens issued without expires_in
+DEFAULT_EXPIRES_IN = 3600
+
+
+class TokenError(Exception):
+    """The token endpoint did not issue a token"""
+
+
+class TokenManager:
+    """Fetch, cache and refresh a client credentials access token. The token
+    is cached on disk with its expiry, so that consecutive runs reuse it, and
+    refreshed refresh_margin seconds before it expires.
+
+    :param token_api_url: URL of the token endpoint
+    :param client_id: OAuth2 client ID
+    :param client_secret: OAuth2 client secret
+    :param cache_path: path of the token cache file (default: None, tokens
+                       are only cached in memory)
+    :param refresh_margin: seconds before expiry to refresh the token at
+    """
+
+    def __init__(self, token_api_url, client_id, client_secret,
+                 cache_path=None, refresh_margin=60):
+        self.token_api_url = token_api_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.lock = threading.Lock()
+        self.access_token = None
+        self.expires_at = 0
+        self.__load_cache()
+
+    @property
+    def cache_key(self):
+        return f'{self.client_id}@{self.token_api_url}'
+
+    def __read_cache(self):
+        try:
+            with open(self.cache_path) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def __load_cache(self):
+        if not self.cache_path:
+            return
+        cached = self.__read_cache().get(self.cache_key)
+        if cached:
+            self.access_token = cached['access_token']
+            self.expires_at = cached['expires_at']
+
+    def __save_cache(self):
+        """Atomically write the token to the cache file, readable by the
+        owner only. Each process writes its own temporary file, as the
+        processes of sharded runs share the cache."""
+
+        if not self.cache_path:
+            return
+        cache = self.__read_cache()
+        cache[self.cache_key] = {
+            'access_token': self.access_token,
+            'expires_at': self.expires_at
+        }
+        temporary_path = f'{self.cache_path}.{os.getpid()}.tmp'
+        descriptor = os.open(temporary_path,
+                             os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, 'w') as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(temporary_path, self.cache_path)
+
+    def __fetch(self):
+        data = {
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'grant_type': 'client_credentials'
+        }
+        requested = time.time()
+        response = requests.post(url=self.token_api_url, data=data)
+        try:
+            content = response.json()
+            self.access_token = content['access_token']
+        except (KeyError, ValueError):
+            raise TokenError(f'No access token in {response.status_code} '
+                             f'response from {self.token_api_url}')
+        expires_in = float(content.get('expires_in', DEFAULT_EXPIRES_IN))
+        self.expires_at = requested + expires_in
+        logging.debug('Fetched OAuth2 token expiring in %s second(s)',
+                      expires_in)
+        self.__save_cache()
+
+    def token(self):
+        """Get a valid access token, fetching a new one if the current one
+        is missing or about to expire"""
+
+        with self.lock:
+            if (
+                self.access_token is None
+                or time.time() >= self.expires_at - self.refresh_margin
+            ):
+                self.__fetch()
+            return self.access_token
+
+    def invalidate(self, access_token):
+        """Discard a token the API rejected. Tokens already replaced by
+        another worker are ignored, so concurrent rejections refresh the
+        token only once."""
+
+        with self.lock:
+            if access_token == self.access_token:
+                self.access_token = None
+
+
+class OAuth2Auth(requests.auth.AuthBase):
+    """Authenticate requests with the bearer token of a TokenManager and
+    retry a request once with a new token if it is rejected with 401"""
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def __call__(self, request):
+        request.headers['Authorization'] = f'Bearer {self.manager.token()}'
+        request.register_hook('response', self.__retry_unauthorized)
+        return request
+
+    def __retry_unauthorized(self, response, **kwargs):
+        if response.status_code != 401:
+            return response
+
+        rejected_token = response.request.headers['Authorization'].split()[-1]
+        self.manager.invalidate(rejected_token)
+        logging.debug('Retrying %s with a new OAuth2 token', response.url)
+
+        # Read the body to release the connection before sending the retry
+        _ = response.content
+        response.close()
+        retry = response.request.copy()
+        retry.headers['Authorization'] = f'Bearer {self.manager.token()}'
+        retried_response = response.connection.send(retry, **kwargs)
+        retried_response.history.append(response)
+        retried_response.request = retry
+        return retried_response
@@ -0,0 +1,154 @@
+"""Load OpenAPI specifications into frozen, dereferenced models"""
+from collections.abc import Mapping
+import copy
+import hashlib
+import logging
+import os
+import pickle
+
+from deepmerge import always_merger
+import yaml
+
+
+# Bump when the model format changes to invalidate cached models
+MODEL_VERSION = 1
+
+# The C loader of libyaml is much faster but not always installed
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class FrozenDict(Mapping):
+    """Read-only dict which can be shared between threads and pickled"""
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data=()):
+        self._data = dict(data)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f'FrozenDict({self._data!r})'
+
+    def __reduce__(self):
+        return FrozenDict, (self._data,)
+
+
+def freeze(value, frozen=None):
+    """Convert dicts and lists into FrozenDicts and tuples. Objects shared by
+    several parents stay shared."""
+
+    frozen = {} if frozen is None else frozen
+    if id(value) in frozen:
+        return frozen[id(value)]
+    if isinstance(value, dict):
+        result = FrozenDict(
+            (key, freeze(item, frozen)) for key, item in value.items()
+        )
+    elif isinstance(value, list):
+        result = tuple(freeze(item, frozen) for item in value)
+    else:
+        return value
+    frozen[id(value)] = result
+    return result
+
+
+class Dereferencer:
+    """Replace every $ref of a specification with the object it points to
+    and merge every allOf. Circular references are left in place."""
+
+    def __init__(self, openapi):
+        self.openapi = openapi
+        self.resolved = {}
+        self.resolving = set()
+
+    def __locate(self, reference):
+        located = self.openapi
+        for key in reference.split('#/', 1)[1].split('/'):
+            located = located[key]
+        return located
+
+    def __reference(self, reference):
+        if reference not in self.resolved:
+            if reference in self.resolving:
+                logging.debug('Circular reference %s left in place',
+                              reference)
+                return {'$ref': reference}
+            self.resolving.add(reference)
+            self.resolved[reference] = self.resolve(self.__locate(reference))
+            self.resolving.remove(reference)
+        return self.resolved[reference]
+
+    def resolve(self, value):
+        if isinstance(value, list):
+            return [self.resolve(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        if '$ref' in value:
+            resolved = self.__reference(value['$ref'])
+            siblings = {
+                key: self.resolve(item) for key, item in value.items()
+                if key != '$ref'
+            }
+            return {**resolved, **siblings} if siblings else resolved
+        if 'allOf' in value:
+            sub_schemas = [self.resolve(item) for item in value['allOf']]
+            merged = copy.deepcopy(sub_schemas[0])
+            for sub_schema in sub_schemas[1:]:
+                always_merger.merge(merged, copy.deepcopy(sub_schema))
+            for key, item in value.items():
+                if key != 'allOf':
+                    merged[key] = self.resolve(item)
+            return merged
+        return {key: self.resolve(item) for key, item in value.items()}
+
+
+def build_model(openapi):
+    """Dereference and freeze a parsed specification"""
+
+    return freeze(Dereferencer(openapi).resolve(openapi))
+
+
+def load_model(openapi_path, cache_dir=None):
+    """Load the frozen, dereferenced model of a specification file
+
+    :param openapi_path: path of the yaml formatted specification
+    :param cache_dir: directory of cached models, keyed by the hash of the
+                      specification (default: None, no caching)
+    :returns: The model, a FrozenDict
+    """
+
+    with open(openapi_path, 'rb') as openapi_file:
+        source = openapi_file.read()
+
+    cache_path = None
+    if cache_dir:
+        digest = hashlib.sha256(source).hexdigest()
+        cache_path = os.path.join(cache_dir,
+                                  f'openapi-v{MODEL_VERSION}-{digest}.pickle')
+        try:
+            with open(cache_path, 'rb') as cache_file:
+                return pickle.load(cache_file)
+        except FileNotFoundError:
+            pass
+        except (pickle.UnpicklingError, EOFError, AttributeError) as error:
+            logging.warning(f'Ignoring unreadable OpenAPI model cache '
+                            f'{cache_path}: {error}')
+
+    model = build_model(yaml.load(source, Loader=YAML_LOADER))
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as cache_file:
+            pickle.dump(model, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, cache_path)
+    return model
@@ -0,0 +1,200 @@
+"""Run the integration tests sharded across worker processes"""
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import time
+import unittest
+
+import image_check
+import timing
+
+
+def setup_processes(config, processes=None):
+    """Setup number of test processes from configuration file"""
+
+    if processes is None:
+        processes = config.get('concurrency', {}).get('processes', 1)
+    return max(processes, 1)
+
+
+def _describe(test):
+    """Name of a test method, including the parameters of a subtest"""
+
+    if hasattr(test, 'test_case'):
+        return f'{test.test_case._testMethodName} {test._subDescription()}'
+    return getattr(test, '_testMethodName', test.id())
+
+
+def run_shard(test_case_class, setup_arguments, test_names, shard_index,
+              shard_count, log_level):
+    """Run the tests of one shard in a worker process
+
+    :param test_case_class: UtilsTestCase subclass with a setup classmethod
+    :param setup_arguments: dict of keyword arguments of setup
+    :param test_names: names of the test methods to run, all if empty
+    :param shard_index: index of this shard
+    :param shard_count: number of shards
+    :param log_level: logging level of the worker process
+    :returns: A dict of test outcomes, failures, errors, timings, image
+              statistics and connection, validation, check, response cache
+              and event log counts which can be pickled
+    """
+
+    logging.basicConfig(level=log_level)
+    test_case_class.setup(**setup_arguments)
+    test_case_class.shard_index = shard_index
+    test_case_class.shard_count = shard_count
+    if test_case_class.event_log is not None:
+        test_case_class.event_log.shard = shard_index
+    timing.connection_stats.reset()
+
+    loader = unittest.TestLoader()
+    if test_names:
+        suite = unittest.TestSuite(
+            test_case_class(name) for name in test_names
+        )
+    else:
+        suite = loader.loadTestsFromTestCase(test_case_class)
+    # Suites release their tests once they have run
+    tests = [test._testMethodName for test in suite]
+    result = unittest.TestResult()
+    suite.run(result)
+    events = 0
+    if test_case_class.event_log is not None:
+        test_case_class.event_log.close()
+        events = test_case_class.event_log.count
+
+    failed = defaultdict(list)
+    for kind, problems in (('FAIL', result.failures),
+                           ('ERROR', result.errors)):
+        for test, traceback in problems:
+            name = _describe(test)
+            failed[name.split(' ', 1)[0]].append((kind, name, traceback))
+    return {
+        'shard': shard_index,
+        'tests': tests,
+        'skipped': [_describe(test) for test, _ in result.skipped],
+        'failed': dict(failed),
+        'timings': test_case_class.timings.to_dict(),
+        'connections': dict(timing.connection_stats.counts),
+        'validation': dict(test_case_class.validation.counts),
+        'checks': dict(test_case_class.check_cache.counts),
+        'response_cache': dict(
+            getattr(test_case_class.response_cache, 'counts', {})
+        ),
+        'images': test_case_class.image_stats.to_dict(),
+        'events': events
+    }
+
+
+def format_results(results, elapsed, verbose=False):
+    """Merge the results of every shard into one unittest style report
+
+    :returns: A tuple of the report and whether every test passed
+    """
+
+    tests = []
+    for result in results:
+        tests.extend(name for name in result['tests'] if name not in tests)
+    failed = defaultdict(list)
+    for result in results:
+        for name, problems in result['failed'].items():
+            for kind, description, traceback in problems:
+                failed[name].append((kind, description, result['shard'],
+                                     traceback))
+    # Class fixtures such as tearDownClass fail outside of test methods
+    reported = tests + [name for name in failed if name not in tests]
+    skipped = {name for result in results for name in result['skipped']}
+
+    lines = []
+    if verbose:
+        for name in tests:
+            kinds = {kind for kind, *_ in failed.get(name, [])}
+            status = 'ERROR' if 'ERROR' in kinds else (
+                'FAIL' if kinds else 'ok'
+            )
+            lines.append(f'{name} ... {status}')
+        lines.append('')
+
+    for name in reported:
+        for kind, description, shard, traceback in failed.get(name, []):
+            lines.extend([
+                '=' * 70,
+                f'{kind}: {description} [shard {shard}]',
+                '-' * 70,
+                traceback
+            ])
+
+    failures = sum(
+        kind == 'FAIL' for problems in failed.values()
+        for kind, *_ in problems
+    )
+    errors = len([problem for problems in failed.values()
+                  for problem in problems]) - failures
+    lines.extend([
+        '-' * 70,
+        f'Ran {len(tests)} test(s) in {elapsed:.3f}s across {len(results)} '
+        'process(es)',
+        ''
+    ])
+    details = [f'failures={failures}', f'errors={errors}'] if failed else []
+    if skipped:
+        details.append(f'skipped={len(skipped)}')
+    status = 'FAILED' if failed else 'OK'
+    lines.append(f'{status} ({", ".join(details)})' if details else status)
+    return '\n'.join(lines), not failed
+
+
+def run_parallel(test_case_class, setup_arguments, processes, argv):
+    """Run the tests of a test case class sharded across processes. Each
+    process runs every selected test method on its share of the requested
+    endpoints with its own session, appending to the same event log.
+    Timings, image statistics, connection, validation, check, response
+    cache and event log counts of the shards are merged into the class
+    attributes of test_case_class, which must have been set up in this
+    process.
+
+    :param setup_arguments: dict of keyword arguments of setup
+    :param processes: number of worker processes
+    :param argv: unittest command-line arguments, only test method names and
+                 -v are supported
+    :returns: Whether every test passed
+    """
+
+    test_names = [
+        name.rsplit('.', 1)[-1] for name in argv[1:]
+        if not name.startswith('-')
+    ]
+    verbose = '-v' in argv or '--verbose' in argv
+    log_level = logging.getLogger().getEffectiveLevel()
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [
+            executor.submit(run_shard, test_case_class, setup_arguments,
+                            test_names, shard_index, processes, log_level)
+            for shard_index in range(processes)
+        ]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        test_case_class.timings.merge(
+            timing.TimingRecorder.from_dict(result['timings'])
+        )
+        timing.connection_stats.counts.update(result['connections'])
+        test_case_class.validation.counts.update(result['validation'])
+        test_case_class.check_cache.counts.update(result['checks'])
+        if test_case_class.response_cache is not None:
+            test_case_class.response_cache.counts.update(
+                result['response_cache']
+            )
+        test_case_class.image_stats.merge(
+            image_check.ImageStats.from_dict(result['images'])
+        )
+        if test_case_class.event_log is not None:
+            test_case_class.event_log.count += result['events']
+
+    report, successful = format_results(results, elapsed, verbose)
+    print(report)
+    return successful
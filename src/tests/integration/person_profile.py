@@ -0,0 +1,217 @@
+"""Benchmark fetching the full profile of a person, as a page load does"""
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+import requests
+
+import sweep
+import timing
+import utils
+
+
+# Endpoints of a profile, names of sweep.ENDPOINTS
+PROFILE_ENDPOINTS = ('persons', 'jobs', 'meal-plans', 'addresses', 'phones',
+                     'emails', 'medical')
+# DAO in src/db/oracledb answering each endpoint. Every sub-resource also
+# looks the person up with persons-dao first.
+DAOS = {
+    'persons': 'persons-dao',
+    'jobs': 'jobs-dao',
+    'meal-plans': 'meal-plans-dao',
+    'addresses': 'addresses-dao',
+    'phones': 'phones-dao',
+    'emails': 'emails-dao',
+    'medical': 'medical-dao'
+}
+
+
+class ProfileStats:
+    """Latencies of profile fetches, of their endpoints and how often each
+    endpoint was the critical path, the last one to respond. Network
+    latencies and the time the harness spent validating are kept apart, so
+    the validation does not count as latency of the API."""
+
+    def __init__(self):
+        self.profiles = timing.LatencyHistogram()
+        self.network = timing.LatencyHistogram()
+        self.endpoints = defaultdict(timing.LatencyHistogram)
+        self.validation = timing.LatencyHistogram()
+        self.endpoint_validation = defaultdict(timing.LatencyHistogram)
+        self.critical = Counter()
+        self.failures = []
+
+    def record(self, elapsed, latencies, validation):
+        """Record a profile fetch
+
+        :param elapsed: seconds from the first request until every response
+                        was received and validated
+        :param latencies: dict of endpoint names and the seconds until
+                          their response was received
+        :param validation: dict of endpoint names and the seconds spent
+                           validating their response
+        """
+
+        self.profiles.add(elapsed)
+        self.network.add(max(latencies.values()))
+        self.validation.add(sum(validation.values()))
+        for name, latency in latencies.items():
+            self.endpoints[name].add(latency)
+            self.endpoint_validation[name].add(validation[name])
+        self.critical[max(latencies, key=latencies.get)] += 1
+
+    def format_report(self):
+        profiles = self.profiles
+        if not profiles.count:
+            return 'Person profile: no profile fetched'
+        network = self.network
+        serial = sum(histogram.percentile(50)
+                     for histogram in self.endpoints.values())
+        lines = [
+            f'Person profile: {profiles.count} fetch(es), network p50 '
+            f'{network.percentile(50):.3f}s, p95 '
+            f'{network.percentile(95):.3f}s, max {network.max:.3f}s '
+            f'(sum of endpoint p50s {serial:.3f}s)',
+            f'With validation: p50 {profiles.percentile(50):.3f}s, p95 '
+            f'{profiles.percentile(95):.3f}s, max {profiles.max:.3f}s '
+            f'(validation p50 {self.validation.percentile(50):.3f}s)'
+        ]
+        header = (f'{"endpoint":<12} {"dao":<16} {"p50":>7} {"p95":>7} '
+                  f'{"max":>7} {"critical":>9} {"validation":>10}')
+        lines.extend([header, '-' * len(header)])
+        for name in sorted(self.endpoints,
+                           key=lambda name: -self.critical[name]):
+            histogram = self.endpoints[name]
+            share = self.critical[name] / profiles.count
+            lines.append(
+                f'{name:<12} {DAOS.get(name, "-"):<16} '
+                f'{histogram.percentile(50):>7.3f} '
+                f'{histogram.percentile(95):>7.3f} {histogram.max:>7.3f} '
+                f'{share:>9.0%} '
+                f'{self.endpoint_validation[name].percentile(50):>10.3f}'
+            )
+        return '\n'.join(lines)
+
+
+class ProfileBenchmark:
+    """Fetch the endpoints of a profile concurrently, one profile at a time,
+    and validate every response with check_schema once all of them were
+    received, so validating does not hold up the timing of other requests
+
+    :param checker: UtilsTestCase instance used to request and validate
+    :param endpoints: names of sweep.ENDPOINTS fetched for each profile
+    """
+
+    def __init__(self, checker, endpoints=PROFILE_ENDPOINTS):
+        self.checker = checker
+        self.endpoints = {name: sweep.ENDPOINTS[name] for name in endpoints}
+        self.executor = ThreadPoolExecutor(max_workers=len(self.endpoints))
+
+    def __request(self, osu_id, name, started):
+        suffix, _, max_elapsed_seconds = self.endpoints[name]
+        response = self.checker.make_request(
+            f'/persons/{osu_id}{suffix}', 200,
+            max_elapsed_seconds=max_elapsed_seconds,
+            validated=True
+        )
+        return response, time.perf_counter() - started
+
+    def __validate(self, name, response):
+        validation_started = time.perf_counter()
+        schema = self.checker.get_compiled_schema(self.endpoints[name][1])
+        with self.checker.logged_validation(response):
+            self.checker.check_schema(response, schema,
+                                      schema.nullable_fields)
+        return time.perf_counter() - validation_started
+
+    def fetch(self, osu_id):
+        """Fetch and validate the profile of a person
+
+        :returns: A tuple of the seconds the whole profile took, including
+                  validation, a dict of the seconds each endpoint took to
+                  respond and a dict of the seconds spent validating each
+                  response, or None if an endpoint failed
+        """
+
+        started = time.perf_counter()
+        futures = {
+            name: self.executor.submit(self.__request, osu_id, name, started)
+            for name in self.endpoints
+        }
+        responses = {}
+        latencies = {}
+        validation = {}
+        failed = False
+        for name, future in futures.items():
+            try:
+                responses[name], latencies[name] = future.result()
+            except (
+                self.checker.failureException,
+                requests.exceptions.RequestException
+            ) as error:
+                logging.error(f'Profile of {osu_id}: {name} failed: {error}')
+                failed = True
+        for name, response in responses.items():
+            try:
+                validation[name] = self.__validate(name, response)
+            except self.checker.failureException as error:
+                logging.error(f'Profile of {osu_id}: {name} failed: {error}')
+                failed = True
+        elapsed = time.perf_counter() - started
+        return None if failed else (elapsed, latencies, validation)
+
+    def run(self, osu_ids, rounds=5, warmup_rounds=1):
+        """Fetch the profile of every person rounds times after some
+        unrecorded warmup rounds, which open the connections
+
+        :returns: ProfileStats of the recorded rounds
+        """
+
+        stats = ProfileStats()
+        for round_index in range(warmup_rounds + rounds):
+            for osu_id in osu_ids:
+                result = self.fetch(osu_id)
+                if result is None:
+                    stats.failures.append(osu_id)
+                elif round_index >= warmup_rounds:
+                    stats.record(*result)
+        return stats
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def run_profile_benchmark(checker, rounds=None):
+    """Run the profile benchmark over the valid person IDs of the test cases
+    from the person_profile section of the configuration file of a checker.
+    A rounds argument overrides the configured one.
+
+    :returns: Whether every profile was fetched without failures
+    """
+
+    profile_config = checker.config.get('person_profile', {})
+    rounds = rounds or profile_config.get('rounds', 5)
+    endpoints = profile_config.get('endpoints', PROFILE_ENDPOINTS)
+    osu_ids = [
+        person['osu_id'] for person in checker.test_cases['valid_person_ids']
+    ]
+
+    # Cached responses would hide the cost of a page load
+    checker.response_cache = None
+    # Every endpoint of a profile needs its own pooled connection
+    checker.session.close()
+    checker.session = utils.setup_session(checker.config,
+                                          pool_maxsize=len(endpoints))
+
+    benchmark = ProfileBenchmark(checker, endpoints)
+    try:
+        stats = benchmark.run(osu_ids, rounds,
+                              profile_config.get('warmup_rounds', 1))
+    finally:
+        benchmark.close()
+
+    print(stats.format_report())
+    if stats.failures:
+        logging.error(f'{len(stats.failures)} profile fetch(es) failed')
+    return not stats.failures
@@ -0,0 +1,148 @@
+"""Sampling profiler attributing the time of the harness to its activities"""
+from collections import Counter
+import os
+import sys
+import threading
+import time
+
+
+# Activities samples are attributed to, in report order
+CATEGORIES = ('network', 'json', 'validation', 'url_check', 'logging',
+              'harness')
+
+NETWORK_PATHS = tuple(
+    os.path.join('', name, '') for name in ('requests', 'urllib3', 'httpx',
+                                            'h2', 'http')
+) + ('socket.py', 'ssl.py', 'selectors.py', 'http2_adapter.py')
+JSON_PATHS = (os.path.join('', 'json', ''), 'json_stream.py')
+VALIDATION_PATHS = ('schema_compiler.py', 'format_validators.py',
+                    'validation_policy.py')
+VALIDATION_FUNCTIONS = ('check_schema', 'check_schema_stream',
+                        '__check_attributes_schema', '__check_resource_schema',
+                        '__validate_format')
+IDLE_PATHS = ('threading.py', 'queue.py')
+# Functions of pool threads waiting for work
+IDLE_FUNCTIONS = (('thread.py', '_worker'), ('process.py', '_process_worker'))
+
+
+def categorize(frames):
+    """Attribute a stack to an activity by its innermost recognised frame
+
+    :param frames: list of (filename, function) tuples, innermost first
+    :returns: A category, or None if the thread is idle
+    """
+
+    if frames:
+        filename, function = frames[0]
+        if filename.endswith(IDLE_PATHS) or any(
+            filename.endswith(path) and function == idle_function
+            for path, idle_function in IDLE_FUNCTIONS
+        ):
+            return None
+    for filename, function in frames:
+        if os.path.join('', 'logging', '') in filename:
+            return 'logging'
+        if (
+            any(path in filename for path in JSON_PATHS)
+            or function == 'decode_json'
+        ):
+            return 'json'
+        if any(path in filename for path in NETWORK_PATHS):
+            return 'network'
+        if function in ('check_url', 'link_base_url'):
+            return 'url_check'
+        if (
+            filename.endswith(VALIDATION_PATHS)
+            or function in VALIDATION_FUNCTIONS
+        ):
+            return 'validation'
+    return 'harness'
+
+
+def _frame_name(filename, function):
+    module = os.path.splitext(os.path.basename(filename))[0]
+    return f'{module}:{function}'
+
+
+class SamplingProfiler:
+    """Sample the stacks of every thread at a fixed interval. Each sample is
+    weighted by the time since the previous one, as the sampling thread may
+    wait for the GIL longer than the interval. Samples of threads waiting for
+    work are discarded, so categories add up to the time threads spent busy
+    or blocked on the network.
+
+    :param interval: seconds between samples
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.functions = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.__run, daemon=True,
+                                       name='SamplingProfiler')
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def __run(self):
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.sample(frame, now - last)
+            last = now
+
+    def sample(self, frame, seconds):
+        """Record the stack of a frame as having run for some seconds"""
+
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append((code.co_filename, code.co_name))
+            frame = frame.f_back
+
+        category = categorize(frames)
+        if category is None:
+            return
+        names = [_frame_name(*frame) for frame in reversed(frames)]
+        self.samples += 1
+        self.stacks[(category, *names)] += seconds
+        self.categories[category] += seconds
+        self.functions[names[-1]] += seconds
+
+    def write_collapsed(self, path):
+        """Write the samples in the collapsed stack format of flamegraph.pl
+        and speedscope, rooted at their category, weighted in
+        microseconds"""
+
+        with open(path, 'w') as collapsed_file:
+            for stack, seconds in sorted(self.stacks.items()):
+                microseconds = round(seconds * 1e6)
+                if microseconds:
+                    collapsed_file.write(f'{";".join(stack)} {microseconds}\n')
+
+    def summary(self, top=10):
+        """Human readable time per category and the functions with the most
+        samples, in thread-seconds"""
+
+        total = sum(self.categories.values())
+        lines = [f'Profile: {self.samples} sample(s) of busy threads, '
+                 f'{total:.2f} thread-second(s)']
+        for category in CATEGORIES:
+            seconds = self.categories[category]
+            share = seconds / total if total else 0
+            lines.append(f'  {category:<12} {seconds:>8.2f}s {share:>6.1%}')
+        lines.append('Top functions:')
+        for function, seconds in self.functions.most_common(top):
+            lines.append(f'  {seconds:>8.2f}s {function}')
+        return '\n'.join(lines)
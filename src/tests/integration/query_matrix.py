@@ -0,0 +1,187 @@
+"""Combinations of query parameters and deduplicated checks"""
+from collections import Counter
+from concurrent.futures import Future
+import itertools
+import logging
+import threading
+
+
+MODES = ('single', 'pairwise', 'full')
+
+
+def canonical(params):
+    """Key of query parameters which is equal for identical requests.
+    Values are compared as they are sent, e.g. 5 and '5' are the same."""
+
+    return tuple(sorted((name, str(value)) for name, value in params.items()))
+
+
+def pairwise(parameters):
+    """Greedily build combinations covering every pair of values of every
+    two parameters in few requests
+
+    :param parameters: list of (name, values) tuples
+    :returns: A list of dicts of parameter values
+    """
+
+    names = [name for name, _ in parameters]
+    values = dict(parameters)
+    uncovered = {
+        ((first, first_value), (second, second_value))
+        for first, second in itertools.combinations(names, 2)
+        for first_value in values[first]
+        for second_value in values[second]
+    }
+
+    def covered(combination, name, value):
+        return sum(
+            ((other, combination[other]), (name, value)) in uncovered
+            if names.index(other) < names.index(name)
+            else ((name, value), (other, combination[other])) in uncovered
+            for other in combination
+        )
+
+    combinations = []
+    while uncovered:
+        # Start from an uncovered pair, then pick the value of each other
+        # parameter covering the most pairs left
+        (first, first_value), (second, second_value) = min(uncovered,
+                                                           key=repr)
+        combination = {first: first_value, second: second_value}
+        for name in names:
+            if name not in combination:
+                combination[name] = max(
+                    values[name],
+                    key=lambda value: covered(combination, name, value)
+                )
+        uncovered -= {
+            ((first, combination[first]), (second, combination[second]))
+            for first, second in itertools.combinations(names, 2)
+        }
+        combinations.append({name: combination[name] for name in names})
+    return combinations
+
+
+class QueryMatrix:
+    """Expand the query parameters of an endpoint into the requests checking
+    them
+
+    :param mode: 'single' requests every valid and invalid value alone,
+                 'pairwise' also combines valid values of different
+                 parameters so every pair of them is requested together and
+                 'full' requests every combination of valid values
+    :param max_combinations: combinations requested at most per endpoint by
+                             the full mode, which falls back to pairwise
+                             beyond it
+    """
+
+    def __init__(self, mode='single', max_combinations=256):
+        if mode not in MODES:
+            raise ValueError(f'Unknown query matrix mode {mode!r}, '
+                             f'expected one of {MODES}')
+        self.mode = mode
+        self.max_combinations = max_combinations
+
+    @classmethod
+    def from_config(cls, config, mode=None):
+        """Create a matrix from the query_matrix section of the
+        configuration file. A mode argument overrides the configured one."""
+
+        matrix = dict(config.get('query_matrix', {}))
+        if mode is not None:
+            matrix['mode'] = mode
+        return cls(**matrix)
+
+    def combinations(self, query_params):
+        """Combinations of the valid values of two or more parameters"""
+
+        parameters = [
+            (name, values['valid']) for name, values in query_params.items()
+            if values.get('valid')
+        ]
+        if self.mode == 'single' or len(parameters) < 2:
+            return []
+
+        if self.mode == 'full':
+            count = 1
+            for _, values in parameters:
+                count *= len(values)
+            if count <= self.max_combinations:
+                return [
+                    dict(zip(dict(parameters), combination))
+                    for combination in itertools.product(
+                        *(values for _, values in parameters)
+                    )
+                ]
+            logging.warning(f'{count} combinations of '
+                            f'{", ".join(dict(parameters))} exceed '
+                            f'max_combinations, requesting them pairwise')
+        return pairwise(parameters)
+
+    def expand(self, query_params):
+        """Expand a query_params section of the configuration file
+
+        :param query_params: dict of parameters and their valid and invalid
+                             values
+        :returns: A list of (params, expected status code) tuples without
+                  duplicate requests
+        """
+
+        expanded = []
+        for name, values in query_params.items():
+            expanded.extend(({name: value}, 200) for value in values['valid'])
+            expanded.extend(
+                ({name: value}, 400) for value in values.get('invalid', [])
+            )
+        expanded.extend(
+            (combination, 200)
+            for combination in self.combinations(query_params)
+        )
+
+        seen = set()
+        unique = []
+        for params, status_code in expanded:
+            key = canonical(params)
+            if key not in seen:
+                seen.add(key)
+                unique.append((params, status_code))
+        return unique
+
+
+class CheckCache:
+    """Share the outcome of identical checks of a run, so each is only
+    requested once. Checks of the same key running concurrently wait for
+    the first one."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.counts = Counter()
+
+    def run(self, key, check, **kwargs):
+        """Run a check unless one with the same key already ran
+
+        :returns: The result of the check
+        :raises: The exception the check raised
+        """
+
+        with self.lock:
+            future = self.futures.get(key)
+            owner = future is None
+            if owner:
+                future = self.futures[key] = Future()
+            self.counts['checks' if owner else 'reused'] += 1
+
+        if owner:
+            try:
+                future.set_result(check(**kwargs))
+            except BaseException as error:
+                future.set_exception(error)
+                raise
+        return future.result()
+
+    def summary(self):
+        """Human readable summary of the checks"""
+
+        return (f'Checks: {self.counts["checks"]} requested, '
+                f'{self.counts["reused"]} identical check(s) reused')
@@ -0,0 +1,382 @@
+"""Replay the requests of an access log against the API at their recorded
+pace"""
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import hashlib
+import json
+import logging
+import re
+import sys
+import threading
+import time
+import urllib.parse
+
+import requests
+
+import event_log
+import load_test
+import timing
+import utils
+
+
+# How the OSU IDs of recorded requests are replayed: replaced by a test
+# person chosen by a keyed hash, replaced by the id_map or sent as recorded
+ID_MODES = ('scrub', 'map', 'keep')
+# Request line and time of the common and combined log formats, e.g.
+# 127.0.0.1 - - [10/Oct/2024:13:55:36 -0700] "GET /v2/persons/1 HTTP/1.1" 200
+LOG_LINE = re.compile(r'\[(?P<time>[^\]]+)\] "(?P<method>[A-Z]+) '
+                      r'(?P<target>\S+)[^"]*"')
+LOG_TIME_FORMAT = '%d/%b/%Y:%H:%M:%S %z'
+
+LogEntry = namedtuple('LogEntry', ['timestamp', 'method', 'path', 'params'])
+
+
+def parse_timestamp(value):
+    """Seconds since the epoch of a number or ISO 8601 timestamp"""
+
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def parse_line(line):
+    """Parse an access log line, either a JSON object with a timestamp (or
+    time), method, path (or endpoint) and query (or params) as a string or
+    object, or a common log format line
+
+    :returns: A LogEntry, or None for blank lines and comments
+    :raises ValueError: if the line is malformed
+    """
+
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('{'):
+        record = json.loads(line)
+        timestamp = parse_timestamp(record.get('timestamp',
+                                               record.get('time')))
+        method = record.get('method', 'GET')
+        target = record.get('path', record.get('endpoint'))
+        query = record.get('query', record.get('params'))
+    else:
+        match = LOG_LINE.search(line)
+        if match is None:
+            raise ValueError('not a common log format line')
+        timestamp = datetime.strptime(match['time'],
+                                      LOG_TIME_FORMAT).timestamp()
+        method, target, query = match['method'], match['target'], None
+
+    path, _, query_string = target.partition('?')
+    params = dict(urllib.parse.parse_qsl(query_string,
+                                         keep_blank_values=True))
+    if isinstance(query, str):
+        params.update(urllib.parse.parse_qsl(query.lstrip('?'),
+                                             keep_blank_values=True))
+    elif query:
+        params.update(query)
+    return LogEntry(timestamp, method.upper(), path, params or None)
+
+
+def read_access_log(path, counts):
+    """Lazily read the entries of an access log, counting and skipping
+    malformed lines
+
+    :param path: path of the file, - for standard input
+    :param counts: Counter of skipped lines by reason
+    :returns: A generator of LogEntry
+    """
+
+    log_file = sys.stdin if path == '-' else open(path)
+    try:
+        for number, line in enumerate(log_file, start=1):
+            try:
+                entry = parse_line(line)
+            except (ValueError, TypeError, AttributeError) as error:
+                logging.debug('Skipped line %s of %s: %s', number, path,
+                              error)
+                counts['malformed'] += 1
+                continue
+            if entry is not None:
+                yield entry
+    finally:
+        if log_file is not sys.stdin:
+            log_file.close()
+
+
+def test_people(test_cases):
+    """Path parameters of the valid people of the test cases, e.g.
+    {'osuId': '931234567', 'jobId': 'C12345-00', 'mealPlanId': '1'}"""
+
+    people = {}
+    for person in test_cases['valid_person_ids']:
+        people[person['osu_id']] = {'osuId': person['osu_id'],
+                                    'jobId': person['job_id']}
+    for meal_plan in test_cases.get('valid_meal_plan_ids', []):
+        person = people.setdefault(meal_plan['osu_id'],
+                                   {'osuId': meal_plan['osu_id']})
+        person['mealPlanId'] = meal_plan['meal_plan_id']
+    return list(people.values())
+
+
+class IdMapper:
+    """Replace the path parameters of recorded requests, so production IDs
+    are not replayed. Each recorded OSU ID becomes one test person, and the
+    other path parameters, e.g. job and meal plan IDs, become those of that
+    person when they are known.
+
+    :param mode: one of ID_MODES
+    :param people: dicts of the path parameters of test people
+    :param id_map: dict of recorded OSU IDs and their replacements
+    :param seed: key of the hash choosing the test person of an OSU ID,
+                 different seeds spread recorded people differently
+    """
+
+    def __init__(self, mode='scrub', people=(), id_map=None, seed=None):
+        if mode not in ID_MODES:
+            raise ValueError(f'Unknown ID mode {mode!r}, expected one of '
+                             f'{ID_MODES}')
+        if mode == 'scrub' and not people:
+            raise ValueError('Scrubbing IDs requires test people')
+        self.mode = mode
+        self.people = list(people)
+        self.by_osu_id = {person['osuId']: person for person in self.people}
+        self.id_map = id_map or {}
+        self.seed = seed
+
+    def person(self, osu_id):
+        """Path parameters replacing those of a recorded OSU ID, None if it
+        is not replayed"""
+
+        if self.mode == 'map':
+            mapped = self.id_map.get(osu_id)
+            if mapped is None:
+                return None
+            return self.by_osu_id.get(mapped, {'osuId': mapped})
+        digest = hashlib.sha256(f'{self.seed}:{osu_id}'.encode()).digest()
+        return self.people[int.from_bytes(digest[:8], 'big')
+                           % len(self.people)]
+
+    def rewrite(self, template, path):
+        """Rewrite the path of a recorded request to a route template
+
+        :returns: The rewritten path, or None if it is not replayed
+        """
+
+        if self.mode == 'keep' or '{osuId}' not in template:
+            return path
+        names = template.split('/')
+        values = path.split('/')
+        person = self.person(values[names.index('{osuId}')])
+        if person is None:
+            return None
+        return '/'.join(
+            person.get(name[1:-1], value) if name.startswith('{') else value
+            for name, value in zip(names, values)
+        )
+
+
+class Replay:
+    """Send the GET requests of an access log at their recorded pace, or
+    faster, without waiting for responses. Like open-loop load tests,
+    latency is measured from the intended send time.
+
+    :param checker: UtilsTestCase instance whose session, routes, timings
+                    and event log are used
+    :param entries: iterable of LogEntry in recorded order
+    :param mapper: IdMapper of the recorded IDs
+    :param speed: factor the recorded pace is accelerated by (default: 1)
+    :param max_in_flight: requests sent concurrently at most, later ones
+                          wait and their wait counts in their latency
+    :param duration: seconds of replay after which the rest of the log is
+                     left out (default: None, the whole log)
+    :param prefixes: base paths stripped from recorded paths, e.g. '/v2'
+    :param skipped: Counter of entries skipped by reason, shared with the
+                    reader of the entries (default: None, a new Counter)
+    """
+
+    def __init__(self, checker, entries, mapper, speed=1, max_in_flight=64,
+                 duration=None, prefixes=(), skipped=None):
+        if speed <= 0:
+            raise ValueError(f'Replay speed must be positive, got {speed}')
+        self.checker = checker
+        self.entries = entries
+        self.mapper = mapper
+        self.speed = speed
+        self.max_in_flight = max_in_flight
+        self.duration = duration
+        # Longest first, so /api/v2 is stripped rather than /api
+        self.prefixes = sorted(prefixes, key=len, reverse=True)
+        self.paths = checker.openapi['paths']
+        self.stats = load_test.LoadStats()
+        self.send_lag = timing.LatencyHistogram()
+        self.skipped = Counter() if skipped is None else skipped
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.in_flight_by_template = defaultdict(int)
+        self.peak_by_template = Counter()
+
+    def __endpoint(self, entry):
+        """Get the route template and rewritten path of an entry, or None
+        if it is not replayed"""
+
+        if entry.method != 'GET':
+            self.skipped['not GET'] += 1
+            return None
+        path = entry.path
+        for prefix in self.prefixes:
+            if path.startswith(f'{prefix}/'):
+                path = path[len(prefix):]
+                break
+        template = self.checker.get_route_template(path)
+        if 'get' not in self.paths.get(template, {}):
+            self.skipped['unknown route'] += 1
+            return None
+        endpoint = self.mapper.rewrite(template, path)
+        if endpoint is None:
+            self.skipped['unmapped ID'] += 1
+            return None
+        return template, endpoint
+
+    def schedule(self):
+        """Offsets in seconds from the start of the replay of the replayed
+        entries
+
+        :returns: A generator of (offset, template, endpoint, params)
+        """
+
+        first = None
+        for entry in self.entries:
+            request = self.__endpoint(entry)
+            if request is None:
+                continue
+            if first is None:
+                first = entry.timestamp
+            offset = (entry.timestamp - first) / self.speed
+            if self.duration is not None and offset >= self.duration:
+                return
+            yield (max(offset, 0), *request, entry.params)
+
+    def __send(self, template, endpoint, params, intended):
+        with self.lock:
+            self.in_flight += 1
+            self.in_flight_by_template[template] += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.peak_by_template[template] = max(
+                self.peak_by_template[template],
+                self.in_flight_by_template[template]
+            )
+            self.send_lag.add(time.monotonic() - intended)
+
+        checker = self.checker
+        timing.start_phases()
+        start = time.perf_counter()
+        try:
+            response = checker.session.get(f'{checker.base_url}{endpoint}',
+                                           params=params)
+            status = response.status_code
+            phases = timing.response_phases(response,
+                                            time.perf_counter() - start,
+                                            timing.collect_phases())
+            if checker.timings is not None:
+                checker.timings.record(template, params, phases)
+            if checker.event_log is not None:
+                checker.event_log.emit(event_log.request_event(
+                    'GET', template, endpoint, params, response, phases,
+                    len(response.content)
+                ))
+        except requests.exceptions.RequestException as error:
+            status = type(error).__name__
+        self.stats.record(template, status, time.monotonic() - intended)
+
+        with self.lock:
+            self.in_flight -= 1
+            self.in_flight_by_template[template] -= 1
+
+    def run(self):
+        """Replay the log and return the statistics of the requests"""
+
+        logging.info(f'Replaying at {self.speed}x with at most '
+                     f'{self.max_in_flight} request(s) in flight')
+        start = time.monotonic()
+        self.stats.started = start
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            for offset, template, endpoint, params in self.schedule():
+                intended = start + offset
+                delay = intended - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.__send, template, endpoint, params,
+                                intended)
+        self.stats.finished = time.monotonic()
+        return self.stats
+
+    def summary(self):
+        """Human readable summary of the replay"""
+
+        replayed = sum(len(latencies)
+                       for latencies in self.stats.latencies.values())
+        skipped = ', '.join(f'{count} {reason}'
+                            for reason, count in sorted(self.skipped.items()))
+        peaks = ', '.join(f'{template} {peak}' for template, peak
+                          in self.peak_by_template.most_common(3))
+        return (f'Replayed {replayed} request(s) at {self.speed}x, skipped '
+                f'{skipped or "none"}\nPeak {self.peak_in_flight} request(s)'
+                f' in flight ({peaks or "-"}), send lag p99 '
+                f'{self.send_lag.percentile(99) or 0:.3f}s max '
+                f'{self.send_lag.max or 0:.3f}s')
+
+
+def base_paths(config):
+    """Base paths of the configured API URLs, e.g. '/v2' and '/api/v2'"""
+
+    paths = {
+        urllib.parse.urlsplit(url).path.rstrip('/')
+        for url in config.get('api', {}).values()
+    }
+    return [path for path in paths if path]
+
+
+def run_replay(checker, log_path, speed=None, duration=None):
+    """Replay an access log from the replay section of the configuration
+    file of a checker. Arguments override the configured values.
+
+    :returns: Whether every request was answered without a server error
+    """
+
+    replay_config = checker.config.get('replay', {})
+    try:
+        mapper = IdMapper(replay_config.get('ids', 'scrub'),
+                          test_people(checker.test_cases),
+                          replay_config.get('id_map'),
+                          replay_config.get('seed'))
+    except ValueError as error:
+        sys.exit(f'Error: {error}')
+
+    # Every request in flight needs its own pooled connection
+    max_in_flight = replay_config.get('max_in_flight', 64)
+    checker.session.close()
+    checker.session = utils.setup_session(checker.config,
+                                          pool_maxsize=max_in_flight)
+
+    skipped = Counter()
+    replay = Replay(checker,
+                    read_access_log(log_path, skipped),
+                    mapper,
+                    speed=speed or replay_config.get('speed', 1),
+                    max_in_flight=max_in_flight,
+                    duration=duration or replay_config.get('duration_seconds'),
+                    prefixes=replay_config.get('prefixes',
+                                               base_paths(checker.config)),
+                    skipped=skipped)
+    stats = replay.run()
+
+    print(load_test.format_report(stats.report()))
+    print(replay.summary())
+    return not any(
+        not isinstance(status, int) or status >= 500
+        for statuses in stats.status_codes.values()
+        for status in statuses
+    )
@@ -0,0 +1,107 @@
+"""In-run cache of responses, revalidated with ETags"""
+from collections import Counter, OrderedDict
+import copy
+import threading
+
+import query_matrix
+
+
+MODES = ('cold', 'warm')
+
+
+class ResponseCache:
+    """Size-bounded LRU cache of successful responses by URL and parameters
+
+    :param max_entries: responses kept at most, the least recently used
+                        response is evicted beyond it
+    :param revalidate: request cached responses which have an ETag again
+                       with If-None-Match and reuse them when the server
+                       answers 304 Not Modified. Other cached responses are
+                       reused without a request.
+    """
+
+    def __init__(self, max_entries=256, revalidate=True):
+        self.max_entries = max_entries
+        self.revalidate = revalidate
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.counts = Counter()
+
+    @classmethod
+    def from_config(cls, config, mode=None):
+        """Create a cache from the response_cache section of the
+        configuration file. A mode argument overrides the configured one.
+
+        :returns: The cache, or None in cold mode
+        """
+
+        options = dict(config.get('response_cache', {}))
+        configured_mode = options.pop('mode', 'cold')
+        mode = mode or configured_mode
+        if mode not in MODES:
+            raise ValueError(f'Unknown response cache mode {mode!r}, '
+                             f'expected one of {MODES}')
+        return cls(**options) if mode == 'warm' else None
+
+    @staticmethod
+    def key(url, params=None):
+        return url, query_matrix.canonical(params or {})
+
+    def get(self, key):
+        """Get a cached response, None if there is none"""
+
+        with self.lock:
+            response = self.entries.get(key)
+            if response is None:
+                self.counts['misses'] += 1
+            else:
+                self.entries.move_to_end(key)
+            return response
+
+    def put(self, key, response):
+        """Cache a successful response, reading its body"""
+
+        if response.status_code != 200:
+            return
+        # Read the body before the connection is released, so the cached
+        # response can be reused without it
+        _ = response.content
+        with self.lock:
+            self.entries[key] = response
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counts['evictions'] += 1
+
+    def should_revalidate(self, response):
+        return self.revalidate and 'ETag' in response.headers
+
+    def conditional_headers(self, response):
+        """Headers of the request revalidating a cached response"""
+
+        if not self.should_revalidate(response):
+            return None
+        return {'If-None-Match': response.headers['ETag']}
+
+    def reuse(self, response, revalidated=False):
+        """Copy a cached response for a caller, keeping its decoded body
+
+        :param revalidated: the server confirmed the response is current
+        """
+
+        with self.lock:
+            self.counts['revalidated' if revalidated else 'hits'] += 1
+        reused = copy.copy(response)
+        if hasattr(response, 'json_content'):
+            reused.json_content = response.json_content
+        reused.from_cache = True
+        return reused
+
+    def summary(self):
+        """Human readable summary of the cache"""
+
+        counts = self.counts
+        return (f'Response cache: {counts["hits"]} hit(s), '
+                f'{counts["revalidated"]} revalidated with 304 Not '
+                f'Modified, {counts["misses"]} miss(es), '
+                f'{counts["evictions"]} eviction(s)')
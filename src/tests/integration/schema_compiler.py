@@ -0,0 +1,227 @@
+"""Compile OpenAPI component schemas into reusable validator objects"""
+import copy
+import logging
+
+from deepmerge import always_merger
+
+import format_validators
+
+
+# Mapping of OpenAPI data types and python data types
+TYPES_DICT = {
+    'string': str,
+    'integer': int,
+    'int32': int,
+    'int64': int,
+    'float': (float, int),
+    'double': (float, int),
+    'number': (float, int),
+    'boolean': bool,
+    'array': list,
+    'object': dict
+}
+
+# Component schemas that describe error objects rather than resources
+ERROR_SCHEMAS = ('ErrorObject',)
+
+
+class CompiledAttribute:
+    """A fully resolved attribute of a schema"""
+
+    __slots__ = ('name', 'python_type', 'pattern', 'formatting', 'items')
+
+    def __init__(self, name, python_type, pattern=None, formatting=None,
+                 items=None):
+        self.name = name
+        self.python_type = python_type
+        # Compiled regular expression of the pattern
+        self.pattern = pattern
+        self.formatting = formatting
+        # Compiled item attributes if the attribute is an array of objects
+        self.items = items
+
+
+class CompiledSchema:
+    """A flattened validator of a component schema
+
+    :param name: name of the component schema
+    :param resource_type: expected resource type, None for error objects
+    :param attributes: dict of attribute names and compiled attributes
+    :param nullable_fields: set of paths of nullable attributes, e.g.
+                            'name', 'address.city' or 'phones[].number'
+    """
+
+    __slots__ = ('name', 'resource_type', 'attributes', 'nullable_fields')
+
+    def __init__(self, name, resource_type, attributes,
+                 nullable_fields=frozenset()):
+        self.name = name
+        self.resource_type = resource_type
+        self.attributes = attributes
+        self.nullable_fields = nullable_fields
+
+
+class SchemaCompiler:
+    """Resolve references of an OpenAPI specification into compiled
+    schemas"""
+
+    def __init__(self, openapi, registry=format_validators.registry):
+        self.openapi = openapi
+        self.registry = registry
+        self.compiled = {}
+        # Resolved references and their types, which are looked up for
+        # every attribute referring to them
+        self.references = {}
+        self.reference_types = {}
+
+    def compile_all(self):
+        """Compile every resource and error component schema"""
+
+        for name, component in self.openapi['components']['schemas'].items():
+            properties = component.get('properties', {})
+            if 'attributes' in properties or name in ERROR_SCHEMAS:
+                self.compile(name)
+        return self.compiled
+
+    def compile(self, name):
+        """Compile a component schema by name, reusing prior results"""
+
+        if name not in self.compiled:
+            component = self.openapi['components']['schemas'][name]
+            properties = component['properties']
+            if 'attributes' in properties:
+                resource_type = self.resolve(properties['type'])['enum'][0]
+                attributes = self.resolve(properties['attributes'])[
+                    'properties'
+                ]
+            else:
+                resource_type = None
+                attributes = properties
+            self.compiled[name] = CompiledSchema(
+                name,
+                resource_type,
+                self.__compile_attributes(attributes),
+                frozenset(self.__nullable_paths(attributes))
+            )
+        return self.compiled[name]
+
+    def __nullable_paths(self, attributes, prefix=''):
+        """Yield the paths of nullable attributes, including the attributes
+        of nested objects and array items"""
+
+        for name, attribute in attributes.items():
+            attribute = self.resolve(attribute)
+            path = f'{prefix}{name}'
+            if attribute.get('nullable'):
+                yield path
+            if 'properties' in attribute:
+                yield from self.__nullable_paths(attribute['properties'],
+                                                 f'{path}.')
+            elif attribute.get('type') == 'array' and 'items' in attribute:
+                items = self.resolve(attribute['items'])
+                if 'properties' in items:
+                    yield from self.__nullable_paths(items['properties'],
+                                                     f'{path}[].')
+
+    def __locate_reference(self, reference):
+        """Return a copy of the object a $ref string points to"""
+
+        located = self.openapi
+        for key in reference.split('#/', 1)[1].split('/'):
+            located = located[key]
+        return copy.deepcopy(located)
+
+    def resolve(self, schema):
+        """Resolve $ref and merge allOf of a schema"""
+
+        if 'allOf' in schema:
+            merged = copy.deepcopy(self.resolve(schema['allOf'][0]))
+            for sub_schema in schema['allOf'][1:]:
+                # Resolved references are shared, never merge them in place
+                always_merger.merge(merged,
+                                    copy.deepcopy(self.resolve(sub_schema)))
+            return merged
+        if '$ref' in schema:
+            reference = schema['$ref']
+            if reference not in self.references:
+                self.references[reference] = self.resolve(
+                    self.__locate_reference(reference)
+                )
+            return self.references[reference]
+        return schema
+
+    def __get_reference_type(self, reference, visited=None):
+        """Get the OpenAPI type of a referenced object"""
+
+        if visited is None:
+            if reference not in self.reference_types:
+                self.reference_types[reference] = self.__get_reference_type(
+                    reference, set()
+                )
+            return self.reference_types[reference]
+        visited.add(reference)
+        located = self.__locate_reference(reference)
+
+        if 'format' in located and located['format'] in TYPES_DICT:
+            return located['format']
+        if 'type' in located:
+            return located['type']
+        # Avoid infinite recursion
+        if '$ref' in located and located['$ref'] not in visited:
+            return self.__get_reference_type(located['$ref'], visited)
+        return None
+
+    def __get_attribute_type(self, attribute):
+        """Map between OpenAPI data types and python data types"""
+
+        if 'properties' in attribute:
+            return dict
+        openapi_type = None
+        if 'format' in attribute and attribute['format'] in TYPES_DICT:
+            openapi_type = attribute['format']
+        elif 'type' in attribute:
+            openapi_type = attribute['type']
+        elif '$ref' in attribute:
+            openapi_type = self.__get_reference_type(attribute['$ref'])
+
+        if not openapi_type:
+            return None
+        return TYPES_DICT[openapi_type]
+
+    def __compile_attributes(self, attributes):
+        """Compile a dict of OpenAPI properties"""
+
+        compiled = {}
+        for name, attribute in attributes.items():
+            python_type = self.__get_attribute_type(attribute)
+            if python_type is None:
+                logging.warning(f"OpenAPI property '{name}' contains no type "
+                                'or properties')
+
+            items = None
+            if python_type is list:
+                item_schema = self.resolve(attribute['items'])
+                if 'properties' in item_schema:
+                    items = self.__compile_attributes(
+                        item_schema['properties']
+                    )
+
+            pattern = attribute.get('pattern')
+            compiled[name] = CompiledAttribute(
+                name,
+                python_type,
+                pattern=pattern and self.registry.compile(pattern),
+                formatting=attribute.get('format'),
+                items=items
+            )
+        return compiled
+
+
+def compile_schemas(openapi):
+    """Compile the resource and error schemas of an OpenAPI specification
+
+    :param openapi: parsed OpenAPI specification
+    :returns: A dict of component names and compiled schemas
+    """
+
+    return SchemaCompiler(openapi).compile_all()
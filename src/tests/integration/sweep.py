@@ -0,0 +1,278 @@
+"""Sweep the person endpoints over a file of OSU IDs with checkpoints"""
+from collections import Counter
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor, wait
+import json
+import logging
+import os
+import sys
+import time
+
+import requests
+
+
+# Person endpoints which can be swept, their path suffix, resource and
+# maximum response time. Images have no resource, they are streamed.
+ENDPOINTS = {
+    'persons': ('', 'PersonResource', 5),
+    'jobs': ('/jobs', 'JobResource', 11),
+    'meal-plans': ('/meal-plans', 'MealPlanResource', 5),
+    'addresses': ('/addresses', 'AddressResource', 5),
+    'phones': ('/phones', 'PhoneResource', 5),
+    'emails': ('/emails', 'EmailResource', 5),
+    'medical': ('/medical', 'MedicalResource', 5),
+    'images': ('/images', None, 5)
+}
+
+
+class TokenExpired(Exception):
+    """The API rejected the credentials of the session"""
+
+
+def read_ids(path):
+    """Lazily read OSU IDs from a file, one per line. Blank lines and lines
+    starting with # are skipped.
+
+    :param path: path of the file, - for standard input
+    :returns: A generator of line indexes and IDs
+    """
+
+    ids_file = sys.stdin if path == '-' else open(path)
+    try:
+        for index, line in enumerate(ids_file):
+            osu_id = line.strip()
+            if osu_id and not osu_id.startswith('#'):
+                yield index, osu_id
+    finally:
+        if ids_file is not sys.stdin:
+            ids_file.close()
+
+
+class Checkpoint:
+    """Progress of a sweep whose IDs complete out of order. IDs before
+    position are all complete, completed holds the ones after it.
+
+    :param path: path of the checkpoint file, loaded if it exists
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.position = 0
+        self.completed = set()
+        self.counts = Counter()
+
+        if path and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                saved = json.load(checkpoint_file)
+            self.position = saved['position']
+            self.completed = set(saved['completed'])
+            self.counts.update(saved['counts'])
+
+    def is_done(self, index):
+        return index < self.position or index in self.completed
+
+    def mark_done(self, index):
+        self.completed.add(index)
+        while self.position in self.completed:
+            self.completed.remove(self.position)
+            self.position += 1
+
+    def save(self):
+        """Atomically replace the checkpoint file, through a temporary file
+        of this process"""
+
+        if not self.path:
+            return
+        temporary_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as checkpoint_file:
+            json.dump({
+                'position': self.position,
+                'completed': sorted(self.completed),
+                'counts': self.counts
+            }, checkpoint_file)
+        os.replace(temporary_path, self.path)
+
+
+class Sweep:
+    """Check the person endpoints of every ID of a source, keeping a bounded
+    number of IDs in flight
+
+    :param checker: UtilsTestCase instance used to check endpoints
+    :param ids: iterable of line indexes and IDs, e.g. read_ids()
+    :param checkpoint: Checkpoint of the sweep, IDs it marks done are skipped
+    :param failures_file: file to append failures to as JSON lines
+    :param endpoints: names of ENDPOINTS to check for each ID
+    :param workers: number of IDs checked concurrently
+    :param checkpoint_every: IDs to complete between checkpoint saves
+    """
+
+    def __init__(self, checker, ids, checkpoint, failures_file,
+                 endpoints=tuple(ENDPOINTS), workers=1,
+                 checkpoint_every=100):
+        self.checker = checker
+        self.ids = ids
+        self.checkpoint = checkpoint
+        self.failures_file = failures_file
+        self.endpoints = [ENDPOINTS[name] for name in endpoints]
+        self.workers = workers
+        self.checkpoint_every = checkpoint_every
+        self.nullable_fields = {
+            resource: checker.get_nullable_fields(resource)
+            for _, resource, _ in self.endpoints if resource
+        }
+        self.stopped = False
+        self.since_checkpoint = 0
+        self.swept = 0
+
+    def check_person(self, osu_id):
+        """Check the endpoints of a person
+
+        :returns: A list of failures
+        :raises TokenExpired: if a request was still rejected as
+                              unauthorized after it was retried with a new
+                              token, the person must be checked again
+        """
+
+        failures = []
+        for suffix, resource, max_elapsed_seconds in self.endpoints:
+            endpoint = f'/persons/{osu_id}{suffix}'
+            try:
+                if resource is None:
+                    self.checker.check_image(
+                        endpoint, max_elapsed_seconds=max_elapsed_seconds
+                    )
+                else:
+                    self.checker.check_endpoint(
+                        endpoint,
+                        resource,
+                        200,
+                        nullable_fields=self.nullable_fields[resource],
+                        max_elapsed_seconds=max_elapsed_seconds
+                    )
+            except (
+                self.checker.failureException,
+                requests.exceptions.RequestException
+            ) as error:
+                response = getattr(error, 'response', None)
+                if response is not None and response.status_code == 401:
+                    raise TokenExpired(endpoint)
+                failures.append({
+                    'osu_id': osu_id,
+                    'endpoint': endpoint,
+                    'error': str(error)
+                })
+        return failures
+
+    def __collect(self, pending, return_when):
+        """Wait for in-flight IDs and record their results"""
+
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            index, osu_id = pending.pop(future)
+            if future.cancelled():
+                continue
+            try:
+                failures = future.result()
+            except TokenExpired as error:
+                if not self.stopped:
+                    logging.error(f'Unauthorized response from {error}, '
+                                  'stopping the sweep')
+                self.stopped = True
+                continue
+
+            for failure in failures:
+                self.failures_file.write(f'{json.dumps(failure)}\n')
+            self.checkpoint.counts['checked'] += 1
+            self.checkpoint.counts['failed'] += bool(failures)
+            self.checkpoint.mark_done(index)
+            self.swept += 1
+            self.since_checkpoint += 1
+            if self.since_checkpoint >= self.checkpoint_every:
+                self.save()
+
+    def save(self):
+        self.failures_file.flush()
+        self.checkpoint.save()
+        self.since_checkpoint = 0
+
+    def run(self):
+        """Run the sweep until the IDs are exhausted, the credentials are
+        rejected or it is interrupted, saving a checkpoint in any case
+
+        :returns: Whether every ID was checked
+        """
+
+        max_in_flight = self.workers * 2
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                for index, osu_id in self.ids:
+                    if self.stopped:
+                        break
+                    if self.checkpoint.is_done(index):
+                        continue
+                    while len(pending) >= max_in_flight:
+                        self.__collect(pending, FIRST_COMPLETED)
+                    future = executor.submit(self.check_person, osu_id)
+                    pending[future] = (index, osu_id)
+                else:
+                    self.__collect(pending, ALL_COMPLETED)
+            except KeyboardInterrupt:
+                logging.error('Interrupted, stopping the sweep')
+                self.stopped = True
+            finally:
+                for future in pending:
+                    future.cancel()
+                if pending:
+                    self.__collect(pending, ALL_COMPLETED)
+                self.save()
+        return not self.stopped
+
+    def summary(self):
+        counts = self.checkpoint.counts
+        return (f'Swept {self.swept} person(s) in this run, '
+                f'{counts["checked"]} in total, {counts["failed"]} with '
+                'failures')
+
+
+def run_sweep(checker, ids_path, checkpoint_path=None, failures_path=None):
+    """Run a sweep from the sweep section of the configuration file of a
+    checker. Paths given as arguments override the configured ones.
+
+    :returns: Whether every ID was checked without failures
+    """
+
+    sweep_config = checker.config.get('sweep', {})
+    checkpoint_path = checkpoint_path or sweep_config.get(
+        'checkpoint_path', 'sweep-checkpoint.json'
+    )
+    failures_path = failures_path or sweep_config.get(
+        'failures_path', 'sweep-failures.jsonl'
+    )
+
+    checkpoint = Checkpoint(checkpoint_path)
+    if checkpoint.position or checkpoint.completed:
+        logging.info(f'Resuming sweep from {checkpoint_path}, '
+                     f'{checkpoint.counts["checked"]} person(s) already '
+                     'checked')
+
+    started = time.monotonic()
+    with open(failures_path, 'a') as failures_file:
+        sweep = Sweep(checker,
+                      read_ids(ids_path),
+                      checkpoint,
+                      failures_file,
+                      endpoints=sweep_config.get('endpoints', ENDPOINTS),
+                      workers=checker.workers,
+                      checkpoint_every=sweep_config.get('checkpoint_every',
+                                                        100))
+        completed = sweep.run()
+
+    elapsed = time.monotonic() - started
+    print(f'{sweep.summary()} ({sweep.swept / max(elapsed, 1e-9):.1f}/s)')
+    if not completed:
+        logging.error(f'Sweep stopped early, rerun with the same IDs and '
+                      f'checkpoint {checkpoint_path} to resume')
+    elif sweep.checkpoint.counts['failed']:
+        logging.error(f'Failures written to {failures_path}')
+    return completed and not sweep.checkpoint.counts['failed']
@@ -0,0 +1,38 @@
+"""Tests of the arrival schedules"""
+import unittest
+
+import arrivals
+
+
+class BuildPhasesTests(unittest.TestCase):
+    """Test cases of arrivals.build_phases"""
+
+    def test_phases(self):
+        """Configured phases keep their rate unless they ramp"""
+
+        phases = arrivals.build_phases({'phases': [
+            {'name': 'ramp-up', 'duration_seconds': 2, 'rate': 0,
+             'end_rate': 10},
+            {'duration_seconds': 3, 'rate': 10}
+        ]})
+        self.assertEqual(phases, [
+            arrivals.Phase('ramp-up', 2, 0, 10),
+            arrivals.Phase('phase 2', 3, 10, 10)
+        ])
+
+    def test_invalid_phases(self):
+        """Phases without a positive duration or a rate of at least 0 are
+        rejected"""
+
+        for phase in ({'duration_seconds': 0, 'rate': 5},
+                      {'rate': 5},
+                      {'duration_seconds': 5},
+                      {'duration_seconds': 5, 'rate': -1},
+                      {'duration_seconds': 5, 'rate': 5, 'end_rate': -1}):
+            with self.subTest(phase=phase):
+                with self.assertRaises(ValueError):
+                    arrivals.build_phases({'phases': [phase]})
+
+
+if __name__ == '__main__':
+    unittest.main()
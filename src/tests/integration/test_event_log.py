@@ -0,0 +1,53 @@
+"""Tests of the event log"""
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+import event_log
+import profiler
+
+
+class EventLogTests(unittest.TestCase):
+    """Test cases of event_log.EventLog"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'events.jsonl')
+
+    def test_writer_thread_is_idle(self):
+        """The waiting writer thread is not sampled as harness time"""
+
+        log = event_log.EventLog(self.path)
+        self.addCleanup(log.close)
+        sampler = profiler.SamplingProfiler()
+        # Wait for the writer to block on the empty queue
+        time.sleep(0.05)
+        sampler.sample(sys._current_frames()[log.thread.ident], 1)
+        self.assertEqual(sampler.samples, 0)
+
+    def test_emit(self):
+        """Events are appended with their validation outcome"""
+
+        log = event_log.EventLog(self.path, shard=1)
+        log.emit({'status': 200, 'validation': None}, validated=True)
+        log.emit({'status': 200, 'validation': None}, validated=True,
+                 error='bad')
+        log.close()
+
+        with open(self.path) as events_file:
+            events = [json.loads(line) for line in events_file]
+        self.assertEqual(
+            events,
+            [{'status': 200, 'validation': 'passed', 'shard': 1},
+             {'status': 200, 'validation': 'failed', 'error': 'bad',
+              'shard': 1}]
+        )
+        self.assertEqual(log.count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Tests of the HTTP/2 transport adapter"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import importlib.util
+import threading
+import unittest
+
+import requests
+
+import http2_adapter
+
+
+BODY = b'{"data": []}' * 1000
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipUnless(importlib.util.find_spec('httpx'),
+                     'HTTP/2 requires httpx')
+class HTTP2AdapterTests(unittest.TestCase):
+    """Test cases of http2_adapter.HTTP2Adapter"""
+
+    def setUp(self):
+        server = ThreadingHTTPServer(('localhost', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f'http://localhost:{server.server_port}/persons'
+        self.session = requests.Session()
+        self.session.mount('http://', http2_adapter.HTTP2Adapter())
+        self.addCleanup(self.session.close)
+
+    def test_streamed_body(self):
+        """Streamed bodies are read as they are consumed"""
+
+        response = self.session.get(self.url, stream=True)
+        self.assertFalse(response._content_consumed)
+        self.assertEqual(response.raw.tell(), 0)
+        chunks = list(response.iter_content(chunk_size=1024))
+        self.assertEqual(b''.join(chunks), BODY)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(response.raw.tell(), len(BODY))
+        self.assertTrue(response.raw.httpx_response.is_closed)
+
+    def test_closed_streamed_body(self):
+        """Closing an unread streamed response closes the httpx response"""
+
+        response = self.session.get(self.url, stream=True)
+        response.close()
+        self.assertTrue(response.raw.httpx_response.is_closed)
+
+    def test_body(self):
+        """Bodies of other requests are read up front"""
+
+        response = self.session.get(self.url)
+        self.assertTrue(response._content_consumed)
+        self.assertEqual(response.content, BODY)
+
+
+if __name__ == '__main__':
+    unittest.main()
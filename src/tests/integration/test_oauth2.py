@@ -0,0 +1,74 @@
+"""Tests of the OAuth2 tokens"""
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import oauth2
+
+
+class TokenHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = json.dumps({'access_token': 'token',
+                           'expires_in': 3600}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def fetch_tokens(token_api_url, cache_path, count):
+    """Fetch tokens in a worker process, refreshing and caching each one"""
+
+    manager = oauth2.TokenManager(token_api_url, 'id', 'secret',
+                                  cache_path=cache_path,
+                                  refresh_margin=7200)
+    for _ in range(count):
+        manager.token()
+
+
+class TokenManagerTests(unittest.TestCase):
+    """Test cases of oauth2.TokenManager"""
+
+    def setUp(self):
+        server = ThreadingHTTPServer(('localhost', 0), TokenHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.token_api_url = f'http://localhost:{server.server_port}/token'
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.cache_path = os.path.join(directory.name, 'token.json')
+
+    def test_processes_share_cache(self):
+        """Processes refreshing the token concurrently keep the cache
+        whole"""
+
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            futures = [
+                executor.submit(fetch_tokens, self.token_api_url,
+                                self.cache_path, 25)
+                for _ in range(4)
+            ]
+            for future in futures:
+                future.result()
+
+        with open(self.cache_path) as cache_file:
+            cache = json.load(cache_file)
+        self.assertEqual(
+            cache[f'id@{self.token_api_url}']['access_token'], 'token'
+        )
+        self.assertEqual(os.listdir(self.directory), ['token.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+"""Tests of the person profile benchmark"""
+import unittest
+
+import person_profile
+
+
+class ProfileStatsTests(unittest.TestCase):
+    """Test cases of person_profile.ProfileStats"""
+
+    def test_validation_is_not_latency(self):
+        """Validation time is reported apart from the network latency"""
+
+        stats = person_profile.ProfileStats()
+        stats.record(0.5, {'persons': 0.1, 'jobs': 0.2},
+                     {'persons': 0.1, 'jobs': 0.2})
+        self.assertAlmostEqual(stats.network.max, 0.2, places=2)
+        self.assertAlmostEqual(stats.profiles.max, 0.5, places=2)
+        self.assertAlmostEqual(stats.validation.max, 0.3, places=2)
+        self.assertAlmostEqual(stats.endpoints['jobs'].max, 0.2, places=2)
+        self.assertEqual(stats.critical['jobs'], 1)
+        report = stats.format_report()
+        self.assertIn('network p50', report)
+        self.assertIn('With validation', report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""Tests of the response cache"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import unittest
+
+import requests
+
+import response_cache
+
+
+BODY = json.dumps({'data': {'id': '1', 'type': 'person'}}).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.send_header('ETag', '"1"')
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class ResponseCacheTests(unittest.TestCase):
+    """Test cases of response_cache.ResponseCache"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('localhost', 0), Handler)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://localhost:{self.server.server_port}/persons/1'
+
+    def test_reuse_streamed_response(self):
+        """A cached streamed response is reused after its connection and
+        the server are gone"""
+
+        cache = response_cache.ResponseCache()
+        key = cache.key(self.url)
+        with requests.Session() as session:
+            response = session.get(self.url, stream=True)
+            cache.put(key, response)
+            response.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+        reused = cache.reuse(cache.get(key))
+        self.assertTrue(reused.from_cache)
+        self.assertEqual(reused.content, BODY)
+        self.assertEqual(reused.json(), json.loads(BODY))
+        self.assertEqual(cache.counts['hits'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Tests of the sweep"""
+import io
+import unittest
+
+import requests
+
+import sweep
+
+
+class StubChecker:
+    """Checker whose endpoints return the given status codes, after a
+    request rejected with 401 and retried with a new token"""
+
+    failureException = AssertionError
+
+    def __init__(self, status_codes):
+        self.status_codes = status_codes
+
+    def get_nullable_fields(self, resource):
+        return []
+
+    def check_endpoint(self, endpoint, resource, response_code, **kwargs):
+        rejected = requests.Response()
+        rejected.status_code = 401
+        response = requests.Response()
+        response.status_code = self.status_codes.get(endpoint, 200)
+        response.history.append(rejected)
+        if response.status_code != response_code:
+            error = self.failureException(f'{response.status_code} != '
+                                          f'{response_code}')
+            error.response = response
+            raise error
+
+
+class SweepTests(unittest.TestCase):
+    """Test cases of sweep.Sweep"""
+
+    def sweep(self, status_codes):
+        return sweep.Sweep(StubChecker(status_codes), [],
+                           sweep.Checkpoint(None), io.StringIO(),
+                           endpoints=['persons', 'jobs'])
+
+    def test_unauthorized(self):
+        """A request still unauthorized after its retry stops the person"""
+
+        with self.assertRaises(sweep.TokenExpired):
+            self.sweep({'/persons/1/jobs': 401}).check_person('1')
+
+    def test_failure_after_retried_request(self):
+        """Failures of retried requests are failures of the person"""
+
+        person_sweep = self.sweep({'/persons/2': 404})
+        self.assertEqual(person_sweep.check_person('1'), [])
+        failures = person_sweep.check_person('2')
+        self.assertEqual([failure['endpoint'] for failure in failures],
+                         ['/persons/2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
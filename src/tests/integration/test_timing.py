@@ -0,0 +1,53 @@
+"""Tests of the request timings"""
+import unittest
+
+import timing
+
+
+def recorder(latencies):
+    """TimingRecorder of a list of templates, query parameters and their
+    total latencies"""
+
+    timings = timing.TimingRecorder()
+    for template, params, seconds in latencies:
+        for value in seconds:
+            timings.record(template, params, {'total': value})
+    return timings
+
+
+class BaselineComparisonTests(unittest.TestCase):
+    """Test cases of timing.BaselineComparison"""
+
+    def setUp(self):
+        # Few requests per set of parameters, as in an ordinary run
+        self.baseline = recorder([
+            ('/persons/{osuId}/jobs', None, [0.1] * 10),
+            ('/persons/{osuId}/jobs', {'filter[suffix]': 'S0'}, [0.1] * 10)
+        ])
+        self.current = recorder([
+            ('/persons/{osuId}/jobs', None, [0.5] * 10),
+            ('/persons/{osuId}/jobs', {'filter[suffix]': 'S0'}, [0.5] * 10)
+        ])
+
+    def test_group_by_template(self):
+        """Parameters of a template are compared together"""
+
+        comparison = timing.BaselineComparison(min_samples=20)
+        compared, skipped = comparison.compare(self.current, self.baseline)
+        self.assertEqual(skipped, [])
+        self.assertEqual(len(compared), 1)
+        self.assertEqual(compared[0]['template'], '/persons/{osuId}/jobs')
+        self.assertEqual(compared[0]['regressions'], ['p50', 'p95'])
+
+    def test_group_by_params(self):
+        """Sets of parameters without enough samples are skipped"""
+
+        comparison = timing.BaselineComparison(min_samples=20,
+                                               group_by='params')
+        compared, skipped = comparison.compare(self.current, self.baseline)
+        self.assertEqual(compared, [])
+        self.assertEqual(len(skipped), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+"""Tests of the shared test case helpers"""
+import unittest
+
+import utils
+
+
+class ShardTests(unittest.TestCase):
+    """Test cases of utils.UtilsTestCase.shard"""
+
+    def keyed_cases(self):
+        return [
+            (('check_endpoint', f'/persons/{osu_id}/jobs', 'JobResource', 200,
+              (('filter[suffix]', suffix),)), {'osu_id': osu_id})
+            for osu_id in range(10) for suffix in ('S0', 'S1', 'S2')
+        ]
+
+    def test_shards_partition_cases(self):
+        """Every case is in exactly one shard, whatever was sharded before
+        by each process"""
+
+        keyed_cases = self.keyed_cases()
+        sharded = []
+        for shard_index in range(3):
+            test_case = utils.UtilsTestCase()
+            test_case.shard_index = shard_index
+            test_case.shard_count = 3
+            # Earlier batches, such as ones cut short by a failure
+            for _ in range(shard_index):
+                test_case.shard(keyed_cases[:2])
+            sharded.extend(test_case.shard(keyed_cases))
+        self.assertCountEqual(sharded, keyed_cases)
+
+    def test_single_shard(self):
+        """Every case is checked when tests are not sharded"""
+
+        keyed_cases = self.keyed_cases()
+        self.assertEqual(utils.UtilsTestCase().shard(iter(keyed_cases)),
+                         keyed_cases)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,450 @@
+"""Request timing collection and latency reports"""
+from collections import Counter, defaultdict
+import math
+import re
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+PHASES = ('total', 'connect', 'tls', 'server_wait', 'download')
+# How BaselineComparison groups the timings it compares
+GROUPS = ('template', 'params')
+
+# Phases of the request currently being sent by each thread
+_current = threading.local()
+
+
+def start_phases():
+    """Start collecting connection phases for the current thread"""
+
+    _current.phases = {}
+
+
+def collect_phases():
+    """Return and reset connection phases collected by the current thread"""
+
+    phases = getattr(_current, 'phases', {})
+    _current.phases = {}
+    return phases
+
+
+def _add_phase(name, seconds):
+    phases = getattr(_current, 'phases', None)
+    if phases is not None:
+        phases[name] = phases.get(name, 0) + seconds
+
+
+class ConnectionStats:
+    """Thread-safe counts of requests, new connections, TLS handshakes and
+    connections discarded because their pool was full"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def add(self, name, count=1):
+        with self.lock:
+            self.counts[name] += count
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+    def merge(self, other):
+        with self.lock:
+            self.counts.update(other.counts)
+
+    def to_dict(self):
+        with self.lock:
+            counts = dict(self.counts)
+        requests = counts.get('requests', 0)
+        connections = counts.get('connections', 0)
+        return {
+            'requests': requests,
+            'connections': connections,
+            'tls_handshakes': counts.get('tls_handshakes', 0),
+            'reused': max(requests - connections, 0),
+            'discarded': counts.get('discarded', 0)
+        }
+
+    def summary(self):
+        stats = self.to_dict()
+        reuse = (
+            f'{stats["reused"] / stats["requests"]:.0%}'
+            if stats['requests'] else '-'
+        )
+        return (f'Connections: {stats["requests"]} request(s) over '
+                f'{stats["connections"]} new connection(s) with '
+                f'{stats["tls_handshakes"]} TLS handshake(s), {reuse} reused, '
+                f'{stats["discarded"]} discarded because the pool was full')
+
+
+# Connection counts of every TimedHTTPAdapter of the process
+connection_stats = ConnectionStats()
+
+
+class TimedHTTPConnection(HTTPConnection):
+    """HTTP connection which times the connect phase. DNS lookup is included
+    in the connect phase"""
+
+    def _new_conn(self):
+        start = time.perf_counter()
+        conn = super()._new_conn()
+        _add_phase('connect', time.perf_counter() - start)
+        connection_stats.add('connections')
+        return conn
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    """HTTPS connection which times the connect and TLS handshake phases"""
+
+    def _new_conn(self):
+        start = time.perf_counter()
+        conn = super()._new_conn()
+        self._connect_seconds = time.perf_counter() - start
+        _add_phase('connect', self._connect_seconds)
+        connection_stats.add('connections')
+        return conn
+
+    def connect(self):
+        self._connect_seconds = 0
+        start = time.perf_counter()
+        super().connect()
+        elapsed = time.perf_counter() - start
+        _add_phase('tls', elapsed - self._connect_seconds)
+        connection_stats.add('tls_handshakes')
+
+
+class CountedPoolMixin:
+    """Count connections a pool closes instead of keeping them alive"""
+
+    def _put_conn(self, conn):
+        if conn is not None and self.pool is not None and self.pool.full():
+            connection_stats.add('discarded')
+        super()._put_conn(conn)
+
+
+class TimedHTTPConnectionPool(CountedPoolMixin, HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(CountedPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """Transport adapter whose connections record their connect and TLS
+    phases and count towards connection_stats"""
+
+    def send(self, request, **kwargs):
+        connection_stats.add('requests')
+        return super().send(request, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool
+        }
+
+
+def response_phases(response, total, connection_phases):
+    """Break the total time of a request into phases
+
+    :param response: response object, read in full
+    :param total: seconds between sending the request and reading the body
+    :param connection_phases: phases collected by collect_phases()
+    :returns: A dict of phase names and seconds
+    """
+
+    elapsed = response.elapsed.total_seconds()
+    phases = {'total': total, **connection_phases}
+    # requests measures elapsed up to the response headers, which includes
+    # setting up a new connection
+    phases['server_wait'] = max(
+        elapsed - phases.get('connect', 0) - phases.get('tls', 0), 0
+    )
+    phases['download'] = max(total - elapsed, 0)
+    return phases
+
+
+class LatencyHistogram:
+    """Mergeable histogram of latencies in seconds. Bucket bounds grow by 5%
+    from 100 microseconds, so percentiles are accurate to within 5%."""
+
+    BASE = 1e-4
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        index = max(math.ceil(math.log(max(value, self.BASE) / self.BASE,
+                                       self.GROWTH)), 0)
+        self.buckets[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Add the samples of another histogram to this one"""
+
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.sum += other.sum
+        for attribute, pick in (('min', min), ('max', max)):
+            values = [
+                value for value in (getattr(self, attribute),
+                                    getattr(other, attribute))
+                if value is not None
+            ]
+            setattr(self, attribute, pick(values) if values else None)
+
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def percentile(self, percent):
+        """Estimate a percentile from the bucket bounds"""
+
+        if not self.count:
+            return None
+        rank = max(math.ceil(percent / 100 * self.count), 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                upper_bound = self.BASE * self.GROWTH ** index
+                return min(max(upper_bound, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.mean(),
+            'min': self.min,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
+
+    def to_dict(self):
+        return {
+            **self.summary(),
+            'sum': self.sum,
+            'buckets': {str(index): count
+                        for index, count in sorted(self.buckets.items())}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.buckets = Counter({
+            int(index): count for index, count in data['buckets'].items()
+        })
+        histogram.count = data['count']
+        histogram.sum = data['sum']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+
+class RouteMatcher:
+    """Map requested endpoints to the path templates of an OpenAPI
+    specification"""
+
+    def __init__(self, paths):
+        self.routes = []
+        for template in paths:
+            pattern = re.sub(r'\\{[^/]+?\\}', '[^/]*', re.escape(template))
+            self.routes.append((re.compile(f'^{pattern}$'), template))
+        # Prefer literal segments, e.g. /persons/{osuId} over /{path}
+        self.routes.sort(key=lambda route: route[1].count('{'))
+
+    def template(self, endpoint):
+        """Get the path template of an endpoint, or the endpoint itself if
+        no template matches"""
+
+        path = endpoint.split('?', 1)[0]
+        for pattern, template in self.routes:
+            if pattern.match(path):
+                return template
+        return path
+
+
+class TimingRecorder:
+    """Thread-safe collection of per-endpoint latency histograms keyed by
+    route template and query parameter names"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = defaultdict(lambda: defaultdict(LatencyHistogram))
+
+    @staticmethod
+    def params_key(params):
+        return ','.join(sorted(params)) if params else ''
+
+    def record(self, template, params, phases):
+        key = (template, self.params_key(params))
+        with self.lock:
+            for phase, seconds in phases.items():
+                self.histograms[key][phase].add(seconds)
+
+    def merge(self, other):
+        with self.lock:
+            for key, phases in other.histograms.items():
+                for phase, histogram in phases.items():
+                    self.histograms[key][phase].merge(histogram)
+
+    def to_dict(self):
+        """Machine-readable timing report"""
+
+        report = defaultdict(dict)
+        with self.lock:
+            for (template, params), phases in sorted(self.histograms.items()):
+                report[template][params] = {
+                    phase: phases[phase].to_dict()
+                    for phase in PHASES if phase in phases
+                }
+        return dict(report)
+
+    @classmethod
+    def from_dict(cls, report):
+        recorder = cls()
+        for template, endpoints in report.items():
+            for params, phases in endpoints.items():
+                for phase, data in phases.items():
+                    recorder.histograms[(template, params)][phase] = (
+                        LatencyHistogram.from_dict(data)
+                    )
+        return recorder
+
+    def format_summary(self):
+        """Human readable summary table of the recorded timings"""
+
+        def __format(value):
+            return '-' if value is None else f'{value:.3f}'
+
+        header = (f'{"route":<42} {"params":<30} {"reqs":>6} {"p50":>7} '
+                  f'{"p90":>7} {"p99":>7} {"max":>7} {"connect":>7} '
+                  f'{"tls":>7} {"server":>7} {"dl":>7}')
+        lines = [header, '-' * len(header)]
+        with self.lock:
+            for (template, params), phases in sorted(self.histograms.items()):
+                total = phases['total']
+                means = [
+                    phases[phase].mean() if phase in phases else None
+                    for phase in PHASES[1:]
+                ]
+                lines.append(
+                    f'{template:<42} {params or "-":<30} {total.count:>6} '
+                    f'{__format(total.percentile(50)):>7} '
+                    f'{__format(total.percentile(90)):>7} '
+                    f'{__format(total.percentile(99)):>7} '
+                    f'{__format(total.max):>7} '
+                    + ' '.join(f'{__format(mean):>7}' for mean in means)
+                )
+        return '\n'.join(lines)
+
+
+class BaselineComparison:
+    """Compare the latencies of a run against a baseline timing report
+
+    :param tolerance: allowed relative slowdown, e.g. 0.2 for 20%
+    :param min_samples: minimum samples in both runs for an endpoint to be
+                        compared
+    :param min_delta: minimum absolute slowdown in seconds to count as a
+                      regression, to ignore noise on very fast endpoints
+    :param percentiles: percentiles of the total phase to compare
+    :param group_by: 'template' compares each route template across its
+                     query parameters, so an ordinary run has enough
+                     samples, 'params' compares each set of parameter
+                     names of a template separately
+    """
+
+    def __init__(self, tolerance=0.2, min_samples=20, min_delta=0.05,
+                 percentiles=(50, 95), group_by='template'):
+        if group_by not in GROUPS:
+            raise ValueError(f'Unknown group_by {group_by!r}, expected one '
+                             f'of {GROUPS}')
+        self.tolerance = tolerance
+        self.min_samples = min_samples
+        self.min_delta = min_delta
+        self.percentiles = percentiles
+        self.group_by = group_by
+
+    def totals(self, recorder):
+        """Histograms of the total phase of a TimingRecorder by compared
+        key, parameters are '*' when grouped by template"""
+
+        totals = defaultdict(LatencyHistogram)
+        with recorder.lock:
+            for (template, params), phases in recorder.histograms.items():
+                if self.group_by == 'template':
+                    params = '*'
+                totals[(template, params)].merge(phases['total'])
+        return totals
+
+    def compare(self, current, baseline):
+        """Compare two TimingRecorders
+
+        :returns: A tuple of compared endpoints and endpoints skipped for
+                  lack of samples. Compared endpoints are dicts including a
+                  list of regressed percentiles.
+        """
+
+        compared = []
+        skipped = []
+        baseline_totals = self.totals(baseline)
+        for key, current_total in sorted(self.totals(current).items()):
+            if key not in baseline_totals:
+                continue
+            baseline_total = baseline_totals[key]
+            if min(current_total.count, baseline_total.count) \
+                    < self.min_samples:
+                skipped.append(key)
+                continue
+
+            result = {'template': key[0], 'params': key[1], 'regressions': []}
+            for percent in self.percentiles:
+                current_value = current_total.percentile(percent)
+                baseline_value = baseline_total.percentile(percent)
+                result[f'p{percent}'] = (baseline_value, current_value)
+                if (
+                    current_value > baseline_value * (1 + self.tolerance)
+                    and current_value - baseline_value > self.min_delta
+                ):
+                    result['regressions'].append(f'p{percent}')
+            compared.append(result)
+        return compared, skipped
+
+    def format_results(self, compared, skipped):
+        """Human readable comparison table"""
+
+        lines = []
+        for result in compared:
+            values = ', '.join(
+                f'p{percent} {result[f"p{percent}"][0]:.3f}s -> '
+                f'{result[f"p{percent}"][1]:.3f}s'
+                for percent in self.percentiles
+            )
+            status = (
+                f'REGRESSED ({", ".join(result["regressions"])})'
+                if result['regressions'] else 'ok'
+            )
+            lines.append(f'{result["template"]} '
+                         f'[{result["params"] or "-"}]: {values} {status}')
+        for template, params in skipped:
+            lines.append(f'{template} [{params or "-"}]: skipped, fewer than '
+                         f'{self.min_samples} samples')
+        return '\n'.join(lines)
@@ -1,16 +1,33 @@
 """Utility class and functions for integration testing"""
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import functools
 import json
 import logging
 import re
 import sys
 import textwrap
+import time
 import urllib
 import unittest
+import zlib
 
-from deepmerge import always_merger
 import requests
-import validators
+from urllib3.util.retry import Retry
+
+import arrivals
+import event_log
+import format_validators
+import http2_adapter
+import image_check
+import json_stream
+import oauth2
+import query_matrix
+import response_cache
+import schema_compiler
+import timing
+import validation_policy
 
 
 def parse_arguments():
@@ -32,6 +49,153 @@ def parse_arguments():
         dest='debug',
         help='Enable debug logging mode',
         action='store_true')
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        type=int,
+        help='Number of concurrent requests (overrides configuration file)')
+    parser.add_argument(
+        '--processes',
+        dest='processes',
+        type=int,
+        help='Number of processes to shard the tests across (overrides '
+             'configuration file)')
+    parser.add_argument(
+        '--validation-policy',
+        dest='validation_policy',
+        choices=validation_policy.POLICIES,
+        help='Which records of collections to validate (overrides '
+             'configuration file)')
+    parser.add_argument(
+        '--query-matrix',
+        dest='matrix_mode',
+        choices=query_matrix.MODES,
+        help='Request query parameters alone, pairwise or in every '
+             'combination (overrides configuration file)')
+    parser.add_argument(
+        '--response-cache',
+        dest='cache_mode',
+        choices=response_cache.MODES,
+        help='Reuse responses to repeated requests (warm) or request every '
+             'check (cold) (overrides configuration file)')
+    parser.add_argument(
+        '--load',
+        dest='load',
+        help='Run a load test instead of the integration tests',
+        action='store_true')
+    parser.add_argument(
+        '--duration',
+        dest='duration',
+        type=float,
+        help='Load test, write benchmark, replay or filter fuzzing duration '
+             'in seconds (overrides configuration file)')
+    parser.add_argument(
+        '--concurrency',
+        dest='concurrency',
+        type=int,
+        help='Load test or write benchmark concurrency (overrides '
+             'configuration file)')
+    parser.add_argument(
+        '--rate',
+        dest='rate',
+        type=float,
+        help='Load test target requests per second, or write benchmark '
+             'iterations per second (overrides configuration file)')
+    parser.add_argument(
+        '--open-loop',
+        dest='open_loop',
+        help='Send load test requests on the arrival schedule of the '
+             'configured phases instead of from concurrent workers',
+        action='store_true')
+    parser.add_argument(
+        '--arrival',
+        dest='arrival',
+        choices=arrivals.ARRIVALS,
+        help='Arrival process of open-loop load tests (overrides '
+             'configuration file)')
+    parser.add_argument(
+        '--ids',
+        dest='ids_path',
+        help='Sweep the person endpoints over a file of OSU IDs, one per '
+             'line (- for standard input), instead of running the '
+             'integration tests')
+    parser.add_argument(
+        '--checkpoint',
+        dest='checkpoint_path',
+        help='Path of the sweep checkpoint, an interrupted sweep resumes from '
+             'it (overrides configuration file)')
+    parser.add_argument(
+        '--failures',
+        dest='failures_path',
+        help='Path of the JSON lines file sweep failures are appended to '
+             '(overrides configuration file)')
+    parser.add_argument(
+        '--write-benchmark',
+        dest='write_benchmark',
+        help='Benchmark the POST and PATCH endpoints instead of running the '
+             'integration tests',
+        action='store_true')
+    parser.add_argument(
+        '--person-profile',
+        dest='person_profile',
+        help='Benchmark fetching the full profile of each valid person '
+             'instead of running the integration tests',
+        action='store_true')
+    parser.add_argument(
+        '--person-profile-rounds',
+        dest='person_profile_rounds',
+        type=int,
+        help='Profile fetches per person of the person profile benchmark '
+             '(overrides configuration file)')
+    parser.add_argument(
+        '--replay',
+        dest='replay_path',
+        help='Replay the GET requests of an access log (- for standard '
+             'input) instead of running the integration tests')
+    parser.add_argument(
+        '--speed',
+        dest='speed',
+        type=float,
+        help='Factor the recorded pace of a replay is accelerated by '
+             '(overrides configuration file)')
+    parser.add_argument(
+        '--fuzz-filters',
+        dest='fuzz_filters',
+        help='Check the filter parameters with valid and invalid values '
+             'derived from the OpenAPI specification instead of running the '
+             'integration tests',
+        action='store_true')
+    parser.add_argument(
+        '--fuzz-seed',
+        dest='fuzz_seed',
+        type=int,
+        help='Seed of the fuzzed filter values (overrides configuration '
+             'file)')
+    parser.add_argument(
+        '--profile',
+        dest='profile_path',
+        help='Profile the harness and write the samples as collapsed stacks '
+             'to this path')
+    parser.add_argument(
+        '--profile-interval',
+        dest='profile_interval',
+        type=float,
+        default=0.005,
+        help='Seconds between profiler samples (default: 0.005)')
+    parser.add_argument(
+        '--event-log',
+        dest='event_log_path',
+        help='Path of a JSON lines file every request is appended to '
+             '(overrides configuration file)')
+    parser.add_argument(
+        '--timing-report',
+        dest='timing_report_path',
+        help='Path to write a JSON report of per-endpoint request timings')
+    parser.add_argument(
+        '--baseline',
+        dest='baseline_path',
+        help='Path to a timing report to compare the latencies of this run '
+             'against')
     arguments, unittest_args = parser.parse_known_args()
     return arguments, sys.argv[:1] + unittest_args
 
@@ -43,89 +207,169 @@ def setup_base_url(config):
     return api['local_base_url'] if config['local_test'] else api['base_url']
 
 
-def setup_session(config):
-    """Setup request session from configuration file"""
+def setup_workers(config, workers=None):
+    """Setup number of concurrent request workers from configuration file"""
+
+    if workers is None:
+        workers = config.get('concurrency', {}).get('workers', 1)
+    return max(workers, 1)
+
+
+def setup_retries(retries_config):
+    """Setup urllib3 retries of failed requests from the retries section of
+    the configuration file. No request is retried by default."""
+
+    return Retry(
+        total=retries_config.get('total', 0),
+        backoff_factor=retries_config.get('backoff_factor', 0),
+        status_forcelist=retries_config.get('status_forcelist', []),
+        raise_on_status=False
+    )
+
+
+def setup_session(config, pool_maxsize=None):
+    """Setup request session from configuration file
+
+    :param pool_maxsize: connections to keep alive per host, the configured
+                         pool_maxsize takes precedence (default: None,
+                         requests' default pool size)
+    """
+
+    session_config = config.get('session', {})
+    # Keep one pooled connection per concurrent worker
+    pool_maxsize = (
+        session_config.get('pool_maxsize') or pool_maxsize
+        or requests.adapters.DEFAULT_POOLSIZE
+    )
+    keep_alive = session_config.get('keep_alive', True)
+    verify = session_config.get('verify', not config['local_test'])
 
     session = requests.Session()
+    session.verify = verify
+    if session_config.get('http2'):
+        try:
+            adapter = http2_adapter.HTTP2Adapter(
+                verify=verify,
+                max_connections=pool_maxsize,
+                keep_alive=keep_alive
+            )
+        except ImportError as error:
+            sys.exit(f'Error: {error}')
+    else:
+        adapter = timing.TimedHTTPAdapter(
+            pool_connections=session_config.get(
+                'pool_connections', requests.adapters.DEFAULT_POOLSIZE
+            ),
+            pool_maxsize=pool_maxsize,
+            pool_block=session_config.get('pool_block', False),
+            max_retries=setup_retries(session_config.get('retries', {}))
+        )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
 
     if config['local_test']:
         basic_auth = config['auth']['basic_auth']
         session.auth = (basic_auth['username'], basic_auth['password'])
-        session.verify = False
     else:
-        oauth2 = config['auth']['oauth2']
-        data = {
-            'client_id': oauth2['client_id'],
-            'client_secret': oauth2['client_secret'],
-            'grant_type': 'client_credentials'
-        }
+        oauth2_config = config['auth']['oauth2']
+        manager = oauth2.TokenManager(
+            oauth2_config['token_api_url'],
+            oauth2_config['client_id'],
+            oauth2_config['client_secret'],
+            cache_path=oauth2_config.get('token_cache_path'),
+            refresh_margin=oauth2_config.get('refresh_margin_seconds', 60)
+        )
         try:
-            res = requests.post(url=oauth2['token_api_url'], data=data)
-            token = res.json()['access_token']
-        except KeyError:
+            manager.token()
+        except oauth2.TokenError:
             sys.exit('Error: invalid OAuth2 credentials')
-        session.headers = {'Authorization': f'Bearer {token}'}
+        session.auth = oauth2.OAuth2Auth(manager)
 
     return session
 
 
+# Port and /api path prefix which local instances leave out of self links
+LOCAL_PREFIX_PATTERN = re.compile(r':\d{4}/api')
+DOCKER_HOST_PATTERN = re.compile(r'host\.docker\.internal')
+
+
+@functools.lru_cache(maxsize=None)
+def link_base_url(base_url, local_test):
+    """Get the parsed base URL self links are expected to start with"""
+
+    if local_test:
+        base_url = LOCAL_PREFIX_PATTERN.sub('', base_url)
+    base_url = DOCKER_HOST_PATTERN.sub('localhost', base_url)
+    return urllib.parse.urlparse(base_url)
+
+
+def decode_json(response):
+    """Decode a response body, reusing the result of earlier calls"""
+
+    if not hasattr(response, 'json_content'):
+        response.json_content = response.json()
+    return response.json_content
+
+
+class LazyJsonDump:
+    """Pretty-print a response body only when a log message is emitted"""
+
+    def __init__(self, response):
+        self.response = response
+
+    def __str__(self):
+        try:
+            return json.dumps(decode_json(self.response), indent=4)
+        except ValueError:
+            return self.response.text
+
+
 class UtilsTestCase(unittest.TestCase):
     """TestCase subclass that includes utility methods for integration
     testing"""
 
     base_url = None
     session = None
+    config = {}
     openapi = {}
+    schemas = {}
     local_test = None
+    stream_responses = False
+    validation = validation_policy.ValidationPolicy()
+    matrix = query_matrix.QueryMatrix()
+    check_cache = None
+    response_cache = None
+    workers = 1
+    shard_index = 0
+    shard_count = 1
+    routes = None
+    timings = None
+    image_stats = None
+    event_log = None
 
     def get_nullable_fields(self, resource):
-        """Parse openapi for nullable fields"""
-
-        resource_schema = self.openapi['components']['schemas'][resource]
+        """Get the paths of the nullable attributes of a resource, e.g.
+        'name' or 'phones[].number'"""
 
-        if 'allOf' in resource_schema['properties']['attributes']:
-            resource_schema['properties']['attributes'] = self.__merge_allOf(
-                resource_schema['properties']['attributes']['allOf']
-            )
-        if '$ref' in resource_schema['properties']['attributes']:
-            resolved_reference = self.__resolve_reference(
-                resource_schema['properties']['attributes']
-            )
-            resource_schema['properties']['attributes'] = resolved_reference
-
-        attributes = resource_schema['properties']['attributes']['properties']
-        nullable_fields = []
-        self.get_nested_nullable_fields(attributes, nullable_fields)
-
-        return nullable_fields
-
-    def get_nested_nullable_fields(self, attributes, nullable_fields):
-        for attribute in attributes:
-            if 'type' in attributes[attribute]:
-                if attributes[attribute]['type'] == 'object':
-                    self.get_nested_nullable_fields(
-                        attributes[attribute]['properties'],
-                        nullable_fields
-                    )
-                elif attributes[attribute]['type'] == 'array':
-                    self.get_nested_nullable_fields(
-                        attributes[attribute]['items']['properties'],
-                        nullable_fields
-                    )
-            if (
-                'nullable' in attributes[attribute]
-                and attributes[attribute]['nullable']
-            ):
-                nullable_fields.append(attribute)
+        return self.get_compiled_schema(resource).nullable_fields
 
     def get_json_content(self, response):
         """Get response content in JSON format"""
 
         try:
-            return response.json()
+            return decode_json(response)
         except json.decoder.JSONDecodeError:
             self.fail('Response not in JSON format')
 
+    def get_route_template(self, endpoint):
+        """Get the OpenAPI path template of an endpoint"""
+
+        return endpoint if self.routes is None else self.routes.template(
+            endpoint
+        )
+
     def get_resource_schema(self, resource):
         """Get resource schema from OpenAPI specification"""
 
@@ -133,7 +377,9 @@ class UtilsTestCase(unittest.TestCase):
 
     def make_request(self, endpoint, expected_status_code,
                      params=None,
-                     max_elapsed_seconds=5):
+                     max_elapsed_seconds=5,
+                     stream=False,
+                     validated=False):
         """Helper function to make a web request and lightly validate the
         response
 
@@ -141,197 +387,269 @@ class UtilsTestCase(unittest.TestCase):
         :param expected_status_code: expected HTTP status code
         :param params: key-value pairs parameters (default: None)
         :param max_elapsed_seconds: maximum elapsed times (default: 5)
+        :param stream: leave the body unread, the caller must call
+                       response.finish_timing() once it has read the body.
+                       response.request_started is the perf_counter time the
+                       request was sent at (default: False)
+        :param validated: the caller validates the response and logs the
+                          outcome with log_event, otherwise the request is
+                          logged as it returns (default: False)
         :returns: A response object contains a server’s response to an HTTP
                   request
         """
 
         requested_url = f'{self.base_url}{endpoint}'
-        response = self.session.get(requested_url, params=params)
-        logging.debug(f'Sent request to {requested_url}, params = {params}')
+        cache = self.response_cache
+        cached = None
+        if cache is not None:
+            key = cache.key(requested_url, params)
+            cached = cache.get(key)
+
+        streamed = stream and cache is None
+        start = time.perf_counter()
+        if cached is not None and not cache.should_revalidate(cached):
+            response = cache.reuse(cached)
+        else:
+            headers = None
+            if cached is not None:
+                headers = cache.conditional_headers(cached)
+            timing.start_phases()
+            response = self.session.get(requested_url, params=params,
+                                        headers=headers,
+                                        stream=streamed)
+            connection_phases = timing.collect_phases()
+            if cached is not None and response.status_code == 304:
+                response = cache.reuse(cached, revalidated=True)
+            elif cache is not None:
+                cache.put(key, response)
+
+        def finish_timing(log=True):
+            # Latencies of cached responses would flatter the API
+            template = self.get_route_template(endpoint)
+            phases = None
+            if not getattr(response, 'from_cache', False):
+                phases = timing.response_phases(response,
+                                                time.perf_counter() - start,
+                                                connection_phases)
+                if self.timings is not None:
+                    self.timings.record(template, params, phases)
+            if self.event_log is not None:
+                response.event = event_log.request_event(
+                    'GET', template, endpoint, params, response, phases,
+                    event_log.body_size(response, streamed)
+                )
+                if log and stream and not validated:
+                    self.log_event(response)
+
+        if stream:
+            response.finish_timing = finish_timing
+            response.request_started = start
+        else:
+            finish_timing()
+
+        logging.debug('Sent request to %s, params = %s', requested_url,
+                      params)
         status_code = response.status_code
-        response_code_details = textwrap.dedent(f'''
-            Expected {expected_status_code}, recieved {status_code}
-            Response body:''')
-        response_body = json.dumps(response.json(), indent=4)
-        logging.debug(f'{response_code_details}\n{response_body})')
-        self.assertEqual(
-            status_code,
-            expected_status_code,
-            f'requested_url: {requested_url}, params: {params},\n'
-            f'response_body: {response_body}'
-        )
+        try:
+            if status_code != expected_status_code:
+                self.fail(f'{status_code} != {expected_status_code} : '
+                          f'requested_url: {requested_url}, '
+                          f'params: {params},\n'
+                          f'response_body: {LazyJsonDump(response)}')
+            if not stream:
+                logging.debug('Expected %s, recieved %s\nResponse body:\n%s',
+                              expected_status_code, status_code,
+                              LazyJsonDump(response))
+
+            # Response time should less then max_elapsed_seconds
+            elapsed_seconds = response.elapsed.total_seconds()
+            logging.debug('Request took %s second(s)', elapsed_seconds)
+            self.assertLess(elapsed_seconds, max_elapsed_seconds)
+        except self.failureException as error:
+            if stream:
+                response.finish_timing(log=False)
+                # Release the connection of the unread body to the pool
+                response.close()
+            self.log_event(response, validated, error)
+            # The final response, e.g. after an OAuth2 retry, like the
+            # response of requests exceptions
+            error.response = response
+            raise
+
+        if not stream and not validated:
+            self.log_event(response)
+        return response
+
+    def log_event(self, response, validated=False, error=None):
+        """Append the request of a response to the event log, once
+
+        :param response: response returned by make_request
+        :param validated: whether the response was validated
+        :param error: validation error of the response, if it failed
+        """
 
-        # Response time should less then max_elapsed_seconds
-        elapsed_seconds = response.elapsed.total_seconds()
-        logging.debug(f'Request took {elapsed_seconds} second(s)')
-        self.assertLess(elapsed_seconds, max_elapsed_seconds)
+        event = getattr(response, 'event', None)
+        if event is not None:
+            response.event = None
+            self.event_log.emit(event, validated, error)
+
+    @contextlib.contextmanager
+    def logged_validation(self, response):
+        """Log the outcome of the validation of a response in the block"""
+
+        try:
+            yield
+        except self.failureException as error:
+            self.log_event(response, True, error)
+            raise
+        self.log_event(response, True)
+
+    def make_write_request(self, method, endpoint, body):
+        """Send a write request with a JSON body and record its timing under
+        the method and route template. The status code is left to the
+        caller to check.
+
+        :param method: HTTP method, e.g. 'POST' or 'PATCH'
+        :param endpoint: the endpoint to request
+        :param body: JSON serialisable request body
+        :returns: A response object
+        """
 
+        requested_url = f'{self.base_url}{endpoint}'
+        timing.start_phases()
+        start = time.perf_counter()
+        response = self.session.request(method, requested_url, json=body)
+        phases = timing.response_phases(response,
+                                        time.perf_counter() - start,
+                                        timing.collect_phases())
+        template = self.get_route_template(endpoint)
+        if self.timings is not None:
+            self.timings.record(f'{method} {template}', None, phases)
+        if self.event_log is not None:
+            self.event_log.emit(event_log.request_event(
+                method, template, endpoint, None, response, phases,
+                len(response.content)
+            ))
+        logging.debug('Sent %s request to %s, recieved %s', method,
+                      requested_url, response.status_code)
         return response
 
-    def __merge_allOf(self, schema):
-        """Helper function to merge allOf properties"""
+    def get_compiled_schema(self, resource):
+        """Get compiled resource schema, compiling it on first use"""
 
-        merged = self.__resolve_reference(schema[0])
-        for ref in schema[1:]:
-            always_merger.merge(merged, self.__resolve_reference(ref))
-        return merged
+        if resource not in self.schemas:
+            compiler = schema_compiler.SchemaCompiler(self.openapi)
+            self.schemas[resource] = compiler.compile(resource)
+        return self.schemas[resource]
 
-    def __resolve_reference(self, reference):
-        path = reference['$ref'].split('/')[1:]
-        return self.__locate_reference(self.openapi, path)
+    def __validate_format(self, attribute, formatting, pattern):
+        """Validates returned attributes using pattern or format. Pattern
+        validation overrides any format validation
 
-    def __locate_reference(self, openapi, path):
-        if len(path) == 1:
-            return openapi[path[0]]
-        else:
-            return self.__locate_reference(openapi[path[0]], path[1:])
+        :param pattern: compiled regular expression
+        """
 
-    def check_schema(self, response, schema, nullable_fields):
-        """Check the schema of response match OpenAPI specification"""
-
-        # Mapping of OpenAPI data types and python data types
-        types_dict = {
-            'string': str,
-            'integer': int,
-            'int32': int,
-            'int64': int,
-            'float': (float, int),
-            'double': (float, int),
-            'number': (float, int),
-            'boolean': bool,
-            'array': list,
-            'object': dict
-        }
-
-        def __get_schema_attributes():
-            """Helper function to get attributes of the schema"""
-
-            if 'allOf' in schema['attributes']:
-                schema['attributes'] = self.__merge_allOf(
-                    schema['attributes']['allOf']
-                )
-            elif '$ref' in schema['attributes']:
-                schema['attributes'] = self.__resolve_reference(
-                    schema['attributes']
-                )
-            return schema['attributes']['properties']
-
-        def __validate_format(attribute, formatting, pattern):
-            """Validates returned attributes using pattern or format. Pattern
-            validation overrides any format validation"""
-
-            if pattern is not None:
-                self.assertRegex(attribute, pattern)
-            elif formatting in ['uri', 'url']:
-                self.assertTrue(validators.url(attribute))
-            elif formatting == 'email':
-                self.assertTrue(validators.email(attribute))
-
-        def __get_attribute_type(attribute):
-            """Helper function to map between OpenAPI data types and python
-            data types"""
-
-            if 'properties' in attribute:
-                return dict
-            if 'format' in attribute and attribute['format'] in types_dict:
-                openapi_type = attribute['format']
-            elif 'type' in attribute:
-                openapi_type = attribute['type']
-            elif '$ref' in attribute:
-                openapi_type = __get_reference_type(attribute['$ref'])
-
-            if not openapi_type:
-                logging.warning('OpenAPI property contains no type or'
-                                'properties')
-                return None
-            return types_dict[openapi_type]
-
-        def __get_reference_type(object_path, root_object_paths=None):
-            """Helper function to get type of referenced object"""
-
-            keys = re.split('/', re.search('#/(.*)', object_path).group(1))
-            reference = self.openapi
-            for key in keys:
-                reference = reference[key]
-
-            if 'format' in reference and reference['format'] in types_dict:
-                return reference['format']
-            if 'type' in reference:
-                return reference['type']
-            if '$ref' in reference:
-                nested_reference = reference['$ref']
-                # Avoid infinite recursion
-                if not root_object_paths:
-                    root_object_paths = [object_path]
-                if nested_reference not in root_object_paths:
-                    root_object_paths.append(nested_reference)
-                    return __get_reference_type(nested_reference,
-                                                root_object_paths)
-
-            return None
-
-        def __check_resource_schema(resource):
-            """Helper function to check resource object schema"""
-
-            # Check resource type
-            if '$ref' in schema['type']:
-                schema['type'] = self.__resolve_reference(schema['type'])
-            self.assertEqual(resource['type'], schema['type']['enum'][0])
-            # Check resource attributes
-            actual_attributes = resource['attributes']
-            expected_attributes = __get_schema_attributes()
-            __check_attributes_schema(actual_attributes, expected_attributes)
-
-        def __check_error_schema(error):
-            """Helper function to check error object schema"""
-
-            # Check error attributes
-            actual_attributes = error
-            expected_attributes = schema
-            __check_attributes_schema(actual_attributes, expected_attributes)
-
-        def __check_attributes_schema(actual_attributes, expected_attributes):
-            """Helper function to check through all attributes"""
-
-            for field, actual_value in actual_attributes.items():
-                self.assertIn(
-                    field,
-                    expected_attributes.keys(),
-                    f"Unexpected field '{field}'"
-                )
-                expected_attribute = expected_attributes[field]
-                expected_type = __get_attribute_type(expected_attribute)
+        if pattern is not None:
+            self.assertRegex(attribute, pattern)
+        elif format_validators.registry.is_checked(formatting):
+            self.assertTrue(
+                format_validators.registry.check(formatting, attribute),
+                f'{attribute!r} is not a valid {formatting}'
+            )
 
-                # Check item schema if attribute is an array
-                if (
-                    expected_type is list
-                    and 'properties' in expected_attribute['items']
-                ):
-                    expected_item = (
-                        expected_attribute['items']['properties']
-                    )
-                    actual_items = actual_attributes[field]
+    def __check_attributes_schema(self, actual_attributes,
+                                  expected_attributes, nullable_fields,
+                                  context='', path=''):
+        """Helper function to check through all attributes
+
+        :param nullable_fields: set of paths of nullable attributes
+        :param context: name of the checked collection for the validation
+                        policy
+        :param path: path of the attributes within the resource
+        """
 
-                    for actual_item in actual_items:
-                        __check_attributes_schema(actual_item, expected_item)
+        for field, actual_value in actual_attributes.items():
+            self.assertIn(
+                field,
+                expected_attributes.keys(),
+                f"Unexpected field '{field}'"
+            )
+            expected_attribute = expected_attributes[field]
+            expected_type = expected_attribute.python_type
+            field_path = f'{path}{field}'
 
-                if (
-                    (actual_value and expected_type)
-                    or field not in nullable_fields
+            # Check item schema if attribute is an array
+            if (
+                expected_attribute.items is not None
+                and isinstance(actual_value, list)
+            ):
+                items_context = f'{context}.{field}'
+                for actual_item in self.validation.select(
+                    actual_value, items_context
                 ):
-                    self.assertIsInstance(actual_value, expected_type)
+                    self.__check_attributes_schema(actual_item,
+                                                   expected_attribute.items,
+                                                   nullable_fields,
+                                                   items_context,
+                                                   f'{field_path}[].')
+
+            if expected_type is None:
+                continue
+            if actual_value or field_path not in nullable_fields:
+                self.assertIsInstance(actual_value, expected_type)
+
+                # Validate attribute pattern and format
+                pattern = expected_attribute.pattern
+                formatting = expected_attribute.formatting
+                if pattern is not None or formatting is not None:
+                    self.__validate_format(actual_value, formatting, pattern)
+
+    def __check_resource_schema(self, resource, schema, nullable_fields):
+        """Helper function to check resource object schema"""
+
+        self.assertEqual(resource['type'], schema.resource_type)
+        self.__check_attributes_schema(resource['attributes'],
+                                       schema.attributes,
+                                       nullable_fields,
+                                       schema.name)
+
+    def check_schema_stream(self, response, schema, nullable_fields):
+        """Check the schema of a streamed successful response while its body
+        is read, without holding the whole body in memory
+
+        :returns: Top-level members of the response other than data
+        """
 
-                    # Get attribute pattern and format, then validate
-                    pattern = (
-                        None if 'pattern' not in expected_attribute
-                        else expected_attribute['pattern']
-                    )
-                    formatting = (
-                        None if 'format' not in expected_attribute
-                        else expected_attribute['format']
+        stream = json_stream.JsonStream(
+            response.iter_content(chunk_size=65536)
+        )
+        try:
+            for index, resource in enumerate(stream):
+                if (
+                    not stream.is_array
+                    or self.validation.should_validate(
+                        resource, index, schema.name
                     )
-                    if pattern is not None or formatting is not None:
-                        __validate_format(actual_value, formatting, pattern)
+                ):
+                    self.__check_resource_schema(resource, schema,
+                                                 nullable_fields)
+        except json.decoder.JSONDecodeError:
+            self.fail('Response not in JSON format')
+        except KeyError as error:
+            self.fail(error)
+        finally:
+            response.finish_timing()
+            response.close()
+        return stream.envelope
+
+    def check_schema(self, response, schema, nullable_fields):
+        """Check the schema of response match OpenAPI specification
+
+        :param response: response object to check
+        :param schema: compiled schema of the expected resource or error
+        :param nullable_fields: paths of attributes which are allowed to be
+                                null
+        """
 
         status_code = response.status_code
         content = self.get_json_content(response)
@@ -341,15 +659,20 @@ class UtilsTestCase(unittest.TestCase):
             if status_code == 200:
                 resource_data = content['data']
                 if isinstance(resource_data, list):
-                    for resource in resource_data:
-                        __check_resource_schema(resource)
+                    for resource in self.validation.select(
+                        resource_data, schema.name
+                    ):
+                        self.__check_resource_schema(resource, schema,
+                                                     nullable_fields)
                 else:
-                    __check_resource_schema(resource_data)
+                    self.__check_resource_schema(resource_data, schema,
+                                                 nullable_fields)
             elif status_code >= 400:
                 errors_data = content['errors']
                 self.assertIsInstance(errors_data, list)
                 for error in errors_data:
-                    __check_error_schema(error)
+                    self.__check_attributes_schema(error, schema.attributes,
+                                                   schema.nullable_fields)
         except KeyError as error:
             self.fail(error)
 
@@ -358,15 +681,8 @@ class UtilsTestCase(unittest.TestCase):
 
         query_params = {} if query_params is None else query_params
 
-        base_url = self.base_url
-        if self.local_test:
-            # Local instances return self links without port and /api
-            base_url = re.sub(r':\d{4}/api', '', self.base_url)
-
-        base_url = re.sub(r'host\.docker\.internal', 'localhost', base_url)
-
         link_url_obj = urllib.parse.urlparse(link_url)
-        base_url_obj = urllib.parse.urlparse(base_url)
+        base_url_obj = link_base_url(self.base_url, self.local_test)
 
         url_equalities = [
             [link_url_obj.scheme, base_url_obj.scheme, 'scheme'],
@@ -395,39 +711,162 @@ class UtilsTestCase(unittest.TestCase):
                        query_params=None, nullable_fields=None,
                        max_elapsed_seconds=5):
         """Check response of an endpoint for response code, schema, self
-        link"""
+        link. Successful responses are validated while they are streamed if
+        stream_responses is enabled."""
 
-        nullable_fields = [] if nullable_fields is None else nullable_fields
-        schema = self.get_resource_schema(resource)
+        schema = self.get_compiled_schema(resource)
+        if nullable_fields is None:
+            nullable_fields = schema.nullable_fields
+        stream = self.stream_responses and response_code == 200
         response = self.make_request(endpoint,
                                      response_code,
                                      params=query_params,
-                                     max_elapsed_seconds=max_elapsed_seconds)
-
-        self.check_schema(response, schema, nullable_fields)
-        response_json = response.json()
-        if 'links' in response_json:
-            self.check_url(response_json['links']['self'], endpoint,
-                           query_params)
+                                     max_elapsed_seconds=max_elapsed_seconds,
+                                     stream=stream,
+                                     validated=True)
+
+        with self.logged_validation(response):
+            if stream:
+                response_json = self.check_schema_stream(response, schema,
+                                                         nullable_fields)
+            else:
+                self.check_schema(response, schema, nullable_fields)
+                response_json = self.get_json_content(response)
+            if 'links' in response_json:
+                self.check_url(response_json['links']['self'], endpoint,
+                               query_params)
         return response
 
+    def check_image(self, endpoint, query_params=None, max_elapsed_seconds=5,
+                    chunk_size=65536):
+        """Stream an image and check its content type, dimensions and that
+        it is complete. Only the header of the image is kept in memory. The
+        time to first byte and transfer rate are recorded in image_stats.
+
+        :param endpoint: the endpoint to request
+        :param query_params: key-value pairs parameters, the image must be
+                             as wide as a requested width (default: None)
+        :param max_elapsed_seconds: maximum elapsed times (default: 5)
+        :param chunk_size: bytes read at a time (default: 65536)
+        :returns: A tuple of the width and height of the image
+        """
+
+        response = self.make_request(endpoint, 200,
+                                     params=query_params,
+                                     max_elapsed_seconds=max_elapsed_seconds,
+                                     stream=True,
+                                     validated=True)
+        with self.logged_validation(response):
+            try:
+                content_type = response.headers.get('Content-Type', '')
+                self.assertEqual(content_type.split(';')[0].strip(),
+                                 'image/jpeg',
+                                 f'Unexpected content type of {endpoint}')
+
+                probe = image_check.ImageProbe()
+                first_byte = None
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if first_byte is None:
+                        first_byte = time.perf_counter()
+                    probe.feed(chunk)
+                finished = time.perf_counter()
+                width, height = probe.finish()
+            except image_check.ImageError as error:
+                self.fail(f'Invalid image from {endpoint}, params: '
+                          f'{query_params}: {error}')
+            finally:
+                response.finish_timing()
+                response.close()
+
+            requested_width = (query_params or {}).get('width')
+            if requested_width is not None:
+                self.assertEqual(width, int(requested_width),
+                                 f'Image of {endpoint} not resized to the '
+                                 'requested width')
+            self.assertGreater(height, 0,
+                               f'Image of {endpoint} has no height')
+
+        if (
+            self.image_stats is not None
+            and not getattr(response, 'from_cache', False)
+        ):
+            ttfb = first_byte - response.request_started
+            rate = probe.size / max(finished - first_byte, 1e-6)
+            self.image_stats.record(requested_width, ttfb, rate, probe.size)
+        logging.debug('Image of %s is %sx%s, %s byte(s)', endpoint, width,
+                      height, probe.size)
+        return width, height
+
+    def shard(self, keyed_cases):
+        """Select the cases of this shard when tests are sharded across
+        processes. A case belongs to the shard of a stable hash of its key,
+        so every process agrees on it whatever checks ran or failed before.
+
+        :param keyed_cases: iterable of (key, case) tuples
+        """
+
+        if self.shard_count <= 1:
+            return list(keyed_cases)
+        return [
+            (key, case) for key, case in keyed_cases
+            if zlib.crc32(repr(key).encode()) % self.shard_count
+            == self.shard_index
+        ]
+
+    def check_endpoints(self, cases, check=None):
+        """Check a batch of endpoints, concurrently when more than one worker
+        is configured. Only the cases of this shard are checked. Identical
+        cases are checked once, and once per run with a check_cache.
+
+        :param cases: list of dicts of keyword arguments for check
+        :param check: method checking one case (default: check_endpoint)
+        """
+
+        check = check or self.check_endpoint
+        keyed_cases = {}
+        for case in cases:
+            key = (check.__name__, case['endpoint'], case.get('resource'),
+                   case.get('response_code'),
+                   query_matrix.canonical(case.get('query_params') or {}))
+            keyed_cases.setdefault(key, case)
+        keyed_cases = self.shard(keyed_cases.items())
+        cases = [case for _, case in keyed_cases]
+
+        def check_case(key, case):
+            if self.check_cache is None:
+                return check(**case)
+            return self.check_cache.run(key, check, **case)
+
+        if self.workers <= 1:
+            for key, case in keyed_cases:
+                check_case(key, case)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                executor.submit(check_case, key, case)
+                for key, case in keyed_cases
+            ]
+
+        # Report failures in order and attributed to the requested endpoint
+        for case, future in zip(cases, futures):
+            with self.subTest(endpoint=case['endpoint'],
+                              params=case.get('query_params')):
+                future.result()
+
     def check_query_params(self, endpoint, resource, nullable_fields,
                            query_params, osu_id):
-        for param in query_params:
-            for value in query_params[param]['valid']:
-                self.check_endpoint(
-                    endpoint,
-                    resource,
-                    200,
-                    nullable_fields=nullable_fields,
-                    query_params={param: value}
-                )
-            if 'invalid' in query_params[param]:
-                for value in query_params[param]['invalid']:
-                    self.check_endpoint(
-                        endpoint,
-                        'ErrorObject',
-                        400,
-                        nullable_fields=nullable_fields,
-                        query_params={param: value}
-                    )
+        """Check the values of query parameters, alone or combined as set by
+        the query matrix"""
+
+        cases = []
+        for params, response_code in self.matrix.expand(query_params):
+            cases.append({
+                'endpoint': endpoint,
+                'resource': (resource if response_code == 200
+                             else 'ErrorObject'),
+                'response_code': response_code,
+                'nullable_fields': nullable_fields,
+                'query_params': params
+            })
+        self.check_endpoints(cases)
@@ -0,0 +1,94 @@
+"""Policies deciding which records of a collection are validated"""
+from collections import Counter
+import random
+import threading
+
+
+POLICIES = ('full', 'first', 'sample', 'shape')
+
+
+def shape(value):
+    """Fingerprint of the keys and types of a value, ignoring its content"""
+
+    if isinstance(value, dict):
+        return tuple(sorted((key, shape(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return ('list', tuple(sorted(set(shape(item) for item in value),
+                                     key=repr)))
+    return type(value).__name__
+
+
+class ValidationPolicy:
+    """Decide which records of collections are validated and count the
+    skipped ones
+
+    :param policy: 'full' validates every record, 'first' the first first_n
+                   records of each collection, 'sample' a random
+                   sample_rate fraction of records and 'shape' one record
+                   of each distinct key and type signature
+    :param first_n: records validated per collection by the first policy
+    :param sample_rate: fraction of records validated by the sample policy
+    :param seed: seed of the sample policy
+    """
+
+    def __init__(self, policy='full', first_n=10, sample_rate=0.1, seed=0):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown validation policy {policy!r}, '
+                             f'expected one of {POLICIES}')
+        self.policy = policy
+        self.first_n = first_n
+        self.sample_rate = sample_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.seen_shapes = set()
+        self.counts = Counter()
+
+    @classmethod
+    def from_config(cls, config, policy=None):
+        """Create a policy from the validation section of the configuration
+        file. A policy argument overrides the configured one."""
+
+        validation = dict(config.get('validation', {}))
+        if policy is not None:
+            validation['policy'] = policy
+        return cls(**validation)
+
+    def should_validate(self, record, index, context):
+        """Whether the index-th record of a collection should be validated
+
+        :param record: the record
+        :param index: position of the record in its collection
+        :param context: name of the collection, records of different
+                        collections never share shapes
+        """
+
+        if self.policy == 'full':
+            selected = True
+        elif self.policy == 'first':
+            selected = index < self.first_n
+        elif self.policy == 'sample':
+            with self.lock:
+                selected = self.rng.random() < self.sample_rate
+        else:
+            fingerprint = (context, shape(record))
+            with self.lock:
+                selected = fingerprint not in self.seen_shapes
+                self.seen_shapes.add(fingerprint)
+
+        with self.lock:
+            self.counts['validated' if selected else 'skipped'] += 1
+        return selected
+
+    def select(self, records, context):
+        """Yield the records of a collection which should be validated"""
+
+        for index, record in enumerate(records):
+            if self.should_validate(record, index, context):
+                yield record
+
+    def summary(self):
+        with self.lock:
+            validated = self.counts['validated']
+            skipped = self.counts['skipped']
+        return (f'Validation policy {self.policy!r}: validated {validated} '
+                f'record(s), skipped {skipped}')
@@ -0,0 +1,317 @@
+"""Benchmark the write endpoints with request bodies generated from the
+OpenAPI specification"""
+import logging
+import random
+import sys
+import threading
+import time
+
+import requests
+
+import data_generator
+import load_test
+import utils
+
+
+# Write operations in the order of an iteration, their method, path and
+# request body schema
+OPERATIONS = {
+    'create_person': ('POST', '/persons', 'PersonPostBody'),
+    'create_ssn': ('POST', '/persons/{osuId}/ssn', 'SsnPostBody'),
+    'create_job': ('POST', '/persons/{osuId}/jobs', 'JobPostBody'),
+    'update_job': ('PATCH', '/persons/{osuId}/jobs/{jobId}', 'JobPatchBody')
+}
+# Change reason code the API requires to create a job, and refuses to
+# update one with
+HIRE_CHANGE_REASON = 'AAHIR'
+
+
+class BodyFactory:
+    """Generate valid request bodies of the write operations. Generation is
+    serialised, as the generator shares its random number generator.
+
+    :param openapi: parsed OpenAPI specification
+    :param seed: seed of the generated bodies (default: None, unseeded)
+    :param update_change_reason: change reason code of job updates
+                                 (default: None, generated)
+    """
+
+    def __init__(self, openapi, seed=None, update_change_reason=None):
+        self.generator = data_generator.DataGenerator(openapi,
+                                                      rng=random.Random(seed))
+        self.update_change_reason = update_change_reason
+        self.lock = threading.Lock()
+
+    def __generate(self, operation):
+        with self.lock:
+            return self.generator.component(OPERATIONS[operation][2])
+
+    def person(self):
+        return self.__generate('create_person')
+
+    def ssn(self):
+        return self.__generate('create_ssn')
+
+    def job(self):
+        body = self.__generate('create_job')
+        attributes = body['data']['attributes']
+        attributes['changeReason'] = {'code': HIRE_CHANGE_REASON}
+        return body
+
+    def job_update(self, job_id):
+        """Generate the body of an update of a job, which must name the job
+        in its ID, position number and suffix"""
+
+        body = self.__generate('update_job')
+        position_number, suffix = job_id.split('-', 1)
+        body['data']['id'] = job_id
+        attributes = body['data'].setdefault('attributes', {})
+        attributes['positionNumber'] = position_number
+        attributes['suffix'] = suffix
+        code = self.update_change_reason
+        while not code or code == HIRE_CHANGE_REASON:
+            code = self.generator.word(5).upper()
+        attributes['changeReason'] = {'code': code}
+        return body
+
+
+def body_job_id(body):
+    """ID of the job a job body creates or updates"""
+
+    attributes = body['data']['attributes']
+    return f'{attributes["positionNumber"]}-{attributes["suffix"]}'
+
+
+class WriteBenchmark:
+    """Send iterations of write operations at a controlled rate. Each
+    iteration creates a person and their SSN, then creates a job and
+    updates it, skipping the operations which are not enabled. Created and
+    updated records are read back until the API returns them, as writes are
+    only accepted and processed later by Banner.
+
+    :param checker: UtilsTestCase instance used to send and validate
+    :param bodies: BodyFactory of the request bodies
+    :param operations: names of OPERATIONS to send
+    :param osu_id: person whose jobs are written and whose SSN is written
+                   unless a person was created in the same iteration
+    :param job_id: job updated unless one was created in the same iteration
+    :param readback_timeout: seconds to wait for a write to be readable
+    :param readback_interval: seconds between read back attempts
+    """
+
+    def __init__(self, checker, bodies, operations=tuple(OPERATIONS),
+                 osu_id=None, job_id=None, readback_timeout=30,
+                 readback_interval=0.5):
+        unknown = set(operations) - set(OPERATIONS)
+        if unknown:
+            raise ValueError(f'Unknown write operations {sorted(unknown)}, '
+                             f'expected some of {list(OPERATIONS)}')
+        self.checker = checker
+        self.bodies = bodies
+        self.operations = operations
+        self.osu_id = osu_id
+        self.job_id = job_id
+        self.readback_timeout = readback_timeout
+        self.readback_interval = readback_interval
+        self.stats = load_test.LoadStats()
+        self.lock = threading.Lock()
+        self.next_send = None
+        self.deadline = None
+        self.interval = None
+
+    def __write(self, operation, endpoint, body, expected_status_code):
+        """Send a write and record its latency and status
+
+        :returns: The response, or None if the write was not accepted
+        """
+
+        start = time.monotonic()
+        try:
+            response = self.checker.make_write_request(
+                OPERATIONS[operation][0], endpoint, body
+            )
+            status = response.status_code
+        except requests.exceptions.RequestException as error:
+            response, status = None, type(error).__name__
+        self.stats.record(operation, status, time.monotonic() - start)
+        if status != expected_status_code:
+            if response is not None:
+                logging.debug('%s %s returned %s: %s', operation, endpoint,
+                              status, response.text)
+            return None
+        return response
+
+    def __read_back(self, operation, endpoint, resource, resource_id):
+        """Poll an endpoint until it returns the written record and check
+        it against the schema of its resource"""
+
+        start = time.monotonic()
+        deadline = start + self.readback_timeout
+        status = 'Timeout'
+        while time.monotonic() < deadline:
+            try:
+                response = self.checker.session.get(
+                    f'{self.checker.base_url}{endpoint}'
+                )
+            except requests.exceptions.RequestException as error:
+                status = type(error).__name__
+                break
+            if response.status_code == 200:
+                schema = self.checker.get_compiled_schema(resource)
+                try:
+                    self.checker.check_schema(response, schema,
+                                              schema.nullable_fields)
+                    returned_id = self.checker.get_json_content(
+                        response
+                    )['data']['id']
+                    status = 200
+                    if returned_id != resource_id:
+                        status = 'Mismatch'
+                except self.checker.failureException as error:
+                    logging.debug('%s read back invalid: %s', operation,
+                                  error)
+                    status = 'Invalid'
+                break
+            if response.status_code != 404:
+                status = response.status_code
+                break
+            time.sleep(self.readback_interval)
+        self.stats.record(f'{operation} read back', status,
+                          time.monotonic() - start)
+
+    def iteration(self):
+        """Send one iteration of the enabled write operations"""
+
+        osu_id = self.osu_id
+        if 'create_person' in self.operations:
+            response = self.__write('create_person', '/persons',
+                                    self.bodies.person(), 202)
+            if response is None:
+                return
+            osu_id = response.json()['data']['id']
+            self.__read_back('create_person', f'/persons/{osu_id}',
+                             'PersonResource', osu_id)
+
+        if 'create_ssn' in self.operations:
+            self.__write('create_ssn', f'/persons/{osu_id}/ssn',
+                         self.bodies.ssn(), 204)
+
+        job = self.job_id
+        if 'create_job' in self.operations:
+            body = self.bodies.job()
+            if self.__write('create_job', f'/persons/{self.osu_id}/jobs',
+                            body, 202):
+                job = body_job_id(body)
+                self.__read_back('create_job',
+                                 f'/persons/{self.osu_id}/jobs/{job}',
+                                 'JobResource', job)
+            else:
+                job = None
+
+        if 'update_job' in self.operations and job:
+            endpoint = f'/persons/{self.osu_id}/jobs/{job}'
+            if self.__write('update_job', endpoint,
+                            self.bodies.job_update(job), 202):
+                self.__read_back('update_job', endpoint, 'JobResource', job)
+
+    def __next_iteration(self):
+        """Get the time the next iteration is due to start"""
+
+        with self.lock:
+            if self.interval is None:
+                return time.monotonic()
+            send_at = self.next_send
+            self.next_send += self.interval
+            return send_at
+
+    def __worker(self):
+        while True:
+            send_at = self.__next_iteration()
+            if send_at >= self.deadline:
+                return
+            delay = send_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.iteration()
+
+    def run(self, duration, concurrency=1, rate=None):
+        """Start iterations for a fixed duration from concurrent workers
+
+        :param duration: seconds to start iterations for
+        :param concurrency: number of concurrent workers
+        :param rate: target iterations per second across all workers
+                     (default: None, as fast as the workers can go)
+        :returns: The load_test.LoadStats of the writes and read backs
+        """
+
+        logging.info(f'Running write benchmark of {", ".join(self.operations)}'
+                     f' for {duration} second(s) with {concurrency} '
+                     'worker(s)')
+        self.interval = 1 / rate if rate else None
+        self.stats.started = time.monotonic()
+        self.next_send = self.stats.started
+        self.deadline = self.stats.started + duration
+
+        workers = [
+            threading.Thread(target=self.__worker)
+            for _ in range(concurrency)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.stats.finished = time.monotonic()
+        return self.stats
+
+
+def run_write_benchmark(checker, duration=None, concurrency=None, rate=None):
+    """Run the write benchmark from the write_benchmark section of the
+    configuration file of a checker. Arguments override the configured
+    values. Writes create real records, so only local targets are written
+    to unless allow_remote is set.
+
+    :returns: Whether every write was accepted and read back
+    """
+
+    config = checker.config.get('write_benchmark', {})
+    if not checker.local_test and not config.get('allow_remote', False):
+        sys.exit('Error: the write benchmark creates records, set '
+                 'write_benchmark.allow_remote to run it against '
+                 f'{checker.base_url}')
+
+    operations = config.get('operations', list(OPERATIONS))
+    needs_person = {'create_job', 'update_job'} & set(operations) or (
+        'create_ssn' in operations and 'create_person' not in operations
+    )
+    if needs_person and not config.get('osu_id'):
+        sys.exit('Error: write_benchmark.osu_id is required to write jobs, '
+                 'and SSNs without creating people')
+    if (
+        'update_job' in operations and 'create_job' not in operations
+        and not config.get('job_id')
+    ):
+        sys.exit('Error: write_benchmark.job_id is required to update jobs '
+                 'without creating them')
+
+    concurrency = concurrency or config.get('concurrency', 1)
+    checker.session.close()
+    checker.session = utils.setup_session(checker.config,
+                                          pool_maxsize=concurrency)
+    benchmark = WriteBenchmark(
+        checker,
+        BodyFactory(checker.openapi, seed=config.get('seed'),
+                    update_change_reason=config.get('update_change_reason')),
+        operations=operations,
+        osu_id=config.get('osu_id'),
+        job_id=config.get('job_id'),
+        readback_timeout=config.get('readback_timeout_seconds', 30),
+        readback_interval=config.get('readback_interval_seconds', 0.5)
+    )
+    stats = benchmark.run(duration or config.get('duration_seconds', 60),
+                          concurrency=concurrency,
+                          rate=rate or config.get('rate'))
+
+    report = stats.report()
+    print(load_test.format_report(report))
+    return not any(stats['error_rates'] for stats in report.values())